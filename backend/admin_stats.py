@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+ADMIN_STATS_MONTHS = 24
+
+def admin_stats_pipeline() -> list:
+    return [
+        {"$project": {
+            "_id": 0,
+            "src": "user",
+            "subscription_status": 1,
+            "package": 1,
+            "month": {"$substrCP": ["$created_at", 0, 7]}
+        }},
+        {"$unionWith": {"coll": "payments", "pipeline": [{"$project": {
+            "_id": 0,
+            "src": "payment",
+            "status": 1,
+            "amount": {"$ifNull": ["$amount", 0]},
+            "month": {"$substrCP": ["$payment_date", 0, 7]}
+        }}]}},
+        {"$facet": {
+            "users": [
+                {"$match": {"src": "user"}},
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "active": {"$sum": {"$cond": [{"$eq": ["$subscription_status", "active"]}, 1, 0]}}
+                }}
+            ],
+            "packages": [
+                {"$match": {"src": "user"}},
+                {"$group": {"_id": "$package", "count": {"$sum": 1}}}
+            ],
+            "signups": [
+                {"$match": {"src": "user"}},
+                {"$group": {"_id": "$month", "count": {"$sum": 1}}},
+                {"$sort": {"_id": -1}},
+                {"$limit": ADMIN_STATS_MONTHS}
+            ],
+            "payments": [
+                {"$match": {"src": "payment"}},
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "revenue": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, "$amount", 0]}}
+                }}
+            ],
+            "revenue": [
+                {"$match": {"src": "payment", "status": "completed"}},
+                {"$group": {"_id": "$month", "revenue": {"$sum": "$amount"}, "payments": {"$sum": 1}}},
+                {"$sort": {"_id": -1}},
+                {"$limit": ADMIN_STATS_MONTHS}
+            ]
+        }}
+    ]
+
+async def compute_admin_stats(db, package_names: Iterable[str]) -> dict:
+    facets, total_properties = await asyncio.gather(
+        db.users.aggregate(admin_stats_pipeline()).to_list(1),
+        db.properties.estimated_document_count()
+    )
+    facets = facets[0] if facets else {}
+    users = (facets.get("users") or [{}])[0]
+    payments = (facets.get("payments") or [{}])[0]
+    packages = {p["_id"]: p["count"] for p in facets.get("packages", [])}
+    return {
+        "total_users": users.get("total", 0),
+        "active_users": users.get("active", 0),
+        "total_properties": total_properties,
+        "total_payments": payments.get("total", 0),
+        "total_revenue": payments.get("revenue", 0),
+        "package_distribution": {name: packages.get(name, 0) for name in package_names},
+        "monthly_revenue": [
+            {"month": r["_id"], "revenue": r["revenue"], "payments": r["payments"]}
+            for r in reversed(facets.get("revenue", []))
+        ],
+        "monthly_signups": [{"month": r["_id"], "count": r["count"]} for r in reversed(facets.get("signups", []))],
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+class AdminStatsSnapshot:
+    """Cached admin stats; invalidate() bumps a generation so a refresh already running cannot publish old numbers."""
+
+    def __init__(self, package_names: Iterable[str], ttl_seconds: float = 300):
+        self.package_names = list(package_names)
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[dict] = None
+        self._refreshed_at: Optional[float] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _fresh(self, max_age: float) -> bool:
+        if self._snapshot is None or self._refreshed_at is None:
+            return False
+        return time.monotonic() - self._refreshed_at < max_age
+
+    async def get(self, db) -> dict:
+        if self._fresh(self.ttl_seconds):
+            return self._snapshot
+        return await self.refresh(db, if_older_than=self.ttl_seconds)
+
+    async def refresh(self, db, if_older_than: float = 0) -> dict:
+        async with self._lock:
+            if self._fresh(if_older_than):
+                return self._snapshot
+            generation = self._generation
+            snapshot = await compute_admin_stats(db, self.package_names)
+            if generation == self._generation:
+                self._snapshot = snapshot
+                self._refreshed_at = time.monotonic()
+            # otherwise the data changed while computing; hand it to this caller only, the next read recomputes
+            return snapshot
+
+    def invalidate(self):
+        self._generation += 1
+        self._refreshed_at = None
+
+    def start(self, db):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db):
+        while True:
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                logging.error(f"Admin stats refresh failed: {e}")
+            await asyncio.sleep(self.ttl_seconds)
@@ -0,0 +1,502 @@
+import abc
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+
+TAG_TTL_SECONDS = 3600
+MEMORY_MAX_ENTRIES = 10000
+REDIS_POOL_SIZE = 10
+REDIS_TIMEOUT = 2.0
+REDIS_SCAN_COUNT = 500
+SINGLE_FLIGHT_LOCK_SECONDS = 10.0
+SINGLE_FLIGHT_WAIT_SECONDS = 2.0
+SINGLE_FLIGHT_POLL_SECONDS = 0.02
+
+# Compare-and-delete so a lock that expired and was taken over is not released by its old holder
+RELEASE_LOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+class CacheError(Exception):
+    pass
+
+class CacheBackend(abc.ABC):
+    """Key/value store shared by the principal cache, response cache, rate limits and single-flight locks.
+
+    Failures never propagate to requests: reads miss, rate limits let the
+    request through and locks are treated as acquired.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, *keys: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def invalidate_tags(self, *tags: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def clear(self) -> None:
+        """Drops every cached entry and tag; rate-limit counters and locks are kept."""
+
+    @abc.abstractmethod
+    async def incr(self, key: str, window: float) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def counter(self, key: str) -> int:
+        """Current value of an incr() counter, without counting as a cache hit or miss."""
+
+    @abc.abstractmethod
+    async def acquire_lock(self, key: str, token: str, ttl: float) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def release_lock(self, key: str, token: str) -> bool:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+    def _count(self, value) -> None:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "shared": self.shared,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "errors": self.errors
+        }
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[object, float]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        # reverse of _tags, so an entry leaving the cache also leaves its tag sets
+        self._key_tags: Dict[str, Set[str]] = {}
+
+    def _drop(self, key: str) -> bool:
+        found = self._entries.pop(key, None) is not None
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return found
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            self._drop(key)
+            return None
+        return entry[0]
+
+    def _put(self, key: str, value, ttl: float):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._live(key)
+        self._count(value)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        self._drop(key)
+        self._put(key, value, ttl)
+        if key not in self._entries:
+            return
+        tags = set(tags)
+        if tags:
+            self._key_tags[key] = tags
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._drop(key) for key in keys)
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        removed = 0
+        for tag in tags:
+            removed += await self.delete(*self._tags.get(tag, set()).copy())
+            self._tags.pop(tag, None)
+        return removed
+
+    async def clear(self) -> None:
+        # set() stores bytes; counters are ints and lock tokens are strings
+        for key in [key for key, (value, _) in self._entries.items() if isinstance(value, bytes)]:
+            self._drop(key)
+
+    async def incr(self, key: str, window: float) -> int:
+        value = (self._live(key) or 0) + 1
+        if value == 1:
+            self._put(key, value, window)
+        else:
+            self._entries[key] = (value, self._entries[key][1])
+        return value
+
+    async def counter(self, key: str) -> int:
+        return self._live(key) or 0
+
+    async def acquire_lock(self, key: str, token: str, ttl: float) -> bool:
+        if self._live(key) is not None:
+            return False
+        self._put(key, token, ttl)
+        return True
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        if self._live(key) != token:
+            return False
+        self._drop(key)
+        return True
+
+    def metrics(self) -> dict:
+        return {**super().metrics(), "entries": len(self._entries), "tags": len(self._tags)}
+
+def _encode_command(args: Tuple) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, (int, float)):
+            arg = str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+class RedisError(CacheError):
+    pass
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise CacheError("connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise CacheError(f"unexpected reply {line[:20]!r}")
+
+class RedisConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def pipeline(self, commands: List[Tuple]) -> List:
+        self.writer.write(b"".join(_encode_command(command) for command in commands))
+        await self.writer.drain()
+        return [await _read_reply(self.reader) for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+class RedisBackend(CacheBackend):
+    """Minimal RESP2 client speaking to Redis or anything wire-compatible (Valkey, KeyDB, Dragonfly)."""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "mekan360:", pool_size: int = REDIS_POOL_SIZE,
+                 timeout: float = REDIS_TIMEOUT):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._idle: List[RedisConnection] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _connect(self) -> RedisConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = RedisConnection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.database:
+            setup.append(("SELECT", self.database))
+        if setup:
+            for reply in await connection.pipeline(setup):
+                if isinstance(reply, RedisError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def pipeline(self, *commands: Tuple) -> List:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(connection.pipeline(list(commands)), self.timeout)
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def _safe(self, default, *commands: Tuple):
+        try:
+            return await self.pipeline(*commands)
+        except (OSError, asyncio.TimeoutError, CacheError) as e:
+            self.errors += 1
+            logging.warning(f"Cache backend error: {e}")
+            return default
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _entry(self, key: str) -> str:
+        # cached entries live under their own prefix so clear() can find them without touching counters or locks
+        return f"{self.prefix}c:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        replies = await self._safe([None], ("GET", self._entry(key)))
+        self._count(replies[0])
+        return replies[0]
+
+    async def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str] = ()) -> None:
+        full_key = self._entry(key)
+        commands = [("SET", full_key, value, "PX", int(ttl * 1000))]
+        for tag in tags:
+            commands.append(("SADD", self._tag(tag), full_key))
+            commands.append(("EXPIRE", self._tag(tag), TAG_TTL_SECONDS))
+        await self._safe(None, *commands)
+
+    async def delete(self, *keys: str) -> int:
+        if not keys:
+            return 0
+        replies = await self._safe([0], ("DEL", *(self._entry(key) for key in keys)))
+        return replies[0]
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        if not tags:
+            return 0
+        members = await self._safe([[] for _ in tags], *(("SMEMBERS", self._tag(tag)) for tag in tags))
+        keys = {key for reply in members for key in reply or []}
+        replies = await self._safe([0], ("DEL", *keys, *(self._tag(tag) for tag in tags)))
+        return min(replies[0], len(keys))
+
+    async def clear(self) -> None:
+        for pattern in (self._entry("*"), self._tag("*")):
+            cursor = b"0"
+            while True:
+                replies = await self._safe(None, ("SCAN", cursor, "MATCH", pattern, "COUNT", REDIS_SCAN_COUNT))
+                if replies is None:
+                    return
+                cursor, keys = replies[0]
+                if keys:
+                    await self._safe(None, ("DEL", *keys))
+                if cursor == b"0":
+                    break
+
+    async def incr(self, key: str, window: float) -> int:
+        full_key = self._key(key)
+        replies = await self._safe(
+            [None, 0], ("SET", full_key, 0, "PX", int(window * 1000), "NX"), ("INCR", full_key)
+        )
+        return replies[1]
+
+    async def counter(self, key: str) -> int:
+        replies = await self._safe([None], ("GET", self._key(key)))
+        return int(replies[0] or 0)
+
+    async def acquire_lock(self, key: str, token: str, ttl: float) -> bool:
+        replies = await self._safe(["OK"], ("SET", self._key(key), token, "PX", int(ttl * 1000), "NX"))
+        return replies[0] == "OK"
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        replies = await self._safe([0], ("EVAL", RELEASE_LOCK_SCRIPT, 1, self._key(key), token))
+        return replies[0] == 1
+
+    async def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+    def metrics(self) -> dict:
+        return {**super().metrics(), "host": self.host, "port": self.port, "idle_connections": len(self._idle)}
+
+def backend_from_url(url: Optional[str], prefix: str = "mekan360:") -> CacheBackend:
+    scheme = urlparse(url or "memory://").scheme
+    if scheme in ("", "memory"):
+        return MemoryBackend()
+    if scheme == "redis":
+        return RedisBackend(url, prefix=prefix)
+    raise ValueError(f"unsupported cache backend: {scheme}")
+
+class RateLimiter:
+    """Fixed-window counter; allow() is False once limit hits in the current window.
+
+    For limits that should only count failures, check blocked() first and call
+    record_failure() when the attempt fails.
+    """
+
+    def __init__(self, backend: CacheBackend, name: str, limit: int, window_seconds: float):
+        self.backend = backend
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.rejected = 0
+
+    def _key(self, key: str) -> str:
+        window = int(time.time() // self.window_seconds)
+        return f"rl:{self.name}:{key}:{window}"
+
+    async def allow(self, key: str) -> bool:
+        if self.limit <= 0:
+            return True
+        count = await self.backend.incr(self._key(key), self.window_seconds)
+        if count > self.limit:
+            self.rejected += 1
+            return False
+        return True
+
+    async def blocked(self, key: str) -> bool:
+        if self.limit <= 0:
+            return False
+        if await self.backend.counter(self._key(key)) >= self.limit:
+            self.rejected += 1
+            return True
+        return False
+
+    async def record_failure(self, key: str) -> None:
+        if self.limit > 0:
+            await self.backend.incr(self._key(key), self.window_seconds)
+
+    def metrics(self) -> dict:
+        return {"limit": self.limit, "window_seconds": self.window_seconds, "rejected": self.rejected}
+
+Builder = Callable[[], Awaitable[Tuple[bytes, List[str]]]]
+# fresh(tags) -> False when the tags were invalidated while the entry was being built
+Freshness = Callable[[List[str]], bool]
+
+def _pack(body: bytes, tags: List[str]) -> bytes:
+    return " ".join(tags).encode() + b"\n" + body
+
+def _unpack(value: bytes) -> Tuple[bytes, List[str]]:
+    header, body = value.split(b"\n", 1)
+    return body, header.decode().split()
+
+class SharedCache:
+    """Read-through cache where only one caller per key rebuilds a missing entry.
+
+    With a backend that is not shared across workers, nothing is stored here:
+    callers keep their own copy, so this only coalesces concurrent builds in-process.
+    """
+
+    def __init__(self, backend: CacheBackend, namespace: str, ttl_seconds: float,
+                 lock_seconds: float = SINGLE_FLIGHT_LOCK_SECONDS, wait_seconds: float = SINGLE_FLIGHT_WAIT_SECONDS):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.wait_seconds = wait_seconds
+        self.builds = 0
+        self.coalesced = 0
+        self._flights: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def get_or_build(self, key: str, build: Builder, fresh: Optional[Freshness] = None,
+                           generation: int = 0) -> Tuple[bytes, List[str]]:
+        """Returns (body, tags); build() raising propagates and releases the lock for the next caller.
+
+        A body for which fresh(tags) is False is returned but not stored. In-process
+        callers only share a build started under the same cache generation.
+        """
+        entry_key = f"{self.namespace}:{key}"
+        if not self.backend.shared:
+            return await self._local((entry_key, generation), build)
+        lock_key = f"lock:{entry_key}"
+        value = await self.backend.get(entry_key)
+        if value is not None:
+            return _unpack(value)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_seconds
+        while not await self.backend.acquire_lock(lock_key, token, self.lock_seconds):
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+            value = await self.backend.get(entry_key)
+            if value is not None:
+                self.coalesced += 1
+                return _unpack(value)
+            if time.monotonic() > deadline:
+                return await self._build(entry_key, build, fresh)
+        try:
+            value = await self.backend.get(entry_key)
+            if value is not None:
+                return _unpack(value)
+            return await self._build(entry_key, build, fresh)
+        finally:
+            await self.backend.release_lock(lock_key, token)
+
+    async def _local(self, flight_key: Tuple[str, int], build: Builder) -> Tuple[bytes, List[str]]:
+        flight = self._flights.get(flight_key)
+        if flight is not None:
+            self.coalesced += 1
+        else:
+            self.builds += 1
+            # a task of its own, so a caller that disconnects does not cancel the build for the others
+            flight = asyncio.ensure_future(build())
+            self._flights[flight_key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(flight_key, None))
+        return await asyncio.shield(flight)
+
+    async def _build(self, entry_key: str, build: Builder, fresh: Optional[Freshness]) -> Tuple[bytes, List[str]]:
+        self.builds += 1
+        body, tags = await build()
+        if fresh is None or fresh(tags):
+            await self.backend.set(entry_key, _pack(body, tags), self.ttl_seconds, tags)
+        return body, tags
+
+    def metrics(self) -> dict:
+        return {"builds": self.builds, "coalesced": self.coalesced}
@@ -0,0 +1,259 @@
+import asyncio
+import inspect
+import logging
+import os
+import socket
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+
+INVALIDATIONS_COLLECTION = "cache_invalidations"
+INVALIDATIONS_SIZE_BYTES = 1024 * 1024
+WATCHED_COLLECTIONS = ("properties", "users", "groups", "tour_manifests", "rooms", "pois")
+# rows owned by a listing; their cached payloads are tagged with the listing
+PROPERTY_CHILD_COLLECTIONS = ("rooms", "pois")
+# counters bumped on every visit; evicting cached listings for them would defeat the cache
+IGNORED_UPDATE_FIELDS = ["view_count", "total_view_duration", "updated_at"]
+CHANGE_STREAM_UNSUPPORTED = (40573, 40324, 136)
+UNKNOWN_FIELD = 40415
+HISTORY_LOST = 286
+BUS_MODES = ("auto", "changestream", "poll", "off")
+RETRY_SECONDS = 5.0
+
+# on_invalidate(tags); None means the change could not be attributed and everything must go
+InvalidateFunc = Callable[[Optional[List[str]]], Union[None, Awaitable[None]]]
+
+def change_tags(event: Dict) -> Optional[List[str]]:
+    collection = event["ns"]["coll"]
+    if collection == INVALIDATIONS_COLLECTION:
+        return event["fullDocument"].get("tags")
+    if collection == "tour_manifests":
+        return [f"property:{event['documentKey']['_id']}"]
+    if collection in PROPERTY_CHILD_COLLECTIONS:
+        # without a pre-image a deleted row has no property_id, but rooms and POIs are only
+        # deleted together with a write to their listing, which carries the same tag
+        return sorted({
+            f"property:{doc['property_id']}"
+            for doc in (event.get("fullDocument"), event.get("fullDocumentBeforeChange"))
+            if doc and doc.get("property_id")
+        })
+    tags: Set[str] = set()
+    for doc in (event.get("fullDocument"), event.get("fullDocumentBeforeChange")):
+        if not doc or not doc.get("id"):
+            continue
+        if collection == "properties":
+            tags.add(f"property:{doc['id']}")
+            if doc.get("user_id"):
+                tags.add(f"user:{doc['user_id']}")
+        elif collection == "users":
+            tags.add(f"user:{doc['id']}")
+        elif collection == "groups":
+            tags.add(f"group:{doc['id']}")
+    return sorted(tags) or None
+
+def change_pipeline(collections: Iterable[str] = WATCHED_COLLECTIONS + (INVALIDATIONS_COLLECTION,)) -> List[Dict]:
+    updated_keys = {"$map": {"input": {"$objectToArray": "$updateDescription.updatedFields"}, "in": "$$this.k"}}
+    return [
+        {"$match": {
+            "ns.coll": {"$in": list(collections)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+            "$or": [
+                {"operationType": {"$ne": "update"}},
+                {"updateDescription.removedFields.0": {"$exists": True}},
+                {"$expr": {"$gt": [{"$size": {"$setDifference": [updated_keys, IGNORED_UPDATE_FIELDS]}}, 0]}}
+            ]
+        }},
+        {"$project": {
+            "operationType": 1,
+            "ns": 1,
+            "documentKey": 1,
+            "fullDocument.id": 1,
+            "fullDocument.user_id": 1,
+            "fullDocument.property_id": 1,
+            "fullDocument.tags": 1,
+            "fullDocument.origin": 1,
+            "fullDocumentBeforeChange.id": 1,
+            "fullDocumentBeforeChange.user_id": 1,
+            "fullDocumentBeforeChange.property_id": 1
+        }}
+    ]
+
+async def enable_pre_images(db, collections: Iterable[str] = WATCHED_COLLECTIONS) -> List[str]:
+    """Lets delete events carry the removed document's id; needs MongoDB 6.0 on a replica set."""
+    enabled = []
+    for collection in collections:
+        try:
+            await db.command("collMod", collection, changeStreamPreAndPostImages={"enabled": True})
+            enabled.append(collection)
+        except OperationFailure as e:
+            logging.info(f"Change stream pre-images not enabled for {collection}: {e}")
+    return enabled
+
+async def ensure_invalidation_log(db):
+    try:
+        await db.create_collection(INVALIDATIONS_COLLECTION, capped=True, size=INVALIDATIONS_SIZE_BYTES)
+    except CollectionInvalid:
+        pass
+    except OperationFailure as e:
+        if e.code != 48:
+            raise
+
+async def publish_invalidation(db, tags: Optional[List[str]], origin: str = ""):
+    """Appends tags to the invalidation log every worker follows; None clears every cache."""
+    await db[INVALIDATIONS_COLLECTION].insert_one({
+        "tags": tags,
+        "origin": origin or f"{socket.gethostname()}:{os.getpid()}",
+        "at": datetime.now(timezone.utc)
+    })
+
+class CacheInvalidationBus:
+    """Evicts cache tags on every worker when listings, rooms, POIs, users or groups change.
+
+    Change streams cover writes from any process; on a standalone mongod the bus
+    falls back to tailing a capped collection that workers publish their own
+    invalidations to. Processes without a bus, such as the import and rollups
+    CLIs, publish to that collection, which is followed in both modes.
+    """
+
+    def __init__(self, db, on_invalidate: InvalidateFunc, mode: str = "auto"):
+        if mode not in BUS_MODES:
+            raise ValueError(f"unknown cache invalidation mode: {mode}")
+        self.db = db
+        self.on_invalidate = on_invalidate
+        self.mode = mode
+        self.active_mode: Optional[str] = None
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self.events = 0
+        self.evictions = 0
+        self.full_clears = 0
+        self.published = 0
+        self.errors = 0
+        self.last_event_at: Optional[str] = None
+        self._resume_token = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self.mode != "off" and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def publish(self, tags: Iterable[str]):
+        """Broadcasts tags invalidated by this worker; only needed when change streams are unavailable."""
+        tags = list(tags)
+        if self.active_mode != "poll" or not tags:
+            return
+        task = asyncio.create_task(self._publish(tags))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish(self, tags: List[str]):
+        try:
+            await publish_invalidation(self.db, tags, self.origin)
+            self.published += 1
+        except PyMongoError as e:
+            self.errors += 1
+            logging.warning(f"Cache invalidation not published: {e}")
+
+    async def _apply(self, tags: Optional[List[str]]):
+        self.events += 1
+        self.last_event_at = datetime.now(timezone.utc).isoformat()
+        if tags is None:
+            self.full_clears += 1
+        else:
+            self.evictions += len(tags)
+        result = self.on_invalidate(tags)
+        if inspect.isawaitable(result):
+            await result
+
+    async def _run(self):
+        if self.mode in ("auto", "changestream"):
+            try:
+                await self._watch()
+                return
+            except OperationFailure as e:
+                if self.mode == "changestream" or e.code not in CHANGE_STREAM_UNSUPPORTED:
+                    raise
+                logging.info(f"Change streams unavailable ({e.code}), polling {INVALIDATIONS_COLLECTION}")
+        await self._poll()
+
+    async def _watch(self):
+        self.active_mode = "changestream"
+        pre_images = "whenAvailable"
+        while True:
+            try:
+                async with self.db.watch(
+                    change_pipeline(),
+                    full_document="updateLookup",
+                    full_document_before_change=pre_images,
+                    resume_after=self._resume_token
+                ) as stream:
+                    async for event in stream:
+                        self._resume_token = stream.resume_token
+                        if event["ns"]["coll"] == INVALIDATIONS_COLLECTION and event["fullDocument"].get("origin") == self.origin:
+                            continue
+                        tags = change_tags(event)
+                        if tags != []:
+                            await self._apply(tags)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    self.active_mode = None
+                    raise
+                if e.code == UNKNOWN_FIELD and pre_images:
+                    # servers before 6.0 reject fullDocumentBeforeChange; deletes then clear the whole cache
+                    pre_images = None
+                await self._recover(e, history_lost=e.code == HISTORY_LOST)
+            except PyMongoError as e:
+                await self._recover(e)
+            await asyncio.sleep(RETRY_SECONDS)
+
+    async def _recover(self, error: Exception, history_lost: bool = False):
+        self.errors += 1
+        logging.warning(f"Cache invalidation stream interrupted: {error}")
+        if history_lost or self._resume_token is None:
+            # changes missed while disconnected cannot be attributed, so start clean
+            self._resume_token = None
+            await self._apply(None)
+
+    async def _poll(self):
+        self.active_mode = "poll"
+        await ensure_invalidation_log(self.db)
+        latest = await self.db[INVALIDATIONS_COLLECTION].find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        last_id = latest["_id"] if latest else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = self.db[INVALIDATIONS_COLLECTION].find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        if doc.get("origin") != self.origin:
+                            await self._apply(doc.get("tags"))
+                    await asyncio.sleep(0.1)
+            except PyMongoError as e:
+                await self._recover(e)
+            await asyncio.sleep(1.0)
+
+    def metrics(self) -> dict:
+        return {
+            "mode": self.mode,
+            "active_mode": self.active_mode,
+            "events": self.events,
+            "evictions": self.evictions,
+            "full_clears": self.full_clears,
+            "published": self.published,
+            "errors": self.errors,
+            "last_event_at": self.last_event_at
+        }
@@ -0,0 +1,175 @@
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+STREAMING_TYPES = ("text/event-stream",)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+def supported_encodings() -> tuple:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    result = {}
+    if not header:
+        return result
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        result[token] = q
+    return result
+
+def choose_encoding(header: Optional[str]) -> Optional[str]:
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.lower()
+    if content_type.startswith(STREAMING_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+class StreamCompressor:
+    def __init__(self, encoding: str, gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def compress_bytes(data: bytes, encoding: str, gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY) -> bytes:
+    compressor = StreamCompressor(encoding, gzip_level, brotli_quality)
+    return compressor.compress(data) + compressor.finish()
+
+def precompressed_response(payload, accept_encoding: Optional[str], minimum_size: int = 1024, status_code: int = 200) -> Response:
+    body = payload.body
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = choose_encoding(accept_encoding) if len(body) >= minimum_size else None
+    if encoding:
+        compressed = payload.variants.get(encoding)
+        if compressed is None:
+            compressed = compress_bytes(body, encoding)
+            payload.variants[encoding] = compressed
+        body = compressed
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type=payload.media_type, headers=headers)
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self.app, encoding, self.minimum_size, self.gzip_level, self.brotli_quality)
+        await responder(scope, receive, send)
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int, gzip_level: int, brotli_quality: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.send: Send = None
+        self.start_message: Optional[Message] = None
+        self.passthrough = False
+        self.compressor: Optional[StreamCompressor] = None
+        self.buffer = bytearray()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            if "content-encoding" in headers or not is_compressible(headers.get("content-type")):
+                self.passthrough = True
+                await self.send(message)
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is not None:
+            chunk = self.compressor.compress(body)
+            if not more_body:
+                chunk += self.compressor.finish()
+            if chunk or not more_body:
+                await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+        self.buffer.extend(body)
+        if len(self.buffer) < self.minimum_size:
+            if more_body:
+                return
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": bytes(self.buffer)})
+            return
+        self.compressor = StreamCompressor(self.encoding, self.gzip_level, self.brotli_quality)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        data = self.compressor.compress(bytes(self.buffer))
+        self.buffer.clear()
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            data += self.compressor.finish()
+            headers["Content-Length"] = str(len(data))
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -0,0 +1,288 @@
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from room_events import ROOM_EVENTS_COLLECTION
+from tour_manifest import MANIFESTS_COLLECTION
+from visitor_sketches import SKETCH_COLLECTION
+
+DELETIONS_COLLECTION = "deletion_jobs"
+DELETION_BATCH_SIZE = 500
+DELETION_LEASE_SECONDS = 300
+DELETION_RESUME_LIMIT = 20
+DELETION_MAX_ATTEMPTS = 5
+
+# delete_folder(path) -> bool; removes a CDN storage folder such as "properties/<id>/"
+DeleteFolder = Callable[[str], Awaitable[bool]]
+# renew() extends the job's lease; steps call it between batches
+Renew = Callable[[], Awaitable[None]]
+
+class LeaseLost(Exception):
+    pass
+
+async def _delete_batched(collection, query: Dict, renew: Renew) -> int:
+    removed = 0
+    while True:
+        docs = await collection.find(query, {"_id": 1}).limit(DELETION_BATCH_SIZE).to_list(DELETION_BATCH_SIZE)
+        if not docs:
+            return removed
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        removed += result.deleted_count
+        await renew()
+
+def _by(collection: str, field: str, **extra):
+    async def step(runner: "DeletionRunner", keys: List[str], renew: Renew) -> int:
+        return await _delete_batched(runner.db[collection], {**extra, field: {"$in": keys}}, renew)
+    return step
+
+async def _room_events(runner: "DeletionRunner", keys: List[str], renew: Renew) -> int:
+    # time-series buckets can only be deleted by metaField, which is property_id
+    result = await runner.db[ROOM_EVENTS_COLLECTION].delete_many({"property_id": {"$in": keys}})
+    return result.deleted_count
+
+async def _group_memberships(runner: "DeletionRunner", keys: List[str], renew: Renew) -> int:
+    result = await runner.db.groups.update_many(
+        {"property_ids": {"$in": keys}},
+        {"$pull": {"property_ids": {"$in": keys}}}
+    )
+    return result.modified_count
+
+def _assets(prefix: str):
+    async def step(runner: "DeletionRunner", keys: List[str], renew: Renew) -> int:
+        if runner.delete_folder is None:
+            return 0
+        removed = 0
+        for key in keys:
+            if await runner.delete_folder(f"{prefix}/{key}/"):
+                removed += 1
+            await renew()
+        return removed
+    return step
+
+# Each step is idempotent, so a job that crashed mid-step simply repeats it.
+PROPERTY_STEPS = [
+    ("rooms", _by("rooms", "property_id")),
+    ("pois", _by("pois", "property_id")),
+    ("tour_manifests", _by(MANIFESTS_COLLECTION, "_id")),
+    ("visits", _by("visits", "property_id")),
+    ("visitors", _by("visitors", "property_id")),
+    ("property_daily_stats", _by("property_daily_stats", "property_id")),
+    ("property_sketches", _by(SKETCH_COLLECTION, "key", scope="property")),
+    ("room_events", _room_events),
+    ("group_memberships", _group_memberships),
+    ("property_assets", _assets("properties")),
+]
+USER_STEPS = [
+    ("user_visitors", _by("visitors", "user_id")),
+    ("agent_daily_stats", _by("agent_daily_stats", "user_id")),
+    ("user_sketches", _by(SKETCH_COLLECTION, "key", scope="user")),
+    ("payments", _by("payments", "user_id")),
+    ("password_resets", _by("password_resets", "user_id")),
+    ("groups", _by("groups", "user_id")),
+    ("import_jobs", _by("import_jobs", "user_id")),
+    ("user_assets", _assets("users")),
+]
+
+def job_steps(job: Dict) -> List[tuple]:
+    steps = [(name, func, "property_ids") for name, func in PROPERTY_STEPS]
+    if job["kind"] == "user":
+        steps += [(name, func, "user_ids") for name, func in USER_STEPS]
+    return steps
+
+class DeletionRunner:
+    """Tombstones users and properties immediately, then removes their dependents in bounded batches."""
+
+    def __init__(self, db, delete_folder: Optional[DeleteFolder] = None, lease_seconds: float = DELETION_LEASE_SECONDS):
+        self.db = db
+        self.delete_folder = delete_folder
+        self.lease_seconds = lease_seconds
+
+    async def _create(self, job_id: str, kind: str, property_ids: List[str], user_ids: List[str]) -> Dict:
+        now = datetime.now(timezone.utc)
+        job = {
+            "kind": kind,
+            "property_ids": property_ids,
+            "user_ids": user_ids,
+            "status": "pending",
+            "step": 0,
+            "offset": 0,
+            "removed": {},
+            "attempts": 0,
+            "lease_id": None,
+            "locked_until": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "error": None
+        }
+        # the job is written before the roots go away, so a crash in between still leaves something to resume
+        return await self.db[DELETIONS_COLLECTION].find_one_and_update(
+            {"_id": job_id},
+            {"$setOnInsert": job},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def tombstone_property(self, property_doc: Dict) -> Dict:
+        job = await self._create(f"property:{property_doc['id']}", "property", [property_doc["id"]], [])
+        result = await self.db.properties.delete_one({"id": property_doc["id"]})
+        if result.deleted_count:
+            await self.db.users.update_one(
+                {"id": property_doc["user_id"], "property_count": {"$gt": 0}},
+                {"$inc": {"property_count": -1}}
+            )
+        return job
+
+    async def tombstone_user(self, user_id: str) -> Dict:
+        property_ids = await self.db.properties.distinct("id", {"user_id": user_id})
+        job = await self._create(f"user:{user_id}", "user", property_ids, [user_id])
+        await self.db.properties.delete_many({"user_id": user_id})
+        await self.db.users.delete_one({"id": user_id})
+        return job
+
+    async def tombstone_properties(self, property_ids: List[str]) -> Dict:
+        job = await self._create(str(uuid.uuid4()), "properties", property_ids, [])
+        await self.db.properties.delete_many({"id": {"$in": property_ids}})
+        return job
+
+    def _expired(self, now: datetime) -> Dict:
+        return {"$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]}
+
+    async def _claim(self, job_id: str) -> Optional[Dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db[DELETIONS_COLLECTION].find_one_and_update(
+            {
+                "_id": job_id,
+                "status": {"$in": ["pending", "running"]},
+                "attempts": {"$lt": DELETION_MAX_ATTEMPTS},
+                **self._expired(now)
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_id": uuid.uuid4().hex,
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _renewer(self, job: Dict) -> Renew:
+        async def renew():
+            now = datetime.now(timezone.utc)
+            result = await self.db[DELETIONS_COLLECTION].update_one(
+                {"_id": job["_id"], "lease_id": job["lease_id"]},
+                {"$set": {"locked_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+            )
+            if result.matched_count == 0:
+                raise LeaseLost(f"deletion {job['_id']} was claimed by another worker")
+        return renew
+
+    async def _checkpoint(self, job: Dict, step: int, offset: int, name: str, removed: int):
+        now = datetime.now(timezone.utc)
+        result = await self.db[DELETIONS_COLLECTION].update_one(
+            {"_id": job["_id"], "lease_id": job["lease_id"]},
+            {
+                "$set": {
+                    "step": step,
+                    "offset": offset,
+                    "locked_until": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {f"removed.{name}": removed}
+            }
+        )
+        if result.matched_count == 0:
+            raise LeaseLost(f"deletion {job['_id']} was claimed by another worker")
+
+    async def process(self, job_id: str) -> Optional[Dict]:
+        """Runs a job from its last checkpoint; returns None when another worker holds it or it is done."""
+        job = await self._claim(job_id)
+        if job is None:
+            return None
+        step, offset = job["step"], job["offset"]
+        renew = self._renewer(job)
+        try:
+            steps = job_steps(job)
+            while step < len(steps):
+                name, func, keys_field = steps[step]
+                keys = job[keys_field]
+                while offset < len(keys):
+                    chunk = keys[offset:offset + DELETION_BATCH_SIZE]
+                    removed = await func(self, chunk, renew)
+                    offset += len(chunk)
+                    await self._checkpoint(job, step, offset, name, removed)
+                step, offset = step + 1, 0
+                await self._checkpoint(job, step, offset, name, 0)
+            status, error = "completed", None
+        except LeaseLost as e:
+            logging.error(f"Deletion {job_id} stopped at step {step}: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Deletion {job_id} failed at step {step} (attempt {job['attempts']}): {e}")
+            # a job that keeps failing stops being retried and waits for an operator
+            status = "failed" if job["attempts"] >= DELETION_MAX_ATTEMPTS else "pending"
+            error = str(e)
+        now = datetime.now(timezone.utc)
+        return await self.db[DELETIONS_COLLECTION].find_one_and_update(
+            {"_id": job_id, "lease_id": job["lease_id"]},
+            {"$set": {
+                "status": status,
+                "error": error,
+                "lease_id": None,
+                "locked_until": None,
+                "updated_at": now,
+                "finished_at": now if status in ("completed", "failed") else None
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def resume(self, limit: int = DELETION_RESUME_LIMIT) -> Dict:
+        now = datetime.now(timezone.utc)
+        # workers that died mid-run on their last attempt leave the job running with an expired lease
+        abandoned = await self.db[DELETIONS_COLLECTION].update_many(
+            {"status": {"$in": ["pending", "running"]}, "attempts": {"$gte": DELETION_MAX_ATTEMPTS}, **self._expired(now)},
+            {"$set": {"status": "failed", "lease_id": None, "locked_until": None, "updated_at": now, "finished_at": now}}
+        )
+        cursor = self.db[DELETIONS_COLLECTION].find(
+            {
+                "status": {"$in": ["pending", "running"]},
+                "attempts": {"$lt": DELETION_MAX_ATTEMPTS},
+                **self._expired(now)
+            },
+            {"_id": 1}
+        ).sort("created_at", 1).limit(limit)
+        processed = completed = 0
+        async for job in cursor:
+            result = await self.process(job["_id"])
+            if result is not None:
+                processed += 1
+                completed += result["status"] == "completed"
+        return {"processed": processed, "completed": completed, "failed": abandoned.modified_count}
+
+    async def retry(self, job_id: str) -> Optional[Dict]:
+        """Gives a failed job a fresh set of attempts, continuing from its last checkpoint."""
+        return await self.db[DELETIONS_COLLECTION].find_one_and_update(
+            {"_id": job_id, "status": "failed"},
+            {"$set": {"status": "pending", "attempts": 0, "finished_at": None, "updated_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER
+        )
+
+async def get_deletion(db, job_id: str) -> Optional[Dict]:
+    job = await db[DELETIONS_COLLECTION].find_one({"_id": job_id}, {"property_ids": 0})
+    if job:
+        job["id"] = job.pop("_id")
+    return job
+
+async def list_deletions(db, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+    query = {"status": status} if status else {}
+    cursor = db[DELETIONS_COLLECTION].find(query, {"property_ids": 0}).sort("created_at", -1).limit(limit)
+    jobs = await cursor.to_list(limit)
+    for job in jobs:
+        job["id"] = job.pop("_id")
+    return jobs
@@ -0,0 +1,98 @@
+import csv
+import io
+import zlib
+from typing import Any, AsyncIterator, Dict, List
+
+from serialization import dumps
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+# spreadsheet apps evaluate cells starting with these, and visitor names come from a public form
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+VISITOR_EXPORT_FIELDS = [
+    "id", "property_id", "first_name", "last_name", "phone", "visit_count",
+    "total_duration", "rooms_visited", "last_visit", "created_at"
+]
+VISIT_EXPORT_FIELDS = ["id", "property_id", "visitor_id", "duration", "rooms_visited", "visited_at"]
+PROPERTY_EXPORT_FIELDS = [
+    "id", "title", "address", "city", "district", "square_meters", "room_count", "property_type",
+    "floor", "total_floors", "building_age", "heating_type", "facing_direction", "price", "currency",
+    "view_type", "view_count", "total_view_duration", "created_at", "updated_at", "share_link"
+]
+
+def export_projection(fields: List[str]) -> Dict[str, int]:
+    projection = {"_id": 0}
+    projection.update({field: 1 for field in fields})
+    return projection
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return _csv_value(";".join(str(v) for v in value))
+    if isinstance(value, dict):
+        return dumps(value).decode()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+async def ndjson_rows(cursor) -> AsyncIterator[bytes]:
+    async for doc in cursor:
+        yield dumps(doc) + b"\n"
+
+async def csv_rows(cursor, fields: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    async for doc in cursor:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_csv_value(doc.get(field)) for field in fields])
+        yield buffer.getvalue().encode("utf-8")
+
+async def chunked(rows: AsyncIterator[bytes], chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    first = True
+    async for row in rows:
+        buffer.extend(row)
+        if first or len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+            first = False
+    if buffer:
+        yield bytes(buffer)
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(cursor, fmt: str, fields: List[str], gzip: bool = False) -> AsyncIterator[bytes]:
+    rows = csv_rows(cursor, fields) if fmt == "csv" else ndjson_rows(cursor)
+    stream = chunked(rows)
+    if gzip:
+        stream = gzip_stream(stream)
+    return stream
+
+async def backfill_visit_owners(db) -> int:
+    """Stamps the listing owner on visits recorded before exports filtered on it."""
+    migrated = 0
+    cursor = db.properties.find({"visit_owners_backfilled": {"$ne": True}}, {"_id": 1, "id": 1, "user_id": 1}, batch_size=EXPORT_BATCH_SIZE)
+    async for property_doc in cursor:
+        result = await db.visits.update_many(
+            {"property_id": property_doc["id"], "user_id": {"$exists": False}},
+            {"$set": {"user_id": property_doc["user_id"]}}
+        )
+        await db.properties.update_one({"_id": property_doc["_id"]}, {"$set": {"visit_owners_backfilled": True}})
+        migrated += result.modified_count
+    return migrated
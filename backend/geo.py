@@ -0,0 +1,121 @@
+import re
+from typing import Dict, List, Optional
+
+POIS_COLLECTION = "pois"
+MAX_NEARBY_KM = 50
+DEFAULT_POI_RADIUS_KM = 5
+GEO_MIGRATION_BATCH_SIZE = 500
+
+_DISTANCE_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(km|kilometre|kilometer|metre|meter|mt|m)(?![^\W\d_])", re.IGNORECASE)
+_BARE_DISTANCE_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*$")
+
+def geo_point(coordinates: Optional[Dict]) -> Optional[Dict]:
+    if not coordinates:
+        return None
+    return {"type": "Point", "coordinates": [float(coordinates["longitude"]), float(coordinates["latitude"])]}
+
+def parse_distance_m(distance) -> Optional[float]:
+    if isinstance(distance, (int, float)):
+        return float(distance)
+    text = str(distance or "")
+    match = _DISTANCE_RE.match(text) or _BARE_DISTANCE_RE.match(text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    unit = (match.group(2) if match.re is _DISTANCE_RE else "m").lower()
+    return value * 1000 if unit.startswith("k") else value
+
+def poi_documents(property_id: str, user_id: str, pois: List[Dict]) -> List[Dict]:
+    docs = []
+    for poi in pois:
+        if not poi.get("name"):
+            continue
+        doc = {
+            "property_id": property_id,
+            "user_id": user_id,
+            "type": poi.get("type") or "other",
+            "name": poi["name"],
+            "distance": poi.get("distance"),
+            "distance_m": parse_distance_m(poi.get("distance"))
+        }
+        location = geo_point(poi.get("coordinates"))
+        if location:
+            doc["location"] = location
+        docs.append(doc)
+    return docs
+
+async def save_pois(db, property_id: str, user_id: str, pois: List[Dict]) -> int:
+    docs = poi_documents(property_id, user_id, pois)
+    await db[POIS_COLLECTION].delete_many({"property_id": property_id})
+    if docs:
+        await db[POIS_COLLECTION].insert_many(docs, ordered=False)
+    return len(docs)
+
+async def nearby_properties(db, user_id: str, latitude: float, longitude: float, radius_km: float,
+                            limit: int) -> List[Dict]:
+    pipeline = [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "key": "location",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "query": {"user_id": user_id},
+            "spherical": True
+        }},
+        {"$limit": limit},
+        {"$project": {"_id": 0}}
+    ]
+    return await db.properties.aggregate(pipeline).to_list(limit)
+
+async def nearest_pois(db, location: Dict, user_id: str, category: Optional[str], limit: int,
+                       radius_km: float = DEFAULT_POI_RADIUS_KM) -> List[Dict]:
+    """POIs the listing owner entered on any of their listings, nearest first, one row per (type, name)."""
+    query = {"user_id": user_id}
+    if category:
+        query["type"] = category
+    pipeline = [
+        {"$geoNear": {
+            "near": location,
+            "key": "location",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "query": query,
+            "spherical": True
+        }},
+        {"$group": {
+            "_id": {"type": "$type", "name": "$name"},
+            "distance_m": {"$first": "$distance_m"},
+            "location": {"$first": "$location"}
+        }},
+        {"$sort": {"distance_m": 1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "type": "$_id.type", "name": "$_id.name", "distance_m": 1, "location": 1}}
+    ]
+    return await db[POIS_COLLECTION].aggregate(pipeline).to_list(limit)
+
+async def property_pois(db, property_id: str, category: Optional[str], limit: int) -> List[Dict]:
+    query = {"property_id": property_id}
+    if category:
+        query["type"] = category
+    cursor = db[POIS_COLLECTION].find(
+        query, {"_id": 0, "type": 1, "name": 1, "distance": 1, "distance_m": 1, "location": 1}
+    ).sort([("distance_m", 1), ("name", 1)]).limit(limit)
+    return await cursor.to_list(limit)
+
+async def backfill_geo(db) -> int:
+    """Normalizes embedded POIs and GeoJSON locations for listings saved before they existed."""
+    migrated = 0
+    cursor = db.properties.find(
+        {"pois_indexed": {"$ne": True}},
+        {"_id": 1, "id": 1, "user_id": 1, "pois": 1, "coordinates": 1},
+        batch_size=GEO_MIGRATION_BATCH_SIZE
+    )
+    async for property_doc in cursor:
+        await save_pois(db, property_doc["id"], property_doc["user_id"], property_doc.get("pois") or [])
+        update = {"pois_indexed": True}
+        location = geo_point(property_doc.get("coordinates"))
+        if location:
+            update["location"] = location
+        await db.properties.update_one({"_id": property_doc["_id"], "pois_indexed": {"$ne": True}}, {"$set": update})
+        migrated += 1
+    return migrated
@@ -0,0 +1,67 @@
+import hashlib
+import math
+from typing import Iterable, Optional, Tuple
+
+HLL_PRECISION = 12
+_POWERS = [2.0 ** -i for i in range(66)]
+
+class HyperLogLog:
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytes] = None):
+        self.precision = precision
+        size = 1 << precision
+        if registers is not None and len(registers) != size:
+            raise ValueError(f"Expected {size} registers, got {len(registers)}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(size)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(int(math.log2(len(data))), bytes(data))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @property
+    def size(self) -> int:
+        return len(self.registers)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.size)
+
+    @staticmethod
+    def position(value: str, precision: int = HLL_PRECISION) -> Tuple[int, int]:
+        """Register index and rank a value lands on."""
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        index = h >> (64 - precision)
+        remaining = h & ((1 << (64 - precision)) - 1)
+        return index, (64 - precision) - remaining.bit_length() + 1
+
+    def add(self, value: str) -> bool:
+        index, rank = self.position(value, self.precision)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, values: Iterable[str]) -> bool:
+        changed = False
+        for value in values:
+            changed = self.add(value) or changed
+        return changed
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(_POWERS[r] for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
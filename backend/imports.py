@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
+import mimetypes
+import os
+import sys
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+IMPORTS_COLLECTION = "import_jobs"
+IMPORT_FORMATS = ("ndjson", "csv", "zip")
+IMPORT_CHUNK_SIZE = 100
+IMPORT_MAX_ERRORS = 1000
+# decompressed size caps for zip members, checked before a member is read
+IMPORT_MAX_MEDIA_BYTES = 25 * 1024 * 1024
+IMPORT_MAX_LISTING_BYTES = 1024 * 1024 * 1024
+# room for the multipart boundary and headers around the uploaded file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+JSON_COLUMNS = ("rooms", "pois", "coordinates")
+MEDIA_FIELDS = ("cover_image",)
+ROOM_MEDIA_FIELDS = ("panorama_photo",)
+
+# build(user, property_dict) -> (property_doc, room_docs, poi_docs); raises ValueError for row-level rejections
+BuildDocuments = Callable[[dict, Dict], Awaitable[Tuple[dict, List[dict], List[dict]]]]
+
+class ImportRowError(ValueError):
+    pass
+
+def detect_format(filename: str, fmt: Optional[str] = None) -> str:
+    fmt = (fmt or os.path.splitext(filename or "")[1].lstrip(".")).lower()
+    if fmt == "jsonl":
+        fmt = "ndjson"
+    if fmt not in IMPORT_FORMATS:
+        raise ImportRowError(f"unsupported format: {fmt or 'unknown'}")
+    return fmt
+
+def _csv_row(row: Dict[str, str]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        value = value.strip()
+        if value == "":
+            continue
+        if key in JSON_COLUMNS:
+            value = json.loads(value)
+        out[key] = value
+    if "latitude" in out and "longitude" in out and "coordinates" not in out:
+        out["coordinates"] = {"latitude": out.pop("latitude"), "longitude": out.pop("longitude")}
+    return out
+
+def _text_rows(stream: io.TextIOBase, fmt: str) -> Iterator[Tuple[int, Any]]:
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            try:
+                yield number, _csv_row(row)
+            except ValueError as e:
+                yield number, ImportRowError(f"invalid JSON column: {e}")
+        return
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ImportRowError(f"invalid JSON: {e}")
+
+def _listing_member(archive: zipfile.ZipFile) -> Tuple[str, str]:
+    for info in archive.infolist():
+        name = info.filename
+        base = name.rsplit("/", 1)[-1]
+        if base.startswith(".") or name.startswith("__MACOSX"):
+            continue
+        ext = os.path.splitext(base)[1].lstrip(".").lower()
+        if ext in ("ndjson", "jsonl", "csv"):
+            if info.file_size > IMPORT_MAX_LISTING_BYTES:
+                raise ImportRowError(f"listing file is larger than {IMPORT_MAX_LISTING_BYTES} bytes uncompressed")
+            return name, "csv" if ext == "csv" else "ndjson"
+    raise ImportRowError("archive has no .ndjson or .csv listing file")
+
+def iter_rows(path: str, fmt: str) -> Iterator[Tuple[int, Any, Optional[zipfile.ZipFile]]]:
+    """Yields (row number, row dict or error, archive) one row at a time without loading the file."""
+    if fmt == "zip":
+        with zipfile.ZipFile(path) as archive:
+            member, inner = _listing_member(archive)
+            with archive.open(member) as raw:
+                for number, row in _text_rows(io.TextIOWrapper(raw, encoding="utf-8-sig"), inner):
+                    yield number, row, archive
+        return
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        for number, row in _text_rows(stream, fmt):
+            yield number, row, None
+
+def _data_uri(archive: zipfile.ZipFile, name: str) -> str:
+    try:
+        info = archive.getinfo(name.lstrip("/"))
+    except KeyError:
+        raise ImportRowError(f"image not found in archive: {name}")
+    # the reader stops at the declared size, so checking it bounds what read() can inflate
+    if info.file_size > IMPORT_MAX_MEDIA_BYTES:
+        raise ImportRowError(f"image larger than {IMPORT_MAX_MEDIA_BYTES} bytes: {name}")
+    content = archive.read(info)
+    content_type = mimetypes.guess_type(name)[0] or "image/jpeg"
+    return f"data:{content_type};base64,{base64.b64encode(content).decode()}"
+
+def _is_reference(value: Any) -> bool:
+    return isinstance(value, str) and value and not value.startswith(("data:", "http://", "https://"))
+
+def resolve_archive_media(row: Dict, archive: Optional[zipfile.ZipFile]) -> Dict:
+    """Inlines archive images as data URIs; expects a row that already passed model validation."""
+    if archive is None:
+        return row
+    for field in MEDIA_FIELDS:
+        if _is_reference(row.get(field)):
+            row[field] = _data_uri(archive, row[field])
+    for room in row.get("rooms") or []:
+        for field in ROOM_MEDIA_FIELDS:
+            if _is_reference(room.get(field)):
+                room[field] = _data_uri(archive, room[field])
+        room["photos"] = [_data_uri(archive, p) if _is_reference(p) else p for p in room.get("photos") or []]
+    return row
+
+class UploadLimitMiddleware:
+    """Rejects an oversized import upload while it streams in, before the multipart body is parsed."""
+
+    def __init__(self, app: ASGIApp, path: str, max_bytes: int, detail: str):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+        self.detail = detail
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        for key, value in scope["headers"]:
+            if key == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(send)
+                return
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPException from body parsing, so this becomes a 413
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send: Send):
+        body = json.dumps({"detail": self.detail}).encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+def _validation_errors(e: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+
+class PropertyImporter:
+    def __init__(self, db, model: type, build: BuildDocuments, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.db = db
+        self.model = model
+        self.build = build
+        self.chunk_size = chunk_size
+
+    async def create_job(self, user_id: str, filename: str, fmt: str, dry_run: bool = False) -> dict:
+        job = {
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "filename": filename,
+            "format": fmt,
+            "dry_run": dry_run,
+            "status": "queued",
+            "processed": 0,
+            "inserted": 0,
+            "failed": 0,
+            "errors": [],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None
+        }
+        await self.db[IMPORTS_COLLECTION].insert_one(job)
+        return job
+
+    async def _progress(self, job_id: str, counters: Dict[str, int], errors: List[dict], **fields):
+        update: Dict[str, Any] = {"$set": {**counters, **fields}}
+        if errors:
+            update["$push"] = {"errors": {"$each": errors, "$slice": IMPORT_MAX_ERRORS}}
+        await self.db[IMPORTS_COLLECTION].update_one({"_id": job_id}, update)
+
+    async def _insert(self, documents: List[Tuple[dict, List[dict], List[dict]]]) -> int:
+        properties = [doc for doc, _, _ in documents]
+        rooms = [room for _, room_docs, _ in documents for room in room_docs]
+        pois = [poi for _, _, poi_docs in documents for poi in poi_docs]
+        if rooms:
+            await self.db.rooms.insert_many(rooms, ordered=False)
+        if pois:
+            await self.db.pois.insert_many(pois, ordered=False)
+        result = await self.db.properties.insert_many(properties, ordered=False)
+        return len(result.inserted_ids)
+
+    async def _reserve(self, user_id: str, limit: Optional[int], wanted: int) -> int:
+        """Claims up to wanted listings of the package limit on the user's property_count.
+
+        The conditional $inc is the reservation, so two imports for the same account
+        cannot both pass the limit; unused claims are handed back after the insert.
+        """
+        if limit is None or wanted == 0:
+            return wanted
+        while True:
+            user = await self.db.users.find_one({"id": user_id}, {"_id": 0, "property_count": 1})
+            granted = min(wanted, max(0, limit - (user or {}).get("property_count", 0)))
+            if granted == 0:
+                return 0
+            result = await self.db.users.update_one(
+                {"id": user_id, "$or": [
+                    {"property_count": {"$lte": limit - granted}},
+                    {"property_count": {"$exists": False}}
+                ]},
+                {"$inc": {"property_count": granted}}
+            )
+            if result.modified_count:
+                return granted
+
+    async def _release(self, user_id: str, count: int):
+        if count:
+            await self.db.users.update_one({"id": user_id}, {"$inc": {"property_count": -count}})
+
+    def _validate(self, row: Any, archive: Optional[zipfile.ZipFile]) -> Dict:
+        if isinstance(row, Exception):
+            raise row
+        if not isinstance(row, dict):
+            raise ImportRowError("row must be an object")
+        # types are checked before archive media is touched, so a malformed row fails alone
+        return resolve_archive_media(self.model(**row).model_dump(), archive)
+
+    def _read_chunk(self, rows: Iterator) -> List[Tuple[int, Optional[Dict], Optional[List[str]]]]:
+        """Reads and validates the next chunk; media is resolved while the row's archive is still open."""
+        chunk = []
+        for number, row, archive in islice(rows, self.chunk_size):
+            try:
+                chunk.append((number, self._validate(row, archive), None))
+            except ValidationError as e:
+                chunk.append((number, None, _validation_errors(e)))
+            except (ValueError, TypeError) as e:
+                chunk.append((number, None, [str(e)]))
+        return chunk
+
+    async def run(self, job_id: str, user: dict, path: str, fmt: str, limit: Optional[int],
+                  dry_run: bool = False) -> dict:
+        """Imports rows in chunks; limit is the package property limit (None for unlimited), reserved per chunk."""
+        counters = {"processed": 0, "inserted": 0, "failed": 0}
+        await self._progress(job_id, counters, [], status="running")
+        remaining = None
+        if dry_run and limit is not None:
+            current = await self.db.users.find_one({"id": user["id"]}, {"_id": 0, "property_count": 1})
+            remaining = max(0, limit - (current or {}).get("property_count", 0))
+        rows = iter_rows(path, fmt)
+        try:
+            while True:
+                # reading, inflating and base64-encoding archive members stays off the event loop
+                chunk = await asyncio.to_thread(self._read_chunk, rows)
+                if not chunk:
+                    break
+                counters["processed"] += len(chunk)
+                errors = [{"row": number, "errors": row_errors} for number, _, row_errors in chunk if row_errors]
+                valid = [(number, data) for number, data, row_errors in chunk if not row_errors]
+                if dry_run:
+                    granted = len(valid) if remaining is None else min(len(valid), remaining)
+                    if remaining is not None:
+                        remaining -= granted
+                else:
+                    granted = await self._reserve(user["id"], limit, len(valid))
+                documents = []
+                for index, (number, data) in enumerate(valid):
+                    try:
+                        if index >= granted:
+                            raise ImportRowError(f"package property limit reached ({limit})")
+                        if not dry_run:
+                            documents.append(await self.build(user, data))
+                    except ValueError as e:
+                        errors.append({"row": number, "errors": [str(e)]})
+                counters["failed"] += len(errors)
+                if dry_run:
+                    await self._progress(job_id, counters, errors)
+                    continue
+                inserted = await self._insert(documents) if documents else 0
+                counters["inserted"] += inserted
+                await self._release(user["id"], granted - inserted)
+                await self._progress(job_id, counters, errors)
+            status = "completed"
+            error = None
+        except Exception as e:
+            logging.error(f"Import {job_id} failed: {e}")
+            status = "failed"
+            error = str(e)
+        except asyncio.CancelledError:
+            # shutdown outlasted its grace period; property_count is corrected by the reconcile job
+            await asyncio.shield(self._progress(
+                job_id, counters, [], status="failed", error="interrupted",
+                finished_at=datetime.now(timezone.utc).isoformat()
+            ))
+            raise
+        finally:
+            rows.close()
+        await self._progress(
+            job_id, counters, [], status=status, error=error,
+            finished_at=datetime.now(timezone.utc).isoformat()
+        )
+        return {"job_id": job_id, "status": status, "error": error, **counters}
+
+async def get_job(db, job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+    query = {"_id": job_id}
+    if user_id is not None:
+        query["user_id"] = user_id
+    job = await db[IMPORTS_COLLECTION].find_one(query)
+    if job:
+        job["id"] = job.pop("_id")
+    return job
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Mekan360 bulk property import")
+    parser.add_argument("email", help="Account that will own the imported listings")
+    parser.add_argument("path", help="NDJSON, CSV or zip file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Override the format detected from the extension")
+    parser.add_argument("--dry-run", action="store_true", help="Validate rows without inserting")
+    args = parser.parse_args()
+    import server
+    await server.connect_db()
+    try:
+        user = await server.db.users.find_one({"email": args.email})
+        if not user:
+            logging.error(f"No user with email {args.email}")
+            return 1
+        fmt = detect_format(args.path, args.format)
+        result = await server.run_property_import(user, args.path, os.path.basename(args.path), fmt, args.dry_run)
+        logging.info(f"Import finished: {result}")
+        return 0 if result["status"] == "completed" and not result["failed"] else 1
+    finally:
+        await server.close_db()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import Dict, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", 1)], unique=True),
+        IndexModel([("email", 1)], unique=True),
+        IndexModel([("created_at", -1)]),
+        IndexModel([("package", 1)]),
+        IndexModel([("subscription_status", 1), ("subscription_end", 1)]),
+    ],
+    "properties": [
+        IndexModel([("id", 1)], unique=True),
+        IndexModel([("user_id", 1), ("created_at", -1), ("id", -1)]),
+        IndexModel([("user_id", 1), ("price", 1), ("id", 1)]),
+        IndexModel([("user_id", 1), ("square_meters", 1), ("id", 1)]),
+        IndexModel([("user_id", 1), ("city", 1), ("district", 1), ("created_at", -1), ("id", -1)]),
+        IndexModel(
+            [("user_id", 1), ("title", "text"), ("description", "text")],
+            name="property_search_text",
+            default_language="turkish",
+            weights={"title": 3, "description": 1}
+        ),
+        IndexModel([("location", "2dsphere"), ("user_id", 1)]),
+    ],
+    "pois": [
+        IndexModel([("location", "2dsphere"), ("user_id", 1), ("type", 1)]),
+        IndexModel([("property_id", 1), ("type", 1), ("distance_m", 1)]),
+    ],
+    "rooms": [
+        IndexModel([("property_id", 1), ("id", 1)], unique=True),
+        IndexModel([("property_id", 1), ("order", 1)]),
+    ],
+    "groups": [
+        IndexModel([("id", 1)], unique=True),
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+        IndexModel([("property_ids", 1)]),
+    ],
+    "visitors": [
+        IndexModel([("id", 1)], unique=True),
+        IndexModel([("user_id", 1), ("last_visit", -1)]),
+        IndexModel([("property_id", 1), ("last_visit", -1)]),
+        IndexModel(
+            [("property_id", 1), ("phone_normalized", 1)],
+            unique=True,
+            partialFilterExpression={"phone_normalized": {"$type": "string"}}
+        ),
+    ],
+    "visits": [
+        IndexModel([("property_id", 1), ("visited_at", -1)]),
+        IndexModel([("user_id", 1), ("visited_at", -1)]),
+    ],
+    "payments": [
+        IndexModel([("user_id", 1), ("payment_date", -1)]),
+        IndexModel([("payment_date", -1)]),
+    ],
+    "password_resets": [
+        IndexModel([("token", 1)], unique=True),
+        IndexModel([("user_id", 1)]),
+        IndexModel([("purge_at", 1)], expireAfterSeconds=0),
+    ],
+    "property_daily_stats": [
+        IndexModel([("property_id", 1), ("day", 1)]),
+    ],
+    "agent_daily_stats": [
+        IndexModel([("user_id", 1), ("day", 1)]),
+    ],
+    "visitor_sketches": [
+        IndexModel([("scope", 1), ("key", 1), ("day", 1)]),
+    ],
+    "job_runs": [
+        IndexModel([("job", 1), ("started_at", -1)]),
+        IndexModel([("started_at", 1)], expireAfterSeconds=30 * 86400),
+    ],
+    "import_jobs": [
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+    ],
+    "deletion_jobs": [
+        IndexModel([("status", 1), ("created_at", 1)]),
+    ],
+}
+
+# One entry per query a route issues against an indexed collection. Values are
+# placeholders: only the shape of the filter and sort matters to the planner.
+QUERY_SHAPES: List[dict] = [
+    {"route": "auth", "collection": "users", "filter": {"id": "x"}},
+    {"route": "POST /auth/login", "collection": "users", "filter": {"email": "x"}},
+    {"route": "GET /admin/users", "collection": "users", "filter": {}, "sort": {"created_at": -1}},
+    {"route": "GET /properties", "collection": "properties", "filter": {"user_id": "x"}, "sort": {"created_at": -1}},
+    {"route": "GET /properties/{id}", "collection": "properties", "filter": {"id": "x"}},
+    {"route": "GET /properties/search", "collection": "properties", "filter": {"user_id": "x", "city": "x", "district": "x"}, "sort": {"created_at": -1, "id": -1}},
+    {"route": "GET /properties/search", "collection": "properties", "filter": {"user_id": "x", "price": {"$gte": 1, "$lte": 2}}, "sort": {"price": 1, "id": 1}},
+    {"route": "GET /properties/search", "collection": "properties", "filter": {"user_id": "x", "room_count": "x"}, "sort": {"square_meters": -1, "id": -1}},
+    {"route": "GET /properties/search", "collection": "properties", "filter": {"user_id": "x", "$text": {"$search": "x", "$language": "turkish"}}},
+    {"route": "GET /properties/{id}/rooms/{room_id}", "collection": "rooms", "filter": {"property_id": "x", "id": "x"}},
+    {"route": "GET /properties/{id}", "collection": "rooms", "filter": {"property_id": {"$in": ["x", "y"]}}, "sort": {"property_id": 1, "order": 1}},
+    {"route": "GET /properties/{id}/pois", "collection": "pois", "filter": {"property_id": "x", "type": "x"}, "sort": {"distance_m": 1}},
+    {"route": "GET /groups", "collection": "groups", "filter": {"user_id": "x"}, "sort": {"created_at": -1}},
+    {"route": "GET /groups/{id}", "collection": "groups", "filter": {"id": "x", "user_id": "x"}},
+    {"route": "GET /public/groups/{id}", "collection": "groups", "filter": {"id": "x"}},
+    {"route": "POST /visitors", "collection": "visitors", "filter": {"property_id": "x", "phone_normalized": "x"}},
+    {"route": "GET /properties/{id}/visitors", "collection": "visitors", "filter": {"property_id": "x"}, "sort": {"last_visit": -1}},
+    {"route": "GET /properties/{id}/visits", "collection": "visitors", "filter": {"id": "x"}},
+    {"route": "GET /analytics", "collection": "visitors", "filter": {"user_id": "x"}, "sort": {"last_visit": -1}},
+    {"route": "GET /properties/{id}/visits", "collection": "visits", "filter": {"property_id": "x"}, "sort": {"visited_at": -1}},
+    {"route": "GET /exports/visits", "collection": "visits", "filter": {"user_id": "x"}, "sort": {"visited_at": -1}},
+    {"route": "GET /admin/users/{id}", "collection": "payments", "filter": {"user_id": "x"}, "sort": {"payment_date": -1}},
+    {"route": "GET /admin/payments", "collection": "payments", "filter": {}, "sort": {"payment_date": -1}},
+    {"route": "POST /auth/reset-password", "collection": "password_resets", "filter": {"token": "x", "used": False}},
+    {"route": "job free_property_cleanup", "collection": "users", "filter": {"package": "free"}},
+    {"route": "job subscription_expiry", "collection": "users", "filter": {"subscription_status": "active", "subscription_end": {"$type": "string", "$lt": "x"}}},
+    {"route": "GET /admin/jobs", "collection": "job_runs", "filter": {"job": "x"}, "sort": {"started_at": -1}},
+    {"route": "GET /properties/{id}/stats", "collection": "property_daily_stats", "filter": {"property_id": "x", "day": {"$gte": "x"}}, "sort": {"day": 1}},
+    {"route": "GET /analytics", "collection": "agent_daily_stats", "filter": {"user_id": "x", "day": {"$gte": "x"}}, "sort": {"day": 1}},
+    {"route": "job deletion_resume", "collection": "deletion_jobs", "filter": {"status": {"$in": ["pending", "running"]}}, "sort": {"created_at": 1}},
+    {"route": "deletion group_memberships", "collection": "groups", "filter": {"property_ids": {"$in": ["x", "y"]}}},
+    {"route": "deletion password_resets", "collection": "password_resets", "filter": {"user_id": {"$in": ["x", "y"]}}},
+    {"route": "deletion visitor_sketches", "collection": "visitor_sketches", "filter": {"scope": "property", "key": {"$in": ["x", "y"]}}},
+]
+
+async def apply_indexes(db, registry: Optional[Dict[str, List[IndexModel]]] = None) -> dict:
+    report = {"created": [], "failed": []}
+    for collection, models in (registry or INDEXES).items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection].create_indexes([model])
+                report["created"].append(f"{collection}.{name}")
+            except OperationFailure as e:
+                report["failed"].append({"index": f"{collection}.{name}", "error": str(e)})
+                logging.warning(f"Index {collection}.{name} not created: {e}")
+    return report
+
+def plan_stages(explain: dict) -> List[str]:
+    stages = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            stage = node.get("stage")
+            if isinstance(stage, str):
+                stages.append(stage)
+            for key, value in node.items():
+                if key != "rejectedPlans":
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(explain.get("queryPlanner", explain))
+    return stages
+
+async def explain_shape(db, shape: dict) -> dict:
+    find = {"find": shape["collection"], "filter": shape["filter"], "limit": 1}
+    if shape.get("sort"):
+        find["sort"] = shape["sort"]
+    explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+    stages = plan_stages(explain)
+    return {
+        "route": shape["route"],
+        "collection": shape["collection"],
+        "filter": shape["filter"],
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages
+    }
+
+async def check_query_plans(db, shapes: Optional[List[dict]] = None) -> dict:
+    plans = [await explain_shape(db, shape) for shape in (shapes or QUERY_SHAPES)]
+    return {"checked": len(plans), "violations": [plan for plan in plans if plan["collscan"]], "plans": plans}
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from pathlib import Path
+    from motor.motor_asyncio import AsyncIOMotorClient
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Mekan360 index management")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("apply", help="Create every registered index")
+    subparsers.add_parser("check", help="Explain each route query and fail on collection scans")
+    args = parser.parse_args()
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('MONGO_DB', 'mekan360')]
+    try:
+        if args.command == "apply":
+            report = await apply_indexes(db)
+            logging.info(f"Indexes applied: {len(report['created'])} ok, {len(report['failed'])} failed")
+            return 1 if report["failed"] else 0
+        result = await check_query_plans(db)
+        for plan in result["violations"]:
+            logging.error(f"COLLSCAN: {plan['route']} on {plan['collection']} {plan['filter']}")
+        logging.info(f"Query plans checked: {result['checked']}, collection scans: {len(result['violations'])}")
+        return 1 if result["violations"] else 0
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+from typing import AsyncIterator, Dict, Set
+
+from serialization import dumps
+
+LIVE_FEED_QUEUE_SIZE = 100
+LIVE_FEED_HEARTBEAT_SECONDS = 15
+LIVE_FEED_MAX_CONNECTIONS = 5
+
+class Subscription:
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def push(self, event: tuple):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+class LiveFeedHub:
+    def __init__(self, max_queue: int = LIVE_FEED_QUEUE_SIZE, max_connections: int = LIVE_FEED_MAX_CONNECTIONS):
+        self.max_queue = max_queue
+        self.max_connections = max_connections
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._sequence = itertools.count(1)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def has_capacity(self, user_id: str) -> bool:
+        return len(self._subscriptions.get(user_id, ())) < self.max_connections
+
+    def subscribe(self, user_id: str) -> Subscription:
+        if not self.has_capacity(user_id):
+            raise OverflowError("too many live feed connections")
+        subscriptions = self._subscriptions.setdefault(user_id, set())
+        subscription = Subscription(user_id, self.max_queue)
+        subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        self.dropped += subscription.dropped
+        if not subscriptions:
+            del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id: str, event_type: str, data: dict):
+        subscriptions = self._subscriptions.get(user_id)
+        if not subscriptions:
+            return
+        self.published += 1
+        event = (next(self._sequence), event_type, data)
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def metrics(self) -> dict:
+        return {
+            "agents": len(self._subscriptions),
+            "connections": sum(len(s) for s in self._subscriptions.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped + sum(sub.dropped for subs in self._subscriptions.values() for sub in subs)
+        }
+
+def format_sse(event_id: int, event_type: str, data: dict) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event_type.encode(), dumps(data))
+
+async def sse_stream(hub: LiveFeedHub, user_id: str, request,
+                     heartbeat_seconds: float = LIVE_FEED_HEARTBEAT_SECONDS) -> AsyncIterator[bytes]:
+    # subscribe only once the response is streaming, so a client gone before then holds no slot
+    try:
+        subscription = hub.subscribe(user_id)
+    except OverflowError:
+        yield format_sse(0, "error", {"detail": "too_many_connections"})
+        return
+    try:
+        yield b"retry: 5000\n\n"
+        reported_drops = 0
+        while not await request.is_disconnected():
+            try:
+                event_id, event_type, data = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if subscription.dropped > reported_drops:
+                yield format_sse(event_id, "dropped", {"count": subscription.dropped - reported_drops})
+                reported_drops = subscription.dropped
+            hub.delivered += 1
+            yield format_sse(event_id, event_type, data)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from metrics import REGISTRY, UNMATCHED_ROUTE
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+MAX_STALLS = 50
+STACK_LIMIT = 30
+BACKGROUND_ROUTE = "background"
+# the watchdog checks this many times per detection window, which bounds how late a stall start is seen
+WATCH_RESOLUTION = 5
+
+loop_lag = REGISTRY.histogram("mekan360_event_loop_lag_seconds", "Event loop scheduling delay per probe.", (), LAG_BUCKETS)
+loop_lag_max = REGISTRY.gauge("mekan360_event_loop_lag_max_seconds", "Largest event loop delay seen since start.")
+loop_stalls = REGISTRY.counter("mekan360_event_loop_stalls_total", "Event loop stalls over the threshold.", ("route",))
+
+def route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', None) or UNMATCHED_ROUTE}"
+
+class LoopLagMonitor:
+    """Measures event-loop lag and captures the stack of whatever blocks it.
+
+    A coroutine sleeps for `interval` and records how late it wakes up. A
+    watchdog thread keeps one ping callback queued on the loop; once a ping
+    has gone unanswered for longer than `threshold` (or `budget`, if that is
+    smaller) it grabs the loop thread's stack together with the route of the
+    task that is running. Blocking is measured from when the unanswered ping
+    was queued, so it is accurate to within a watchdog tick. With a `budget`,
+    any request that blocked the loop longer than the budget is failed, which
+    is meant for test runs.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, budget: Optional[float] = None):
+        self.interval = interval
+        self.threshold = threshold
+        self.budget = budget
+        self.detect_after = min(threshold, budget) if budget is not None else threshold
+        self.stalls: Deque[dict] = deque(maxlen=MAX_STALLS)
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._ping_sent: Optional[float] = None
+        # (ping sent at, task) of the stall the watchdog last captured
+        self._stall: Optional[tuple] = None
+        self._scopes: Dict[asyncio.Task, Scope] = {}
+        self._violations: Dict[asyncio.Task, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._ping_sent = None
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, self.detect_after * 2)
+            self._watchdog = None
+
+    async def _probe(self):
+        while True:
+            start = time.monotonic()
+            self._heartbeat = start
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - start - self.interval)
+            loop_lag.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+                loop_lag_max.set(lag)
+
+    def _pong(self, sent: float):
+        # runs as soon as the loop is free again, so this is the stall's full length
+        if self._stall is not None and self._stall[0] == sent:
+            self._record_blocked(self._stall[1], time.monotonic() - sent)
+        self._ping_sent = None
+
+    def _watch(self):
+        while not self._stopping.wait(self.detect_after / WATCH_RESOLUTION):
+            sent = self._ping_sent
+            if sent is None:
+                self._ping_sent = time.monotonic()
+                try:
+                    self._loop.call_soon_threadsafe(self._pong, self._ping_sent)
+                except RuntimeError:
+                    return
+                continue
+            blocked = time.monotonic() - sent
+            if blocked < self.detect_after:
+                continue
+            if self._stall is not None and self._stall[0] == sent:
+                self._record_blocked(self._stall[1], blocked)
+                continue
+            self._capture(sent, blocked)
+
+    def _running_task(self) -> Optional[asyncio.Task]:
+        # called from the watchdog thread while the loop is blocked, so its current task is not changing
+        return asyncio.current_task(self._loop)
+
+    def _capture(self, sent: float, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame is not None else ""
+        task = self._running_task()
+        scope = self._scopes.get(task) if task is not None else None
+        route = route_label(scope) if scope is not None else BACKGROUND_ROUTE
+        stall = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "blocked_ms": round(blocked * 1000, 1),
+            "route": route,
+            "task": task.get_name() if task is not None else None,
+            "stack": stack
+        }
+        self.stalls.append(stall)
+        self._stall = (sent, task if scope is not None else None)
+        loop_stalls.inc(route=route)
+        if scope is not None:
+            self._violations[task] = blocked
+        logging.warning(f"Event loop blocked for {stall['blocked_ms']}ms on {route}:\n{stack}")
+
+    def _record_blocked(self, task: Optional[asyncio.Task], blocked: float):
+        if self.stalls:
+            self.stalls[-1]["blocked_ms"] = max(self.stalls[-1]["blocked_ms"], round(blocked * 1000, 1))
+        if task is not None and task in self._violations:
+            self._violations[task] = max(self._violations[task], blocked)
+
+    def track(self, scope: Scope) -> Optional[asyncio.Task]:
+        task = asyncio.current_task()
+        if task is not None:
+            self._scopes[task] = scope
+        return task
+
+    def over_budget(self, task: Optional[asyncio.Task]) -> Optional[float]:
+        blocked = self._violations.get(task) if task is not None else None
+        if blocked is not None and self.budget is not None and blocked > self.budget:
+            return blocked
+        return None
+
+    def untrack(self, task: Optional[asyncio.Task]) -> Optional[float]:
+        """Forgets the request's task; returns how long it blocked the loop if it went over the budget."""
+        blocked = self.over_budget(task)
+        if task is not None:
+            self._scopes.pop(task, None)
+            self._violations.pop(task, None)
+        return blocked
+
+    def metrics(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "detect_after_ms": self.detect_after * 1000,
+            "budget_ms": self.budget * 1000 if self.budget is not None else None,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": list(self.stalls)
+        }
+
+class LoopBlockingMiddleware:
+    """Attributes stalls to the route being served; with a budget, fails requests that blocked the loop."""
+
+    def __init__(self, app: ASGIApp, monitor: LoopLagMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = self.monitor.track(scope)
+        started = False
+        held: list = []
+
+        async def guarded_send(message: Message):
+            nonlocal started
+            if self.monitor.budget is None or started:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                held.append(message)
+                return
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                blocked = self.monitor.over_budget(task)
+                if blocked is not None:
+                    started = True
+                    await self._fail(send, blocked)
+                    return
+            started = True
+            for pending in held:
+                await send(pending)
+            held.clear()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, guarded_send)
+        finally:
+            blocked = self.monitor.untrack(task)
+            if blocked is not None:
+                logging.error(
+                    f"Request {route_label(scope)} blocked the event loop for {blocked * 1000:.0f}ms "
+                    f"(budget {self.monitor.budget * 1000:.0f}ms)"
+                )
+
+    async def _fail(self, send: Send, blocked: float):
+        body = (
+            '{"detail":"Event loop blocked for %dms, budget %dms"}' % (blocked * 1000, self.monitor.budget * 1000)
+        ).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from deletions import DeletionRunner
+
+FREE_PROPERTY_RETENTION_DAYS = 7
+MAINTENANCE_BATCH_SIZE = 1000
+
+def _batches(items: List, size: int = MAINTENANCE_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def expired_free_properties(db, retention_days: int = FREE_PROPERTY_RETENTION_DAYS) -> List[dict]:
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).isoformat()
+    cursor = db.users.aggregate([
+        {"$match": {"package": "free"}},
+        {"$project": {"_id": 0, "id": 1}},
+        {"$lookup": {
+            "from": "properties",
+            "localField": "id",
+            "foreignField": "user_id",
+            "pipeline": [{"$match": {"created_at": {"$lt": cutoff}}}, {"$project": {"_id": 0, "id": 1}}],
+            "as": "expired"
+        }},
+        {"$unwind": "$expired"},
+        {"$project": {"property_id": "$expired.id", "user_id": "$id"}}
+    ])
+    return await cursor.to_list(None)
+
+async def cleanup_free_properties(db, deletions: DeletionRunner,
+                                  retention_days: int = FREE_PROPERTY_RETENTION_DAYS) -> dict:
+    expired = await expired_free_properties(db, retention_days)
+    property_ids = [row["property_id"] for row in expired]
+    user_ids = sorted({row["user_id"] for row in expired})
+    deleted_count = 0
+    for batch in _batches(property_ids):
+        job = await deletions.tombstone_properties(batch)
+        await deletions.process(job["_id"])
+        deleted_count += len(batch)
+    reconciled = await reconcile_property_counts(db, user_ids) if user_ids else {"updated": 0}
+    return {
+        "deleted_count": deleted_count,
+        "property_ids": property_ids,
+        "user_ids": user_ids,
+        "counts_updated": reconciled["updated"]
+    }
+
+async def expire_subscriptions(db) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    query = {"subscription_status": "active", "subscription_end": {"$type": "string", "$lt": now}}
+    user_ids = await db.users.distinct("id", query)
+    if not user_ids:
+        return {"expired": 0, "user_ids": []}
+    result = await db.users.update_many(
+        {"id": {"$in": user_ids}, **query},
+        {"$set": {"subscription_status": "expired", "updated_at": now}}
+    )
+    return {"expired": result.modified_count, "user_ids": user_ids}
+
+async def purge_reset_tokens(db) -> dict:
+    now = datetime.now(timezone.utc)
+    result = await db.password_resets.delete_many({"$or": [
+        {"used": True},
+        {"purge_at": {"$lt": now}},
+        {"purge_at": {"$exists": False}, "expires_at": {"$lt": now.isoformat()}}
+    ]})
+    return {"deleted": result.deleted_count}
+
+async def reconcile_property_counts(db, user_ids: Optional[Iterable[str]] = None) -> dict:
+    pipeline = []
+    if user_ids is not None:
+        pipeline.append({"$match": {"id": {"$in": list(user_ids)}}})
+    pipeline += [
+        {"$project": {"_id": 1, "id": 1, "property_count": 1}},
+        {"$lookup": {
+            "from": "properties",
+            "localField": "id",
+            "foreignField": "user_id",
+            "pipeline": [{"$count": "n"}],
+            "as": "actual"
+        }},
+        {"$project": {"property_count": 1, "actual": {"$ifNull": [{"$first": "$actual.n"}, 0]}}},
+        {"$match": {"$expr": {"$ne": [{"$ifNull": ["$property_count", -1]}, "$actual"]}}}
+    ]
+    updated = 0
+    ops = []
+    async for user in db.users.aggregate(pipeline):
+        ops.append(UpdateOne({"_id": user["_id"]}, {"$set": {"property_count": user["actual"]}}))
+        if len(ops) >= MAINTENANCE_BATCH_SIZE:
+            updated += (await db.users.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await db.users.bulk_write(ops, ordered=False)).modified_count
+    return {"updated": updated}
@@ -0,0 +1,255 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+UNMATCHED_ROUTE = "unmatched"
+# anything else a client sends is folded into "other" so the method label stays bounded
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+MAX_PENDING_COMMANDS = 10000
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+class Gauge(Metric):
+    """Set directly, or computed at scrape time when collect() is given."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        if self._collect is not None:
+            values = list(self._collect().items())
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+REGISTRY = Registry()
+http_requests = REGISTRY.counter(
+    "mekan360_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status")
+)
+http_duration = REGISTRY.histogram(
+    "mekan360_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")
+)
+http_in_flight = REGISTRY.gauge("mekan360_http_requests_in_flight", "HTTP requests currently being served.")
+mongo_duration = REGISTRY.histogram(
+    "mekan360_mongo_command_duration_seconds", "MongoDB command latency.", ("collection", "command"), MONGO_BUCKETS
+)
+mongo_failures = REGISTRY.counter(
+    "mekan360_mongo_command_failures_total", "MongoDB commands that returned an error.", ("collection", "command")
+)
+image_duration = REGISTRY.histogram("mekan360_image_duration_seconds", "Image pipeline step duration.", ("step",))
+bunny_duration = REGISTRY.histogram(
+    "mekan360_bunny_request_duration_seconds", "Bunny storage request latency.", ("operation", "outcome")
+)
+bunny_failures = REGISTRY.counter("mekan360_bunny_failures_total", "Failed Bunny storage requests.", ("operation",))
+
+def stats_gauge(name: str, documentation: str, sources: Callable[[], Dict[str, dict]], field: str) -> Gauge:
+    """Exposes one field of several stats() dicts, labelled by source name."""
+    def collect() -> Dict[LabelValues, float]:
+        return {(source,): stats.get(field) or 0 for source, stats in sources().items() if stats is not None}
+    return REGISTRY.gauge(name, documentation, ("cache",), collect)
+
+class PrometheusMiddleware:
+    """Times every HTTP request and labels it with the matched route template, not the raw path."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            labels = {
+                "method": scope["method"] if scope["method"] in HTTP_METHODS else "other",
+                "route": getattr(route, "path", None) or UNMATCHED_ROUTE,
+                "status": str(status)
+            }
+            http_requests.inc(**labels)
+            http_duration.observe(time.perf_counter() - start, **labels)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per collection and command latency; the collection is only known from the started event."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, Tuple[str, str]] = {}
+
+    def _key(self, event) -> tuple:
+        return (event.connection_id, event.request_id, getattr(event, "operation_id", None))
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else ""
+        with self._lock:
+            if len(self._pending) < MAX_PENDING_COMMANDS:
+                self._pending[self._key(event)] = (collection, event.command_name)
+
+    def _finish(self, event) -> Tuple[str, str]:
+        with self._lock:
+            return self._pending.pop(self._key(event), ("", event.command_name))
+
+    def succeeded(self, event):
+        collection, command = self._finish(event)
+        mongo_duration.observe(event.duration_micros / 1e6, collection=collection, command=command)
+
+    def failed(self, event):
+        collection, command = self._finish(event)
+        mongo_duration.observe(event.duration_micros / 1e6, collection=collection, command=command)
+        mongo_failures.inc(collection=collection, command=command)
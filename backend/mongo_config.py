@@ -0,0 +1,187 @@
+import importlib.util
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from pymongo import monitoring
+from pymongo.read_preferences import (
+    Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+)
+
+RECENT_WRITES_MAX_TAGS = 10000
+
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": None}
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Environment variable -> (client option, type). Options are only passed when the
+# variable is set, so the driver defaults stay in charge otherwise.
+CLIENT_ENV_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_ZLIB_LEVEL": ("zlibCompressionLevel", int),
+    "MONGO_APP_NAME": ("appname", str),
+}
+
+def available_compressors(names: str) -> List[str]:
+    selected = []
+    for name in (n.strip().lower() for n in names.split(",")):
+        if name not in COMPRESSOR_MODULES:
+            if name:
+                logging.warning(f"Unknown MongoDB compressor ignored: {name}")
+            continue
+        module = COMPRESSOR_MODULES[name]
+        if module is not None and importlib.util.find_spec(module) is None:
+            logging.warning(f"MongoDB compressor {name} skipped, {module} is not installed")
+            continue
+        selected.append(name)
+    return selected
+
+def _read_preference_mode(name: str):
+    mode = READ_PREFERENCES.get(name.replace("_", "").lower())
+    if mode is None:
+        raise ValueError(f"Unknown read preference: {name}")
+    return mode
+
+def read_preference(name: Optional[str], max_staleness_seconds: int = -1):
+    if not name:
+        return None
+    mode = _read_preference_mode(name)
+    if mode is Primary:
+        return Primary()
+    return mode(max_staleness=max_staleness_seconds)
+
+def client_options(env: Mapping[str, str]) -> Dict:
+    options: Dict = {}
+    for var, (option, cast) in CLIENT_ENV_OPTIONS.items():
+        if env.get(var):
+            options[option] = cast(env[var])
+    compressors = available_compressors(env.get("MONGO_COMPRESSORS", ""))
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    preference = env.get("MONGO_READ_PREFERENCE")
+    if preference:
+        mode = _read_preference_mode(preference)
+        options["readPreference"] = mode().mongos_mode
+        staleness = int(env.get("MONGO_MAX_STALENESS_SECONDS", "-1"))
+        if staleness > 0 and mode is not Primary:
+            options["maxStalenessSeconds"] = staleness
+    return options
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters per server, fed by driver events from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, dict] = {}
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "open": 0, "checked_out": 0, "created": 0, "closed": 0,
+                "checkouts": 0, "checkout_failures": 0, "checkout_wait_ms_total": 0.0,
+                "checkout_wait_ms_max": 0.0, "cleared": 0
+            }
+        return pool
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for field, delta in deltas.items():
+                pool[field] += delta
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, created=1, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, closed=1, open=-1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        wait_ms = getattr(event, "duration", 0.0) * 1000
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkouts"] += 1
+            pool["checked_out"] += 1
+            pool["checkout_wait_ms_total"] += wait_ms
+            pool["checkout_wait_ms_max"] = max(pool["checkout_wait_ms_max"], wait_ms)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            pools = {address: dict(pool) for address, pool in self._pools.items()}
+        for pool in pools.values():
+            pool["checkout_wait_ms_avg"] = pool["checkout_wait_ms_total"] / pool["checkouts"] if pool["checkouts"] else 0.0
+        return pools
+
+class RecentWrites:
+    """Cache tags written in the last `window` seconds.
+
+    Public reads go to secondaries; right after a write a lagging secondary would
+    hand the old document to the next cache fill, which then serves it for a
+    whole TTL. Reads for recently written tags are sent to the primary instead.
+    """
+
+    def __init__(self, window_seconds: float, max_tags: int = RECENT_WRITES_MAX_TAGS):
+        self.window_seconds = window_seconds
+        self.max_tags = max_tags
+        self._written: "OrderedDict[str, float]" = OrderedDict()
+        self._all_until = 0.0
+        self.primary_reads = 0
+
+    def mark(self, tags: Optional[Iterable[str]]):
+        """Records a write; None means the change could not be attributed, so every tag counts as written."""
+        now = time.monotonic()
+        if tags is None:
+            self._all_until = now + self.window_seconds
+            self._written.clear()
+            return
+        for tag in tags:
+            self._written[tag] = now
+            self._written.move_to_end(tag)
+        while self._written and (len(self._written) > self.max_tags or next(iter(self._written.values())) < now - self.window_seconds):
+            self._written.popitem(last=False)
+
+    def recent(self, *tags: str) -> bool:
+        now = time.monotonic()
+        if now < self._all_until:
+            return True
+        cutoff = now - self.window_seconds
+        return any(self._written.get(tag, 0.0) >= cutoff for tag in tags)
@@ -0,0 +1,117 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+class CachedPayload:
+    __slots__ = ("key", "body", "media_type", "variants", "tags", "expires_at")
+
+    def __init__(self, key: str, body: bytes, media_type: str, tags: Iterable[str], expires_at: float):
+        self.key = key
+        self.body = body
+        self.media_type = media_type
+        self.variants: Dict[str, bytes] = {}
+        self.tags = frozenset(tags)
+        self.expires_at = expires_at
+
+class ResponseCache:
+    """LRU of response bodies with tag invalidation.
+
+    Invalidations bump a generation; a caller reads it before building a body
+    and passes it to set(), which refuses to store a body whose tags were
+    invalidated while it was being built.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CachedPayload]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self.generation = 0
+        # generation of each tag's last invalidation; tags pushed out of this bounded map fold into _floor
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_builds = 0
+
+    def get(self, key: str) -> Optional[CachedPayload]:
+        payload = self._entries.get(key)
+        if payload is None or payload.expires_at < time.monotonic():
+            if payload is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+
+    def is_stale(self, tags: Iterable[str], generation: int) -> bool:
+        """True if any of the tags was invalidated after the given generation was read."""
+        if self._floor > generation:
+            return True
+        return any(self._invalidated.get(tag, 0) > generation for tag in tags)
+
+    def set(self, key: str, body: bytes, tags: Iterable[str] = (), media_type: str = "application/json",
+            generation: Optional[int] = None) -> CachedPayload:
+        payload = CachedPayload(key, body, media_type, tags, time.monotonic() + self.ttl_seconds)
+        if generation is not None and self.is_stale(payload.tags, generation):
+            # still served to this caller, just not kept
+            self.stale_builds += 1
+            return payload
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = payload
+        for tag in payload.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return payload
+
+    def invalidate(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def _mark(self, tags: Iterable[str]) -> None:
+        self.generation += 1
+        for tag in tags:
+            self._invalidated[tag] = self.generation
+            self._invalidated.move_to_end(tag)
+        while len(self._invalidated) > self.max_entries * 4:
+            self._floor = max(self._floor, self._invalidated.popitem(last=False)[1])
+
+    def invalidate_tags(self, *tags: str) -> int:
+        self._mark(tags)
+        removed = 0
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._floor = self.generation
+        self._invalidated.clear()
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "stale_builds": self.stale_builds
+        }
+
+    def _remove(self, key: str) -> None:
+        payload = self._entries.pop(key, None)
+        if payload is None:
+            return
+        for tag in payload.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from cache_bus import ensure_invalidation_log, publish_invalidation
+from visitor_sketches import daily_unique_counts
+
+ROLLUP_DAYS = 30
+
+def day_key(value) -> str:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+def room_field(room_id: str) -> str:
+    return str(room_id).replace(".", "_").lstrip("$")
+
+def room_field_expr(room_id) -> dict:
+    """Aggregation twin of room_field, so backfilled and live room keys match."""
+    return {"$ltrim": {"input": {"$replaceAll": {"input": {"$toString": room_id}, "find": ".", "replacement": "_"}}, "chars": "$"}}
+
+def range_start(days: int = ROLLUP_DAYS) -> str:
+    return day_key(datetime.now(timezone.utc) - timedelta(days=days))
+
+def property_stats_op(property_id: str, user_id: str, day: str, views: int, duration: int,
+                      rooms: Dict[str, int]) -> UpdateOne:
+    inc = {"views": views, "duration": duration}
+    for room_id, count in rooms.items():
+        inc[f"rooms.{room_field(room_id)}"] = count
+    # unique visitors come from the per-day HyperLogLog sketches; drop id arrays left by older rollups
+    update = {
+        "$inc": inc,
+        "$setOnInsert": {"property_id": property_id, "user_id": user_id, "day": day},
+        "$unset": {"visitor_ids": ""}
+    }
+    return UpdateOne({"_id": f"{property_id}:{day}"}, update, upsert=True)
+
+def agent_stats_op(user_id: str, day: str, views: int, duration: int) -> UpdateOne:
+    return UpdateOne(
+        {"_id": f"{user_id}:{day}"},
+        {"$inc": {"views": views, "duration": duration}, "$setOnInsert": {"user_id": user_id, "day": day}},
+        upsert=True
+    )
+
+async def record_visit_rollup(db, property_id: str, user_id: str, duration: int,
+                              rooms_visited: List[str], visited_at: str):
+    day = day_key(visited_at)
+    rooms = {room_id: 1 for room_id in set(rooms_visited)}
+    await asyncio.gather(
+        db.property_daily_stats.bulk_write([property_stats_op(property_id, user_id, day, 1, duration, rooms)]),
+        db.agent_daily_stats.bulk_write([agent_stats_op(user_id, day, 1, duration)])
+    )
+
+async def agent_daily_views(db, user_id: str, days: int = ROLLUP_DAYS) -> List[dict]:
+    cursor = db.agent_daily_stats.find(
+        {"user_id": user_id, "day": {"$gte": range_start(days)}},
+        {"_id": 0, "day": 1, "views": 1, "duration": 1}
+    ).sort("day", 1)
+    return await cursor.to_list(days + 1)
+
+async def property_daily_stats(db, property_id: str, days: int = ROLLUP_DAYS) -> List[dict]:
+    cursor = db.property_daily_stats.find(
+        {"property_id": property_id, "day": {"$gte": range_start(days)}},
+        {"_id": 0, "day": 1, "views": 1, "duration": 1, "rooms": 1}
+    ).sort("day", 1)
+    stats = await cursor.to_list(days + 1)
+    counts = await daily_unique_counts(db, "property", property_id, [row["day"] for row in stats])
+    for row in stats:
+        row.setdefault("rooms", {})
+        row["unique_visitors"] = counts.get(row["day"], 0)
+    return stats
+
+async def rebuild_rollups(db, since: Optional[str] = None) -> dict:
+    match = {"visited_at": {"$gte": since}} if since else {}
+    day_expr = {"$substrCP": ["$visited_at", 0, 10]}
+    stats_id = {"$concat": ["$_id.property_id", ":", "$_id.day"]}
+    await db.visits.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"property_id": "$property_id", "day": day_expr},
+            "views": {"$sum": 1},
+            "duration": {"$sum": {"$ifNull": ["$duration", 0]}}
+        }},
+        {"$lookup": {
+            "from": "properties",
+            "localField": "_id.property_id",
+            "foreignField": "id",
+            "pipeline": [{"$project": {"_id": 0, "user_id": 1}}],
+            "as": "property"
+        }},
+        {"$project": {
+            "_id": stats_id,
+            "property_id": "$_id.property_id",
+            "day": "$_id.day",
+            "user_id": {"$first": "$property.user_id"},
+            "views": 1,
+            "duration": 1
+        }},
+        {"$merge": {"into": "property_daily_stats", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    await db.visits.aggregate([
+        {"$match": match},
+        {"$project": {
+            "property_id": 1,
+            "day": day_expr,
+            "rooms": {"$setUnion": [{"$ifNull": ["$rooms_visited", []]}, []]}
+        }},
+        {"$unwind": "$rooms"},
+        {"$group": {"_id": {"property_id": "$property_id", "day": "$day", "room": "$rooms"}, "count": {"$sum": 1}}},
+        {"$group": {
+            "_id": {"property_id": "$_id.property_id", "day": "$_id.day"},
+            "rooms": {"$push": {
+                "k": room_field_expr("$_id.room"),
+                "v": "$count"
+            }}
+        }},
+        {"$project": {"_id": stats_id, "rooms": {"$arrayToObject": "$rooms"}}},
+        {"$merge": {"into": "property_daily_stats", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ]).to_list(None)
+    stats_match = {"user_id": {"$ne": None}}
+    if since:
+        stats_match["day"] = {"$gte": day_key(since)}
+    await db.property_daily_stats.aggregate([
+        {"$match": stats_match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "day": "$day"},
+            "views": {"$sum": "$views"},
+            "duration": {"$sum": "$duration"}
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.user_id", ":", "$_id.day"]},
+            "user_id": "$_id.user_id",
+            "day": "$_id.day",
+            "views": 1,
+            "duration": 1
+        }},
+        {"$merge": {"into": "agent_daily_stats", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    day_filter = {"day": {"$gte": day_key(since)}} if since else {}
+    return {
+        "property_daily_stats": await db.property_daily_stats.count_documents(day_filter),
+        "agent_daily_stats": await db.agent_daily_stats.count_documents(day_filter)
+    }
+
+async def _main():
+    from dotenv import load_dotenv
+    from pathlib import Path
+    from motor.motor_asyncio import AsyncIOMotorClient
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Mekan360 analytics rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill = subparsers.add_parser("backfill", help="Rebuild daily rollups from raw visits")
+    backfill.add_argument("--since", help="Only rebuild days on or after this date (YYYY-MM-DD)")
+    args = parser.parse_args()
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('MONGO_DB', 'mekan360')]
+    try:
+        result = await rebuild_rollups(db, since=args.since)
+        logging.info(f"Rollups rebuilt: {result}")
+        # a backfill can touch every listing, so the running workers drop their caches once
+        await ensure_invalidation_log(db)
+        await publish_invalidation(db, None)
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main())
@@ -0,0 +1,128 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+ROOM_EVENTS_COLLECTION = "room_events"
+ROOM_ENTER = 0
+ROOM_LEAVE = 1
+HOTSPOT_CLICK = 2
+HEARTBEAT = 3
+ROOM_EVENT_KINDS = {"enter": ROOM_ENTER, "leave": ROOM_LEAVE}
+MAX_DWELL_MS = 30 * 60 * 1000
+MAX_EVENT_SKEW = timedelta(minutes=5)
+MAX_EVENT_AGE = timedelta(days=2)
+
+async def ensure_room_events_collection(db, ttl_days: int = 0):
+    options = {"timeseries": {"timeField": "ts", "metaField": "property_id", "granularity": "seconds"}}
+    if ttl_days > 0:
+        options["expireAfterSeconds"] = ttl_days * 86400
+    try:
+        await db.create_collection(ROOM_EVENTS_COLLECTION, **options)
+    except CollectionInvalid:
+        pass
+    except OperationFailure as e:
+        if e.code != 48:
+            logging.warning(f"room_events time-series collection not created: {e}")
+    try:
+        await db[ROOM_EVENTS_COLLECTION].create_index([("property_id", 1), ("v", 1), ("ts", 1)])
+    except OperationFailure as e:
+        # heatmaps get slower without it, which is no reason to refuse to start
+        logging.warning(f"room_events index not created: {e}")
+
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def build_room_event(property_id: str, visitor_id: str, room_id: Optional[str], kind: int, ts: datetime, **extra) -> dict:
+    doc = {"ts": ts, "property_id": property_id, "v": visitor_id, "k": kind}
+    if room_id is not None:
+        doc["r"] = room_id
+    doc.update(extra)
+    return doc
+
+def timestamp_in_range(ts: datetime, now: datetime) -> bool:
+    return now - MAX_EVENT_AGE <= ts <= now + MAX_EVENT_SKEW
+
+def validate_room_event(room_ids: set, room_id: str, event: str, ts: datetime, now: datetime) -> Optional[str]:
+    if not isinstance(room_id, str) or room_id not in room_ids:
+        return "unknown_room"
+    if event not in ROOM_EVENT_KINDS:
+        return "unknown_event"
+    if not timestamp_in_range(ts, now):
+        return "timestamp_out_of_range"
+    return None
+
+def _window_since(days: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=days)
+
+async def room_heatmap(db, property_id: str, days: int = 30) -> List[dict]:
+    pipeline = [
+        {"$match": {"property_id": property_id, "k": {"$in": [ROOM_ENTER, ROOM_LEAVE]}, "ts": {"$gte": _window_since(days)}}},
+        {"$setWindowFields": {
+            "partitionBy": "$v",
+            "sortBy": {"ts": 1},
+            "output": {"next_ts": {"$shift": {"output": "$ts", "by": 1}}}
+        }},
+        {"$match": {"k": ROOM_ENTER, "next_ts": {"$ne": None}}},
+        {"$project": {
+            "r": 1,
+            "v": 1,
+            "dwell": {"$dateDiff": {"startDate": "$ts", "endDate": "$next_ts", "unit": "millisecond"}}
+        }},
+        {"$match": {"dwell": {"$gte": 0, "$lte": MAX_DWELL_MS}}},
+        {"$group": {
+            "_id": "$r",
+            "entries": {"$sum": 1},
+            "visitors": {"$addToSet": "$v"},
+            "total_dwell_ms": {"$sum": "$dwell"},
+            "median_dwell_ms": {"$median": {"input": "$dwell", "method": "approximate"}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "room_id": "$_id",
+            "entries": 1,
+            "unique_visitors": {"$size": "$visitors"},
+            "total_dwell_ms": 1,
+            "avg_dwell_ms": {"$divide": ["$total_dwell_ms", "$entries"]},
+            "median_dwell_ms": 1
+        }},
+        {"$sort": {"total_dwell_ms": -1}}
+    ]
+    return await db[ROOM_EVENTS_COLLECTION].aggregate(pipeline).to_list(None)
+
+async def room_transitions(db, property_id: str, days: int = 30, top: int = 3) -> List[dict]:
+    pipeline = [
+        {"$match": {"property_id": property_id, "k": ROOM_ENTER, "ts": {"$gte": _window_since(days)}}},
+        {"$setWindowFields": {
+            "partitionBy": "$v",
+            "sortBy": {"ts": 1},
+            "output": {"next_r": {"$shift": {"output": "$r", "by": 1}}}
+        }},
+        {"$match": {"next_r": {"$ne": None}, "$expr": {"$ne": ["$r", "$next_r"]}}},
+        {"$group": {"_id": {"from": "$r", "to": "$next_r"}, "count": {"$sum": 1}}},
+        {"$group": {
+            "_id": "$_id.from",
+            "transitions": {"$sum": "$count"},
+            "next_rooms": {"$topN": {"n": top, "sortBy": {"count": -1}, "output": {"room_id": "$_id.to", "count": "$count"}}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "room_id": "$_id",
+            "transitions": 1,
+            "next_rooms": 1,
+            "most_common_next": {"$first": "$next_rooms.room_id"}
+        }},
+        {"$sort": {"transitions": -1}}
+    ]
+    return await db[ROOM_EVENTS_COLLECTION].aggregate(pipeline).to_list(None)
+
+def attach_room_names(rows: List[dict], rooms: List[dict]) -> List[dict]:
+    names: Dict[str, str] = {room["id"]: room.get("name") for room in rooms}
+    for row in rows:
+        row["room_name"] = names.get(row["room_id"])
+        for next_room in row.get("next_rooms", []):
+            next_room["room_name"] = names.get(next_room["room_id"])
+    return rows
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReplaceOne
+
+ROOMS_COLLECTION = "rooms"
+ROOM_MEDIA_FIELDS = ("photos", "panorama_photo")
+ROOM_PROJECTION = {"_id": 0, "property_id": 0, "order": 0}
+ROOM_MIGRATION_BATCH_SIZE = 100
+# rooms_split holds this while a worker moves the embedded rooms; a claim older than the timeout is abandoned
+ROOMS_MIGRATING = "migrating"
+ROOM_CLAIM_TIMEOUT_SECONDS = 60
+ROOM_CLAIM_WAIT_SECONDS = 0.1
+# how long a save waits for the migration to release a listing before answering 409
+ROOM_CLAIM_PATIENCE_SECONDS = 1.5
+
+def is_split(property_doc: Dict) -> bool:
+    return property_doc.get("rooms_split") is True
+
+def room_skeleton(room: Dict) -> Dict:
+    skeleton = {k: v for k, v in room.items() if k not in ROOM_MEDIA_FIELDS}
+    skeleton["photo_count"] = len(room.get("photos") or [])
+    skeleton["has_panorama"] = bool(room.get("panorama_photo"))
+    return skeleton
+
+def room_documents(property_id: str, rooms: List[Dict]) -> List[Dict]:
+    docs = []
+    for order, room in enumerate(rooms):
+        doc = {k: v for k, v in room.items() if k not in ("photo_count", "has_panorama")}
+        doc.update(property_id=property_id, order=order)
+        docs.append(doc)
+    return docs
+
+async def save_rooms(db, property_id: str, rooms: List[Dict]) -> List[Dict]:
+    """Stores full rooms in their own collection and returns the skeletons to embed in the property."""
+    docs = room_documents(property_id, rooms)
+    if docs:
+        await db[ROOMS_COLLECTION].bulk_write(
+            [ReplaceOne({"property_id": property_id, "id": doc["id"]}, doc, upsert=True) for doc in docs],
+            ordered=False
+        )
+    await db[ROOMS_COLLECTION].delete_many({"property_id": property_id, "id": {"$nin": [doc["id"] for doc in docs]}})
+    return [room_skeleton(room) for room in rooms]
+
+async def load_room(db, property_id: str, room_id: str) -> Optional[Dict]:
+    return await db[ROOMS_COLLECTION].find_one({"property_id": property_id, "id": room_id}, ROOM_PROJECTION)
+
+def skeleton_property(property_doc: Dict) -> Dict:
+    if not is_split(property_doc):
+        property_doc["rooms"] = [room_skeleton(room) for room in property_doc.get("rooms", [])]
+    return property_doc
+
+async def attach_rooms(db, properties: Iterable[Dict]) -> List[Dict]:
+    """Replaces embedded skeletons with the full rooms, one query for the whole list."""
+    properties = list(properties)
+    split_ids = [p["id"] for p in properties if is_split(p)]
+    if not split_ids:
+        return properties
+    rooms: Dict[str, List[Dict]] = {pid: [] for pid in split_ids}
+    cursor = db[ROOMS_COLLECTION].find(
+        {"property_id": {"$in": split_ids}}, {"_id": 0, "order": 0}
+    ).sort([("property_id", 1), ("order", 1)])
+    async for room in cursor:
+        rooms[room.pop("property_id")].append(room)
+    for property_doc in properties:
+        if is_split(property_doc):
+            property_doc["rooms"] = rooms[property_doc["id"]]
+    return properties
+
+def with_room_ids(rooms: List[Dict]) -> List[Dict]:
+    """Legacy rooms may predate room ids; give them one so they can be stored and addressed."""
+    return [room if room.get("id") else {**room, "id": str(uuid.uuid4())} for room in rooms]
+
+def _claimable(now: datetime) -> Dict:
+    return {"$or": [
+        {"rooms_split": {"$nin": [True, ROOMS_MIGRATING]}},
+        {"rooms_split": ROOMS_MIGRATING, "rooms_split_claimed_at": {"$lt": now - timedelta(seconds=ROOM_CLAIM_TIMEOUT_SECONDS)}}
+    ]}
+
+async def _claim(db, query: Dict, projection: Dict) -> Optional[Dict]:
+    now = datetime.now(timezone.utc)
+    return await db.properties.find_one_and_update(
+        {**query, **_claimable(now)},
+        {"$set": {"rooms_split": ROOMS_MIGRATING, "rooms_split_claimed_at": now}},
+        projection=projection
+    )
+
+async def claim_unsplit_rooms(db, property_id: str, attempts: int = int(ROOM_CLAIM_PATIENCE_SECONDS / ROOM_CLAIM_WAIT_SECONDS)) -> bool:
+    """Keeps the startup migration away from a listing whose rooms are about to be saved.
+
+    Returns once the listing is split or claimed by the caller, who must then set
+    rooms_split to True; False if another claim is still running, so the request
+    can be retried rather than held open.
+    """
+    for _ in range(attempts):
+        if await _claim(db, {"id": property_id}, {"_id": 1}):
+            return True
+        current = await db.properties.find_one({"id": property_id}, {"_id": 0, "rooms_split": 1})
+        if current is None or is_split(current):
+            return True
+        await asyncio.sleep(ROOM_CLAIM_WAIT_SECONDS)
+    return False
+
+async def split_embedded_rooms(db) -> int:
+    migrated = 0
+    cursor = db.properties.find({"rooms_split": {"$ne": True}}, {"_id": 1}, batch_size=ROOM_MIGRATION_BATCH_SIZE)
+    async for candidate in cursor:
+        # claim each listing on its own, so a concurrent update_property never has its rooms overwritten
+        property_doc = await _claim(db, {"_id": candidate["_id"]}, {"_id": 1, "id": 1, "rooms": 1})
+        if property_doc is None:
+            continue
+        skeletons = await save_rooms(db, property_doc["id"], with_room_ids(property_doc.get("rooms") or []))
+        result = await db.properties.update_one(
+            {"_id": property_doc["_id"], "rooms_split": ROOMS_MIGRATING},
+            {"$set": {"rooms": skeletons, "rooms_split": True}, "$unset": {"rooms_split_claimed_at": ""}}
+        )
+        migrated += result.modified_count
+    if migrated:
+        logging.info(f"Moved rooms of {migrated} properties into the rooms collection")
+    return migrated
+
+async def first_room_photo(db, property_doc: Dict) -> Optional[str]:
+    """Hero image for listings without a cover, since skeleton rooms carry no photos."""
+    if not is_split(property_doc):
+        return next((room["photos"][0] for room in property_doc.get("rooms", []) if room.get("photos")), None)
+    room = await db[ROOMS_COLLECTION].find_one(
+        {"property_id": property_doc["id"], "photos.0": {"$exists": True}},
+        {"_id": 0, "photos": {"$slice": 1}},
+        sort=[("order", 1)]
+    )
+    return room["photos"][0] if room else None
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+LEASES_COLLECTION = "scheduler_leases"
+RUNS_COLLECTION = "job_runs"
+SCHEDULER_TICK_SECONDS = 15
+
+JobFunc = Callable[[], Awaitable[dict]]
+
+class Job:
+    def __init__(self, name: str, interval_seconds: float, func: JobFunc):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.runs = 0
+        self.failures = 0
+        self.not_leader = 0
+        self.leases_lost = 0
+        self.last_status: Optional[str] = None
+        self.last_started_at: Optional[str] = None
+        self.last_duration_ms = 0.0
+        self.total_duration_ms = 0.0
+
+    def metrics(self) -> dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "not_leader": self.not_leader,
+            "leases_lost": self.leases_lost,
+            "last_status": self.last_status,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": self.last_duration_ms,
+            "avg_duration_ms": self.total_duration_ms / self.runs if self.runs else 0.0
+        }
+
+class Scheduler:
+    def __init__(self, db, lease_seconds: float = 300, tick_seconds: float = SCHEDULER_TICK_SECONDS):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.tick_seconds = tick_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, Job] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, interval_seconds: float, func: JobFunc) -> Job:
+        job = Job(name, interval_seconds, func)
+        self.jobs[name] = job
+        return job
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            for name in list(self.jobs):
+                try:
+                    await self.run(name)
+                except Exception as e:
+                    logging.error(f"Scheduler tick failed for {name}: {e}")
+            await asyncio.sleep(self.tick_seconds)
+
+    async def _acquire(self, name: str, now: datetime, force: bool) -> bool:
+        query = {"_id": name, "locked_until": {"$lte": now}}
+        if not force:
+            query["next_run_at"] = {"$lte": now}
+        try:
+            lease = await self.db[LEASES_COLLECTION].find_one_and_update(
+                query,
+                {
+                    "$set": {"owner": self.owner, "locked_until": now + timedelta(seconds=self.lease_seconds)},
+                    "$setOnInsert": {"next_run_at": now}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False
+        return lease is not None and lease["owner"] == self.owner
+
+    async def _renew(self, name: str) -> bool:
+        result = await self.db[LEASES_COLLECTION].update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    async def _heartbeat(self, name: str, work: asyncio.Task):
+        """Extends the lease while the job runs; if it was lost, the job is cancelled so two workers never overlap."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self._renew(name)
+            except Exception as e:
+                logging.warning(f"Lease renewal for {name} failed: {e}")
+                continue
+            if not renewed:
+                self.jobs[name].leases_lost += 1
+                logging.error(f"Job {name} lost its lease, cancelling this run")
+                work.cancel()
+                return
+
+    async def _release(self, name: str, next_run_at: datetime):
+        await self.db[LEASES_COLLECTION].update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {"locked_until": datetime.now(timezone.utc), "next_run_at": next_run_at}}
+        )
+
+    async def run(self, name: str, force: bool = False) -> Optional[dict]:
+        """Runs the job if this worker wins its lease; returns None when another worker holds it."""
+        job = self.jobs[name]
+        now = datetime.now(timezone.utc)
+        if not await self._acquire(name, now, force):
+            if force:
+                job.not_leader += 1
+            return None
+        started = time.perf_counter()
+        run = {"job": name, "owner": self.owner, "started_at": now}
+        work = asyncio.ensure_future(job.func())
+        heartbeat = asyncio.create_task(self._heartbeat(name, work))
+        try:
+            result = await work
+            run.update(status="ok", result=result)
+            job.last_status = "ok"
+            return result
+        except asyncio.CancelledError:
+            if not heartbeat.done() or heartbeat.cancelled():
+                raise
+            run.update(status="lease_lost")
+            job.last_status = "lease_lost"
+            return None
+        except Exception as e:
+            run.update(status="failed", error=str(e))
+            job.failures += 1
+            job.last_status = "failed"
+            logging.error(f"Job {name} failed: {e}")
+            raise
+        finally:
+            heartbeat.cancel()
+            duration_ms = (time.perf_counter() - started) * 1000
+            job.runs += 1
+            job.last_started_at = now.isoformat()
+            job.last_duration_ms = duration_ms
+            job.total_duration_ms += duration_ms
+            run.update(finished_at=datetime.now(timezone.utc), duration_ms=duration_ms)
+            try:
+                await self.db[RUNS_COLLECTION].insert_one(run)
+            finally:
+                await self._release(name, now + timedelta(seconds=job.interval_seconds))
+
+    async def history(self, name: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = {"job": name} if name else {}
+        cursor = self.db[RUNS_COLLECTION].find(query, {"_id": 0}).sort("started_at", -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    def metrics(self) -> dict:
+        return {"owner": self.owner, "jobs": {name: job.metrics() for name, job in self.jobs.items()}}
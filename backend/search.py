@@ -0,0 +1,106 @@
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+from serialization import dumps
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
+SEARCH_SORT_FIELDS = ("created_at", "price", "square_meters")
+SEARCH_MAX_LIMIT = 100
+FACET_FIELDS = {"cities": "$city", "districts": "$district", "room_counts": "$room_count"}
+FACET_LIMIT = 50
+RANGE_FILTERS = {
+    "price": ("price_min", "price_max"),
+    "square_meters": ("sqm_min", "sqm_max"),
+    "building_age": ("building_age_min", "building_age_max"),
+}
+EQUALITY_FILTERS = ("city", "district", "room_count", "property_type", "view_type")
+
+class SearchError(ValueError):
+    pass
+
+def encode_cursor(value: Any, property_id: str) -> str:
+    return base64.urlsafe_b64encode(dumps([value, property_id])).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        value, property_id = _loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise SearchError("invalid cursor")
+    if not isinstance(property_id, str):
+        raise SearchError("invalid cursor")
+    return value, property_id
+
+def search_filter(user_id: str, filters: Dict[str, Any]) -> Dict:
+    query: Dict[str, Any] = {"user_id": user_id}
+    for field in EQUALITY_FILTERS:
+        value = filters.get(field)
+        if value:
+            query[field] = {"$in": value} if isinstance(value, list) else value
+    for field, (low, high) in RANGE_FILTERS.items():
+        bounds = {}
+        if filters.get(low) is not None:
+            bounds["$gte"] = filters[low]
+        if filters.get(high) is not None:
+            bounds["$lte"] = filters[high]
+        if bounds:
+            query[field] = bounds
+    if filters.get("q"):
+        query["$text"] = {"$search": filters["q"], "$language": "turkish"}
+    return query
+
+def keyset_filter(sort: str, direction: int, cursor: Optional[str]) -> Optional[Dict]:
+    if not cursor:
+        return None
+    value, property_id = decode_cursor(cursor)
+    op = "$gt" if direction == 1 else "$lt"
+    ties = {sort: value, "id": {op: property_id}}
+    # missing and null values sort before every number and $gt/$lt never match them,
+    # so they are paged explicitly: first when ascending, last when descending
+    if value is None:
+        return {"$or": [{sort: {"$ne": None}}, ties]} if direction == 1 else {"$or": [ties]}
+    after = [{sort: {op: value}}, ties]
+    if direction == -1:
+        after.append({sort: None})
+    return {"$or": after}
+
+async def search_properties(db, user_id: str, filters: Dict[str, Any], sort: str = "created_at", order: str = "desc",
+                            limit: int = 20, cursor: Optional[str] = None, facets: bool = False,
+                            projection: Optional[Dict] = None) -> Dict:
+    if sort not in SEARCH_SORT_FIELDS:
+        raise SearchError("invalid sort")
+    direction = 1 if order == "asc" else -1
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    query = search_filter(user_id, filters)
+    keyset = keyset_filter(sort, direction, cursor)
+    page_query = {**query, **keyset} if keyset else query
+    find = db.properties.find(page_query, projection or {"_id": 0}).sort([(sort, direction), ("id", direction)]).limit(limit + 1)
+    items = await find.to_list(limit + 1)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1].get(sort), items[-1]["id"])
+    result = {"items": items, "next_cursor": next_cursor}
+    if facets:
+        result["facets"] = await search_facets(db, query)
+    return result
+
+async def search_facets(db, query: Dict) -> Dict[str, Any]:
+    facet_stages: Dict[str, List[Dict]] = {
+        name: [{"$sortByCount": expr}, {"$limit": FACET_LIMIT}] for name, expr in FACET_FIELDS.items()
+    }
+    facet_stages["total"] = [{"$count": "n"}]
+    rows = await db.properties.aggregate([{"$match": query}, {"$facet": facet_stages}]).to_list(1)
+    row = rows[0] if rows else {}
+    facets = {
+        name: [{"value": bucket["_id"], "count": bucket["count"]} for bucket in row.get(name, []) if bucket["_id"] is not None]
+        for name in FACET_FIELDS
+    }
+    total = row.get("total", [])
+    facets["total"] = total[0]["n"] if total else 0
+    return facets
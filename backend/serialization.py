@@ -0,0 +1,79 @@
+import json
+from inspect import isclass
+from typing import Any, Dict, List, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+_PLANS: Dict[type, List[tuple]] = {}
+
+def _nested_model(annotation) -> tuple:
+    origin = get_origin(annotation)
+    if origin is Union:
+        for arg in get_args(annotation):
+            if arg is not type(None):
+                return _nested_model(arg)
+        return None, False
+    if origin in (list, List):
+        args = get_args(annotation)
+        if args and isclass(args[0]) and issubclass(args[0], BaseModel):
+            return args[0], True
+        return None, False
+    if isclass(annotation) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+def _plan(model: Type[BaseModel]) -> List[tuple]:
+    plan = _PLANS.get(model)
+    if plan is None:
+        plan = []
+        for name, field in model.model_fields.items():
+            nested, many = _nested_model(field.annotation)
+            plan.append((name, field.is_required(), field, nested, many))
+        _PLANS[model] = plan
+    return plan
+
+def trusted_dump(model: Type[BaseModel], doc: Dict[str, Any]) -> Dict[str, Any]:
+    if isinstance(doc, BaseModel):
+        return doc.model_dump()
+    out = {}
+    for name, required, field, nested, many in _plan(model):
+        if name in doc:
+            value = doc[name]
+            if nested is not None and value is not None:
+                if many:
+                    value = [trusted_dump(nested, v) for v in value]
+                else:
+                    value = trusted_dump(nested, value)
+        elif required:
+            continue
+        else:
+            value = field.get_default(call_default_factory=True)
+        out[name] = value
+    return out
@@ -1,14 +1,17 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, Query, Request, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
 import logging
 import asyncio
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
@@ -18,6 +21,50 @@ import base64
 from io import BytesIO
 import httpx
 import hashlib
+import re
+import tempfile
+import time
+from serialization import FastJSONResponse, dumps, loads, trusted_dump
+from compression import CompressionMiddleware, precompressed_response
+from response_cache import ResponseCache
+from exports import (
+    EXPORT_BATCH_SIZE, EXPORT_FORMATS, PROPERTY_EXPORT_FIELDS, VISIT_EXPORT_FIELDS, VISITOR_EXPORT_FIELDS,
+    backfill_visit_owners, export_projection, export_stream
+)
+from rollups import agent_daily_views, day_key, property_daily_stats, range_start, record_visit_rollup
+from visit_buffer import VisitBuffer
+from room_events import (
+    ROOM_EVENT_KINDS, attach_room_names, as_utc, build_room_event, ensure_room_events_collection,
+    room_heatmap, room_transitions, validate_room_event
+)
+from telemetry import BeaconError, build_telemetry, parse_beacon
+from visitor_sketches import add_unique_visitors, unique_visitor_count, unique_visitor_keys
+from live_feed import LiveFeedHub, sse_stream
+from admin_stats import AdminStatsSnapshot
+from indexes import apply_indexes, check_query_plans
+from scheduler import Scheduler
+from mongo_config import PoolMetrics, RecentWrites, client_options, read_preference
+from rooms import (
+    attach_rooms, claim_unsplit_rooms, first_room_photo, load_room, room_documents, room_skeleton, save_rooms,
+    skeleton_property, split_embedded_rooms
+)
+from search import SearchError, search_properties
+from geo import (
+    MAX_NEARBY_KM, backfill_geo, geo_point, nearby_properties, nearest_pois, poi_documents, property_pois,
+    save_pois
+)
+from imports import ImportRowError, PropertyImporter, UploadLimitMiddleware, detect_format, get_job as get_import_job
+from tour_manifest import ASSET_FETCH_TIMEOUT, MANIFESTS_COLLECTION, public_manifest, refresh_manifest
+from deletions import DeletionRunner, get_deletion, list_deletions
+from cache_bus import CacheInvalidationBus, enable_pre_images, ensure_invalidation_log, publish_invalidation
+from cache_backend import RateLimiter, SharedCache, backend_from_url
+from loop_monitor import LoopBlockingMiddleware, LoopLagMonitor
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY, MongoCommandMetrics, PrometheusMiddleware,
+    bunny_duration, bunny_failures, image_duration, stats_gauge
+)
+from maintenance import cleanup_free_properties as cleanup_expired_free_properties
+from maintenance import expire_subscriptions, purge_reset_tokens, reconcile_property_counts
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -39,16 +86,21 @@ async def upload_to_bunny(file_content: bytes, file_path: str, content_type: str
             "Content-Type": content_type,
             "Checksum": checksum
         }
+        start = time.perf_counter()
         async with httpx.AsyncClient() as client:
             response = await client.put(url, content=file_content, headers=headers, timeout=60.0)
-        if response.status_code == 201:
+        ok = response.status_code == 201
+        bunny_duration.observe(time.perf_counter() - start, operation="upload", outcome="ok" if ok else "error")
+        if ok:
             cdn_url = f"https://{BUNNY_CDN_HOSTNAME}/{file_path}"
             logging.info(f"Uploaded to Bunny CDN: {cdn_url}")
             return cdn_url
         else:
+            bunny_failures.inc(operation="upload")
             logging.error(f"Bunny upload failed: {response.status_code} - {response.text}")
             return None
     except Exception as e:
+        bunny_failures.inc(operation="upload")
         logging.error(f"Bunny upload error: {e}")
         return None
 
@@ -58,10 +110,16 @@ async def delete_from_bunny(file_path: str) -> bool:
     try:
         url = f"https://{BUNNY_STORAGE_REGION}/{BUNNY_STORAGE_ZONE}/{file_path}"
         headers = {"AccessKey": BUNNY_API_KEY}
+        start = time.perf_counter()
         async with httpx.AsyncClient() as client:
             response = await client.delete(url, headers=headers, timeout=30.0)
-        return response.status_code in [200, 204]
+        ok = response.status_code in [200, 204]
+        bunny_duration.observe(time.perf_counter() - start, operation="delete", outcome="ok" if ok else "error")
+        if not ok:
+            bunny_failures.inc(operation="delete")
+        return ok
     except Exception as e:
+        bunny_failures.inc(operation="delete")
         logging.error(f"Bunny delete error: {e}")
         return False
 
@@ -132,6 +190,7 @@ def compress_base64_image(base64_string: str, max_size_kb: int = 500) -> str:
             return base64_string
         try:
             from PIL import Image
+            start = time.perf_counter()
             img = Image.open(BytesIO(image_data))
             if img.mode in ('RGBA', 'P'):
                 img = img.convert('RGB')
@@ -150,6 +209,7 @@ def compress_base64_image(base64_string: str, max_size_kb: int = 500) -> str:
                     break
                 quality -= 10
             compressed_data = base64.b64encode(output.getvalue()).decode()
+            image_duration.observe(time.perf_counter() - start, step="compress")
             return f"data:image/jpeg;base64,{compressed_data}"
         except ImportError:
             logging.warning("PIL not available for image compression")
@@ -168,20 +228,67 @@ def compress_room_photos(rooms: List[Dict]) -> List[Dict]:
 
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 MONGO_DB = os.environ.get('MONGO_DB', 'mekan360')
+ROOM_EVENTS_TTL_DAYS = int(os.environ.get('ROOM_EVENTS_TTL_DAYS', '180'))
+MONGO_PUBLIC_READ_PREFERENCE = os.environ.get('MONGO_PUBLIC_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_PUBLIC_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_PUBLIC_MAX_STALENESS_SECONDS', '-1'))
+MONGO_PRIMARY_AFTER_WRITE_SECONDS = float(os.environ.get(
+    'MONGO_PRIMARY_AFTER_WRITE_SECONDS', str(max(30, MONGO_PUBLIC_MAX_STALENESS_SECONDS))
+))
+MONGO_CLIENT_OPTIONS = client_options(os.environ)
 
 client: AsyncIOMotorClient = None
 db = None
+public_db = None
+mongo_pool_metrics = PoolMetrics()
+recent_writes = RecentWrites(MONGO_PRIMARY_AFTER_WRITE_SECONDS)
+mongo_command_metrics = MongoCommandMetrics()
 
 async def connect_db():
-    global client, db
-    client = AsyncIOMotorClient(MONGO_URL)
+    global client, db, public_db
+    client = AsyncIOMotorClient(
+        MONGO_URL, event_listeners=[mongo_pool_metrics, mongo_command_metrics], **MONGO_CLIENT_OPTIONS
+    )
     db = client[MONGO_DB]
-    await db.users.create_index("email", unique=True)
-    await db.properties.create_index("user_id")
-    await db.visitors.create_index([("property_id", 1), ("phone", 1)])
-    await db.groups.create_index("user_id")
+    public_db = client.get_database(
+        MONGO_DB,
+        read_preference=read_preference(MONGO_PUBLIC_READ_PREFERENCE, MONGO_PUBLIC_MAX_STALENESS_SECONDS)
+    )
+    await ensure_room_events_collection(db, ttl_days=ROOM_EVENTS_TTL_DAYS)
+    spawn_background(migrate_db())
     logging.info(f"Connected to MongoDB: {MONGO_DB}")
 
+def normalize_phone(phone: str) -> str:
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 12 and digits.startswith("90"):
+        digits = digits[2:]
+    elif len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    return digits or (phone or "").strip()
+
+async def backfill_visitor_phones():
+    cursor = db.visitors.find({"phone_normalized": {"$exists": False}}, {"_id": 1, "phone": 1}, batch_size=1000)
+    ops = []
+    async for visitor in cursor:
+        ops.append(UpdateOne({"_id": visitor["_id"]}, {"$set": {"phone_normalized": normalize_phone(visitor.get("phone", ""))}}))
+        if len(ops) >= 1000:
+            await db.visitors.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.visitors.bulk_write(ops, ordered=False)
+
+async def migrate_db():
+    try:
+        await backfill_visitor_phones()
+        report = await apply_indexes(db)
+        logging.info(f"Indexes applied: {len(report['created'])} ok, {len(report['failed'])} failed")
+        await split_embedded_rooms(db)
+        await backfill_geo(db)
+        await backfill_visit_owners(db)
+        if CACHE_INVALIDATION != "off":
+            await enable_pre_images(db)
+    except Exception as e:
+        logging.error(f"Database migration failed: {e}")
+
 async def close_db():
     global client
     if client:
@@ -190,10 +297,118 @@ async def close_db():
 JWT_SECRET = os.environ.get('JWT_SECRET', 'homeview-pro-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+LIVE_TICKET_AUDIENCE = "live_feed"
+LIVE_TICKET_SECONDS = 60
 
 RESEND_API_KEY = os.environ.get('RESEND_API_KEY')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', 'onboarding@resend.dev')
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'https://mekan360.com.tr')
+FAST_JSON_ENABLED = os.environ.get('FAST_JSON', 'true').lower() in ('1', 'true', 'yes')
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+LOOP_MONITOR_ENABLED = os.environ.get('LOOP_MONITOR', 'true').lower() in ('1', 'true', 'yes')
+LOOP_LAG_INTERVAL_MS = float(os.environ.get('LOOP_LAG_INTERVAL_MS', '100'))
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get('LOOP_LAG_THRESHOLD_MS', '250'))
+LOOP_BLOCKING_BUDGET_MS = os.environ.get('LOOP_BLOCKING_BUDGET_MS')
+PUBLIC_CACHE_TTL = float(os.environ.get('PUBLIC_CACHE_TTL', '60'))
+PUBLIC_CACHE_MAX_ENTRIES = int(os.environ.get('PUBLIC_CACHE_MAX_ENTRIES', '1024'))
+CACHE_INVALIDATION = os.environ.get('CACHE_INVALIDATION', 'auto').lower()
+CACHE_BACKEND_URL = os.environ.get('CACHE_BACKEND_URL', 'memory://')
+CACHE_PREFIX = os.environ.get('CACHE_PREFIX', 'mekan360:')
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', '15'))
+LOGIN_RATE_LIMIT = int(os.environ.get('LOGIN_RATE_LIMIT', '10'))
+LOGIN_RATE_WINDOW = float(os.environ.get('LOGIN_RATE_WINDOW', '300'))
+PASSWORD_RESET_RATE_LIMIT = int(os.environ.get('PASSWORD_RESET_RATE_LIMIT', '5'))
+PASSWORD_RESET_RATE_WINDOW = float(os.environ.get('PASSWORD_RESET_RATE_WINDOW', '3600'))
+
+VISIT_BUFFER_ENABLED = os.environ.get('VISIT_BUFFER', 'true').lower() in ('1', 'true', 'yes')
+VISIT_BUFFER_MAX_EVENTS = int(os.environ.get('VISIT_BUFFER_MAX_EVENTS', '500'))
+VISIT_BUFFER_FLUSH_MS = int(os.environ.get('VISIT_BUFFER_FLUSH_MS', '1000'))
+VISIT_BUFFER_MAX_PENDING = int(os.environ.get('VISIT_BUFFER_MAX_PENDING', '50000'))
+ADMIN_STATS_TTL = float(os.environ.get('ADMIN_STATS_TTL', '300'))
+IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', str(512 * 1024 * 1024)))
+IMPORT_UPLOAD_CHUNK = 1024 * 1024
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER', 'true').lower() in ('1', 'true', 'yes')
+SCHEDULER_LEASE_SECONDS = float(os.environ.get('SCHEDULER_LEASE_SECONDS', '300'))
+BACKGROUND_TASK_GRACE_SECONDS = float(os.environ.get('BACKGROUND_TASK_GRACE_SECONDS', '30'))
+JOB_INTERVALS = {
+    "free_property_cleanup": float(os.environ.get('JOB_FREE_CLEANUP_INTERVAL', '3600')),
+    "subscription_expiry": float(os.environ.get('JOB_SUBSCRIPTION_EXPIRY_INTERVAL', '900')),
+    "reset_token_purge": float(os.environ.get('JOB_RESET_TOKEN_PURGE_INTERVAL', '3600')),
+    "property_count_reconcile": float(os.environ.get('JOB_PROPERTY_COUNT_INTERVAL', '86400')),
+    "deletion_resume": float(os.environ.get('JOB_DELETION_RESUME_INTERVAL', '300')),
+}
+
+public_cache = ResponseCache(max_entries=PUBLIC_CACHE_MAX_ENTRIES, ttl_seconds=PUBLIC_CACHE_TTL)
+cache_backend = backend_from_url(CACHE_BACKEND_URL, prefix=CACHE_PREFIX)
+shared_public_cache = SharedCache(cache_backend, "public", PUBLIC_CACHE_TTL)
+login_limiter = RateLimiter(cache_backend, "login", LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW)
+password_reset_limiter = RateLimiter(cache_backend, "password_reset", PASSWORD_RESET_RATE_LIMIT, PASSWORD_RESET_RATE_WINDOW)
+
+def cache_stats() -> Dict[str, dict]:
+    return {"public": public_cache.stats(), "shared": cache_backend.metrics()}
+
+stats_gauge("mekan360_cache_hits", "Cache hits since start.", cache_stats, "hits")
+stats_gauge("mekan360_cache_misses", "Cache misses since start.", cache_stats, "misses")
+stats_gauge("mekan360_cache_hit_ratio", "Cache hit ratio since start.", cache_stats, "hit_ratio")
+METRICS_REGISTRY.gauge(
+    "mekan360_mongo_pool_checked_out", "MongoDB connections checked out per server.", ("server",),
+    lambda: {(address,): pool["checked_out"] for address, pool in mongo_pool_metrics.snapshot().items()}
+)
+visit_buffer: Optional[VisitBuffer] = None
+scheduler: Optional[Scheduler] = None
+deletions: Optional[DeletionRunner] = None
+cache_bus: Optional[CacheInvalidationBus] = None
+background_tasks: Set[asyncio.Task] = set()
+live_feed = LiveFeedHub()
+loop_monitor = LoopLagMonitor(
+    interval=LOOP_LAG_INTERVAL_MS / 1000,
+    threshold=LOOP_LAG_THRESHOLD_MS / 1000,
+    budget=float(LOOP_BLOCKING_BUDGET_MS) / 1000 if LOOP_BLOCKING_BUDGET_MS else None
+)
+
+def public_reader(*tags: str):
+    """Secondary-friendly database for public reads, or the primary if any of the tags was just written."""
+    if recent_writes.recent(*tags):
+        recent_writes.primary_reads += 1
+        return db
+    return public_db
+
+async def invalidate_cache(*tags: str) -> int:
+    recent_writes.mark(tags)
+    removed = public_cache.invalidate_tags(*tags)
+    await cache_backend.invalidate_tags(*tags)
+    if cache_bus is not None:
+        cache_bus.publish(tags)
+    elif tags and db is not None:
+        # CLI processes run without a bus; workers pick the tags up from the invalidation log
+        try:
+            await ensure_invalidation_log(db)
+            await publish_invalidation(db, list(tags))
+        except PyMongoError as e:
+            logging.warning(f"Cache invalidation not published: {e}")
+    return removed
+
+async def apply_cache_invalidation(tags: Optional[List[str]]):
+    recent_writes.mark(tags)
+    if tags is None:
+        public_cache.clear()
+        await cache_backend.clear()
+    else:
+        public_cache.invalidate_tags(*tags)
+        await cache_backend.invalidate_tags(*tags)
+
+async def cached_public_payload(cache_key: str, build):
+    """Serves from this worker's cache, then the shared backend if there is one; only one caller rebuilds a miss."""
+    payload = public_cache.get(cache_key)
+    if payload is None:
+        # a build that overlaps an invalidation of its tags is served once but never cached
+        generation = public_cache.generation
+        body, tags = await shared_public_cache.get_or_build(
+            cache_key, build, fresh=lambda tags: not public_cache.is_stale(tags, generation), generation=generation
+        )
+        payload = public_cache.set(cache_key, body, tags=tags, generation=generation)
+    return payload
 
 app = FastAPI(title="Mekan360 API")
 api_router = APIRouter(prefix="/api")
@@ -202,10 +417,64 @@ security = HTTPBearer()
 
 @app.on_event("startup")
 async def startup():
+    global visit_buffer, scheduler, deletions, cache_bus
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
     await connect_db()
+    cache_bus = CacheInvalidationBus(db, apply_cache_invalidation, CACHE_INVALIDATION)
+    cache_bus.start()
+    deletions = DeletionRunner(db, delete_folder=delete_from_bunny if BUNNY_ENABLED else None)
+    if VISIT_BUFFER_ENABLED:
+        visit_buffer = VisitBuffer(
+            db,
+            max_events=VISIT_BUFFER_MAX_EVENTS,
+            flush_interval_ms=VISIT_BUFFER_FLUSH_MS,
+            max_pending=VISIT_BUFFER_MAX_PENDING,
+            publisher=live_feed.publish
+        )
+        visit_buffer.start()
+    admin_stats_snapshot.start(db)
+    scheduler = Scheduler(db, lease_seconds=SCHEDULER_LEASE_SECONDS)
+    scheduler.register("free_property_cleanup", JOB_INTERVALS["free_property_cleanup"], run_free_property_cleanup)
+    scheduler.register("subscription_expiry", JOB_INTERVALS["subscription_expiry"], run_subscription_expiry)
+    scheduler.register("reset_token_purge", JOB_INTERVALS["reset_token_purge"], lambda: purge_reset_tokens(db))
+    scheduler.register("property_count_reconcile", JOB_INTERVALS["property_count_reconcile"], lambda: reconcile_property_counts(db))
+    scheduler.register("deletion_resume", JOB_INTERVALS["deletion_resume"], lambda: deletions.resume())
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+
+def spawn_background(coro) -> asyncio.Task:
+    """Runs work that outlives its request; the loop only keeps weak references to tasks."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def stop_background_tasks():
+    if not background_tasks:
+        return
+    _, pending = await asyncio.wait(list(background_tasks), timeout=BACKGROUND_TASK_GRACE_SECONDS)
+    for task in pending:
+        # deletion jobs are resumed from their checkpoint and imports are marked failed on cancel
+        task.cancel()
+    if pending:
+        logging.warning(f"Cancelled {len(pending)} background tasks at shutdown")
+        await asyncio.gather(*pending, return_exceptions=True)
 
 @app.on_event("shutdown")
 async def shutdown():
+    if scheduler is not None:
+        await scheduler.stop()
+    await stop_background_tasks()
+    if cache_bus is not None:
+        await cache_bus.stop()
+    await cache_backend.close()
+    await loop_monitor.stop()
+    await admin_stats_snapshot.stop()
+    if visit_buffer is not None:
+        await visit_buffer.stop()
+    if manifest_builds:
+        await asyncio.wait(list(manifest_builds.values()), timeout=ASSET_FETCH_TIMEOUT)
     await close_db()
 
 PACKAGES = {
@@ -254,6 +523,8 @@ PACKAGES = {
     }
 }
 
+admin_stats_snapshot = AdminStatsSnapshot(PACKAGES.keys(), ttl_seconds=ADMIN_STATS_TTL)
+
 class UserCreate(BaseModel):
     email: EmailStr
     password: str
@@ -333,6 +604,30 @@ class RoomData(BaseModel):
     connections: List[str] = []
     hotspots: List[HotspotData] = []
 
+class RoomSkeleton(BaseModel):
+    id: str
+    name: str
+    room_type: str
+    position_x: int
+    position_y: int
+    floor: int = 0
+    square_meters: Optional[float] = None
+    facing_direction: Optional[str] = None
+    connections: List[str] = []
+    hotspots: List[HotspotData] = []
+    photo_count: int = 0
+    has_panorama: bool = False
+
+class GeoPoint(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class PoiData(BaseModel):
+    type: str = "other"
+    name: str
+    distance: Optional[Union[str, float]] = None
+    coordinates: Optional[GeoPoint] = None
+
 class PropertyCreate(BaseModel):
     title: str
     description: Optional[str] = None
@@ -352,7 +647,8 @@ class PropertyCreate(BaseModel):
     view_type: str = "regular"
     rooms: List[RoomData] = []
     entry_room_id: Optional[str] = None
-    pois: List[Dict] = []
+    pois: List[PoiData] = []
+    coordinates: Optional[GeoPoint] = None
     cover_image: Optional[str] = None
 
 class PropertyUpdate(BaseModel):
@@ -374,7 +670,8 @@ class PropertyUpdate(BaseModel):
     view_type: Optional[str] = None
     rooms: Optional[List[RoomData]] = None
     entry_room_id: Optional[str] = None
-    pois: Optional[List[Dict]] = None
+    pois: Optional[List[PoiData]] = None
+    coordinates: Optional[GeoPoint] = None
     cover_image: Optional[str] = None
 
 class AgentInfo(BaseModel):
@@ -409,6 +706,7 @@ class PropertyResponse(BaseModel):
     rooms: List[RoomData] = []
     entry_room_id: Optional[str] = None
     pois: List[Dict] = []
+    coordinates: Optional[GeoPoint] = None
     cover_image: Optional[str] = None
     view_count: int = 0
     total_view_duration: int = 0
@@ -417,6 +715,10 @@ class PropertyResponse(BaseModel):
     share_link: str
     agent: Optional[AgentInfo] = None
 
+class PropertySkeletonResponse(PropertyResponse):
+    rooms: List[RoomSkeleton] = []
+    cover_fallback: Optional[str] = None
+
 class VisitorCreate(BaseModel):
     property_id: str
     first_name: str
@@ -440,6 +742,16 @@ class VisitCreate(BaseModel):
     duration: int
     rooms_visited: List[str] = []
 
+class RoomEventData(BaseModel):
+    room_id: str
+    event: str
+    timestamp: datetime
+
+class RoomEventBatch(BaseModel):
+    property_id: str
+    visitor_id: str
+    events: List[RoomEventData] = Field(..., max_length=500)
+
 class AdminLogin(BaseModel):
     email: str
     password: str
@@ -512,16 +824,47 @@ def create_token(user_id: str, is_admin: bool = False) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await resolve_user(credentials.credentials)
+
+TOO_MANY_ATTEMPTS = "Cok fazla deneme. Lutfen daha sonra tekrar deneyin."
+
+async def enforce_rate_limit(limiter: RateLimiter, key: str):
+    if not await limiter.allow(key):
+        raise HTTPException(status_code=429, detail=TOO_MANY_ATTEMPTS)
+
+def login_key(request: Request, email: str) -> str:
+    """Failed logins count per client and account, so one client cannot lock someone else out."""
+    client = request.client.host if request.client else "unknown"
+    return f"{client}:{email.lower()}"
+
+async def enforce_login_limit(key: str):
+    if await login_limiter.blocked(key):
+        raise HTTPException(status_code=429, detail=TOO_MANY_ATTEMPTS)
+
+async def login_failed(key: str, detail: str):
+    await login_limiter.record_failure(key)
+    raise HTTPException(status_code=401, detail=detail)
+
+async def load_principal(user_id: str) -> Optional[dict]:
+    key = f"principal:{user_id}"
+    if PRINCIPAL_CACHE_TTL > 0:
+        cached = await cache_backend.get(key)
+        if cached is not None:
+            return loads(cached)
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+    if user and PRINCIPAL_CACHE_TTL > 0:
+        await cache_backend.set(key, dumps(user), PRINCIPAL_CACHE_TTL, tags=[f"user:{user_id}"])
+    return user
+
+async def resolve_user(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id = payload.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Gecersiz token")
-        user = await db.users.find_one({"id": user_id})
+        user = await load_principal(user_id)
         if not user:
             raise HTTPException(status_code=401, detail="Kullanici bulunamadi")
-        user.pop('password', None)
-        user.pop('_id', None)
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token suresi dolmus")
@@ -540,6 +883,19 @@ async def get_admin_user(credentials: HTTPAuthorizationCredentials = Depends(sec
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Gecersiz token")
 
+async def find_owned_property(property_id: str, current_user: dict, projection: Optional[Dict] = None) -> dict:
+    property_doc = await db.properties.find_one({"id": property_id}, projection or {"_id": 0, "user_id": 1})
+    if not property_doc:
+        raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+    if property_doc["user_id"] != current_user["id"]:
+        raise HTTPException(status_code=403, detail="Erisim yetkiniz yok")
+    return property_doc
+
+def property_list_response(properties: List[Dict]):
+    if FAST_JSON_ENABLED:
+        return FastJSONResponse([trusted_dump(PropertyResponse, p) for p in properties])
+    return [PropertyResponse(**{k: v for k, v in p.items() if k != '_id'}) for p in properties]
+
 async def send_email(to_email: str, subject: str, html_content: str):
     if not RESEND_API_KEY:
         logging.warning(f"[MOCK EMAIL] To: {to_email}, Subject: {subject}")
@@ -564,22 +920,33 @@ async def send_email(to_email: str, subject: str, html_content: str):
 async def get_packages():
     return PACKAGES
 
+async def run_free_property_cleanup() -> dict:
+    result = await cleanup_expired_free_properties(db, deletions)
+    await invalidate_cache(
+        *(f"property:{pid}" for pid in result["property_ids"]),
+        *(f"user:{uid}" for uid in result["user_ids"])
+    )
+    if result["deleted_count"]:
+        admin_stats_snapshot.invalidate()
+    return {"deleted_count": result["deleted_count"], "users": len(result["user_ids"]), "counts_updated": result["counts_updated"]}
+
+async def run_subscription_expiry() -> dict:
+    result = await expire_subscriptions(db)
+    if result["expired"]:
+        admin_stats_snapshot.invalidate()
+        await invalidate_cache(*(f"user:{uid}" for uid in result["user_ids"]))
+    return {"expired": result["expired"]}
+
 @api_router.post("/cleanup/free-properties")
 async def cleanup_free_properties():
     try:
-        free_users = await db.users.find({"package": "free"}).to_list(1000)
-        deleted_count = 0
-        for user in free_users:
-            user_id = user["id"]
-            cutoff_date = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-            result = await db.properties.delete_many({"user_id": user_id, "created_at": {"$lt": cutoff_date}})
-            deleted_count += result.deleted_count
-            current_count = await db.properties.count_documents({"user_id": user_id})
-            await db.users.update_one({"id": user_id}, {"$set": {"property_count": current_count}})
-        return {"deleted_count": deleted_count, "message": f"{deleted_count} eski gayrimenkul silindi"}
+        result = await scheduler.run("free_property_cleanup", force=True)
     except Exception as e:
-        logging.error(f"Cleanup error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=409, detail="Temizlik islemi zaten calisiyor")
+    deleted_count = result["deleted_count"]
+    return {"deleted_count": deleted_count, "message": f"{deleted_count} eski gayrimenkul silindi"}
 
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
@@ -599,7 +966,7 @@ async def register(user_data: UserCreate):
     user_doc = {
         "id": user_id,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await asyncio.to_thread(hash_password, user_data.password),
         "first_name": user_data.first_name,
         "last_name": user_data.last_name,
         "company_name": user_data.company_name,
@@ -613,6 +980,7 @@ async def register(user_data: UserCreate):
         "updated_at": now.isoformat()
     }
     await db.users.insert_one(user_doc)
+    admin_stats_snapshot.invalidate()
     if is_free:
         token = create_token(user_id, is_admin=False)
         return {
@@ -659,6 +1027,8 @@ async def complete_payment(payment_data: PaymentCreate):
             "updated_at": now.isoformat()
         }}
     )
+    await invalidate_cache(f"user:{payment_data.user_id}")
+    admin_stats_snapshot.invalidate()
     token = create_token(payment_data.user_id)
     updated_user = await db.users.find_one({"id": payment_data.user_id})
     package_info = PACKAGES[updated_user["package"]]
@@ -684,18 +1054,21 @@ async def complete_payment(payment_data: PaymentCreate):
     )
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(user_data: UserLogin):
+async def login(user_data: UserLogin, request: Request):
+    limit_key = login_key(request, user_data.email)
+    await enforce_login_limit(limit_key)
     user = await db.users.find_one({"email": user_data.email})
     if not user:
-        raise HTTPException(status_code=401, detail="Email veya sifre hatali")
-    if not verify_password(user_data.password, user["password"]):
-        raise HTTPException(status_code=401, detail="Email veya sifre hatali")
+        await login_failed(limit_key, "Email veya sifre hatali")
+    if not await asyncio.to_thread(verify_password, user_data.password, user["password"]):
+        await login_failed(limit_key, "Email veya sifre hatali")
     if user.get("subscription_status") != "active":
         raise HTTPException(status_code=403, detail="Aboneliginiz aktif degil. Lutfen odeme yapin.")
     if user.get("subscription_end"):
         end_date = datetime.fromisoformat(user["subscription_end"])
         if end_date < datetime.now(timezone.utc):
             await db.users.update_one({"id": user["id"]}, {"$set": {"subscription_status": "expired"}})
+            await invalidate_cache(f"user:{user['id']}")
             raise HTTPException(status_code=403, detail="Aboneliginiz sona erdi. Lutfen yenileyin.")
     token = create_token(user["id"])
     package_info = PACKAGES[user["package"]]
@@ -767,10 +1140,11 @@ async def update_profile(profile_data: ProfileUpdate, current_user: dict = Depen
                 update_data['company_logo'] = cdn_url
     else:
         if update_data.get('profile_photo'):
-            update_data['profile_photo'] = compress_base64_image(update_data['profile_photo'], max_size_kb=200)
+            update_data['profile_photo'] = await asyncio.to_thread(compress_base64_image, update_data['profile_photo'], 200)
         if update_data.get('company_logo'):
-            update_data['company_logo'] = compress_base64_image(update_data['company_logo'], max_size_kb=200)
+            update_data['company_logo'] = await asyncio.to_thread(compress_base64_image, update_data['company_logo'], 200)
     await db.users.update_one({"id": current_user["id"]}, {"$set": update_data})
+    await invalidate_cache(f"user:{current_user['id']}")
     updated_user = await db.users.find_one({"id": current_user["id"]})
     package_info = PACKAGES[updated_user["package"]]
     return UserResponse(
@@ -795,6 +1169,7 @@ async def update_profile(profile_data: ProfileUpdate, current_user: dict = Depen
 
 @api_router.post("/auth/forgot-password")
 async def forgot_password(request: PasswordResetRequest):
+    await enforce_rate_limit(password_reset_limiter, request.email.lower())
     user = await db.users.find_one({"email": request.email})
     if not user:
         return {"message": "Sifre sifirlama linki e-posta adresinize gonderildi."}
@@ -804,6 +1179,7 @@ async def forgot_password(request: PasswordResetRequest):
         "user_id": user["id"],
         "token": reset_token,
         "expires_at": expiry.isoformat(),
+        "purge_at": expiry,
         "used": False
     })
     reset_link = f"{FRONTEND_URL}/reset-password?token={reset_token}"
@@ -844,21 +1220,11 @@ async def reset_password(request: PasswordResetConfirm):
     expiry = datetime.fromisoformat(reset_record["expires_at"])
     if expiry < datetime.now(timezone.utc):
         raise HTTPException(status_code=400, detail="Token suresi dolmus")
-    await db.users.update_one({"id": reset_record["user_id"]}, {"$set": {"password": hash_password(request.new_password)}})
+    await db.users.update_one({"id": reset_record["user_id"]}, {"$set": {"password": await asyncio.to_thread(hash_password, request.new_password)}})
     await db.password_resets.update_one({"token": request.token}, {"$set": {"used": True}})
     return {"message": "Sifreniz basariyla guncellendi."}
 
-@api_router.post("/properties", response_model=PropertyResponse)
-async def create_property(property_data: PropertyCreate, current_user: dict = Depends(get_current_user)):
-    package_info = PACKAGES[current_user["package"]]
-    property_count = current_user.get("property_count", 0)
-    if package_info["property_limit"] != -1 and property_count >= package_info["property_limit"]:
-        raise HTTPException(status_code=403, detail=f"Paket limitinize ulastiniz ({package_info['property_limit']} gayrimenkul)")
-    if property_data.view_type == "360" and not package_info["has_360"]:
-        raise HTTPException(status_code=403, detail="360 goruntuleme icin Premium veya Ultra pakete yukseltin")
-    property_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    property_dict = property_data.model_dump()
+async def process_property_media(property_id: str, property_dict: Dict) -> Dict:
     if BUNNY_ENABLED:
         if property_dict.get('rooms'):
             property_dict['rooms'] = await process_room_photos_for_bunny(
@@ -875,49 +1241,258 @@ async def create_property(property_data: PropertyCreate, current_user: dict = De
                 property_dict['cover_image'] = cdn_url
     else:
         if property_dict.get('rooms'):
-            property_dict['rooms'] = compress_room_photos([dict(r) for r in property_dict['rooms']])
+            property_dict['rooms'] = await asyncio.to_thread(compress_room_photos, [dict(r) for r in property_dict['rooms']])
         if property_dict.get('cover_image'):
-            property_dict['cover_image'] = compress_base64_image(property_dict['cover_image'])
+            property_dict['cover_image'] = await asyncio.to_thread(compress_base64_image, property_dict['cover_image'])
+    return property_dict
+
+async def build_property_documents(user: dict, property_dict: Dict) -> tuple:
+    property_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    property_dict = await process_property_media(property_id, property_dict)
+    full_rooms = property_dict.get('rooms') or []
+    property_dict['rooms'] = [room_skeleton(room) for room in full_rooms]
     property_doc = {
         "id": property_id,
-        "user_id": current_user["id"],
-        "company_name": current_user["company_name"],
+        "user_id": user["id"],
+        "company_name": user["company_name"],
         **property_dict,
+        "rooms_split": True,
+        "pois_indexed": True,
         "view_count": 0,
         "total_view_duration": 0,
         "created_at": now,
         "updated_at": now,
         "share_link": f"/view/{property_id}"
     }
+    location = geo_point(property_dict.get('coordinates'))
+    if location:
+        property_doc["location"] = location
+    return (
+        property_doc,
+        room_documents(property_id, full_rooms),
+        poi_documents(property_id, user["id"], property_dict.get('pois') or [])
+    )
+
+@api_router.post("/properties", response_model=PropertyResponse)
+async def create_property(property_data: PropertyCreate, current_user: dict = Depends(get_current_user)):
+    package_info = PACKAGES[current_user["package"]]
+    property_count = current_user.get("property_count", 0)
+    if package_info["property_limit"] != -1 and property_count >= package_info["property_limit"]:
+        raise HTTPException(status_code=403, detail=f"Paket limitinize ulastiniz ({package_info['property_limit']} gayrimenkul)")
+    if property_data.view_type == "360" and not package_info["has_360"]:
+        raise HTTPException(status_code=403, detail="360 goruntuleme icin Premium veya Ultra pakete yukseltin")
+    property_doc, room_docs, poi_docs = await build_property_documents(current_user, property_data.model_dump())
+    property_id = property_doc["id"]
+    if room_docs:
+        await db.rooms.insert_many(room_docs)
     await db.properties.insert_one(property_doc)
-    await db.users.update_one({"id": current_user["id"]}, {"$set": {"property_count": property_count + 1}})
+    if poi_docs:
+        await db.pois.insert_many(poi_docs)
+    await db.users.update_one({"id": current_user["id"]}, {"$inc": {"property_count": 1}})
+    await invalidate_cache(f"user:{current_user['id']}")
     property_doc.pop('_id', None)
+    property_doc["rooms"] = room_docs
+    schedule_manifest_rebuild(property_id)
     return PropertyResponse(**property_doc)
 
 @api_router.get("/properties", response_model=List[PropertyResponse])
 async def get_user_properties(current_user: dict = Depends(get_current_user)):
-    cursor = db.properties.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(200)
+    cursor = db.properties.find({"user_id": current_user["id"]}, {"_id": 0}).sort("created_at", -1).limit(200)
     properties = await cursor.to_list(200)
-    return [PropertyResponse(**{k: v for k, v in p.items() if k != '_id'}) for p in properties]
+    return property_list_response(await attach_rooms(db, properties))
+
+@api_router.get("/properties/search")
+async def search_user_properties(
+    q: Optional[str] = Query(None, max_length=200),
+    city: Optional[List[str]] = Query(None),
+    district: Optional[List[str]] = Query(None),
+    room_count: Optional[List[str]] = Query(None),
+    property_type: Optional[str] = None,
+    view_type: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    sqm_min: Optional[float] = None,
+    sqm_max: Optional[float] = None,
+    building_age_min: Optional[int] = None,
+    building_age_max: Optional[int] = None,
+    sort: str = Query("created_at", pattern="^(created_at|price|square_meters)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    facets: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    filters = {
+        "q": q, "city": city, "district": district, "room_count": room_count,
+        "property_type": property_type, "view_type": view_type,
+        "price_min": price_min, "price_max": price_max, "sqm_min": sqm_min, "sqm_max": sqm_max,
+        "building_age_min": building_age_min, "building_age_max": building_age_max
+    }
+    try:
+        result = await search_properties(db, current_user["id"], filters, sort, order, limit, cursor, facets)
+    except SearchError as e:
+        raise HTTPException(status_code=400, detail=f"Gecersiz arama: {e}")
+    items = [skeleton_property(p) for p in result["items"]]
+    if FAST_JSON_ENABLED:
+        result["items"] = [trusted_dump(PropertySkeletonResponse, p) for p in items]
+        return FastJSONResponse(result)
+    result["items"] = [PropertySkeletonResponse(**p) for p in items]
+    return result
+
+@api_router.get("/properties/nearby")
+async def get_nearby_properties(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=MAX_NEARBY_KM),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(get_current_user)
+):
+    properties = await nearby_properties(db, current_user["id"], lat, lng, radius_km, limit)
+    items = []
+    for p in properties:
+        item = trusted_dump(PropertySkeletonResponse, skeleton_property(p))
+        item["distance_m"] = round(p["distance_m"])
+        items.append(item)
+    return FastJSONResponse(items)
 
 @api_router.get("/properties/{property_id}", response_model=PropertyResponse)
-async def get_property(property_id: str):
-    property_doc = await db.properties.find_one({"id": property_id})
-    if not property_doc:
-        raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
-    user_doc = await db.users.find_one({"id": property_doc["user_id"]})
-    if user_doc:
-        property_doc["agent"] = AgentInfo(
-            first_name=user_doc.get("first_name", ""),
-            last_name=user_doc.get("last_name", ""),
-            company_name=user_doc.get("company_name", ""),
-            phone=user_doc.get("phone"),
-            email=user_doc.get("email"),
-            profile_photo=user_doc.get("profile_photo"),
-            company_logo=user_doc.get("company_logo")
-        )
-    property_doc.pop('_id', None)
-    return PropertyResponse(**property_doc)
+async def get_property(property_id: str, request: Request, rooms: str = Query("full", pattern="^(full|skeleton)$")):
+    tag = f"property:{property_id}"
+    cache_key = tag if rooms == "full" else f"{tag}:skeleton"
+    response_model = PropertyResponse if rooms == "full" else PropertySkeletonResponse
+    async def build():
+        reader = public_reader(tag)
+        property_doc = await reader.properties.find_one({"id": property_id}, {"_id": 0})
+        if not property_doc:
+            raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+        if rooms == "full":
+            await attach_rooms(reader, [property_doc])
+        else:
+            if not property_doc.get("cover_image"):
+                property_doc["cover_fallback"] = await first_room_photo(reader, property_doc)
+            skeleton_property(property_doc)
+        user_doc = await public_reader(tag, f"user:{property_doc['user_id']}").users.find_one({"id": property_doc["user_id"]})
+        if user_doc:
+            property_doc["agent"] = AgentInfo(
+                first_name=user_doc.get("first_name", ""),
+                last_name=user_doc.get("last_name", ""),
+                company_name=user_doc.get("company_name", ""),
+                phone=user_doc.get("phone"),
+                email=user_doc.get("email"),
+                profile_photo=user_doc.get("profile_photo"),
+                company_logo=user_doc.get("company_logo")
+            )
+        if FAST_JSON_ENABLED:
+            body = dumps(trusted_dump(response_model, property_doc))
+        else:
+            body = response_model(**property_doc).model_dump_json().encode()
+        return body, [tag, f"user:{property_doc['user_id']}"]
+    payload = await cached_public_payload(cache_key, build)
+    return precompressed_response(payload, request.headers.get("accept-encoding"), COMPRESSION_MIN_SIZE)
+
+@api_router.get("/properties/{property_id}/rooms/{room_id}", response_model=RoomData)
+async def get_property_room(property_id: str, room_id: str, request: Request):
+    tag = f"property:{property_id}"
+    cache_key = f"{tag}:room:{room_id}"
+    async def build():
+        reader = public_reader(tag)
+        room = await load_room(reader, property_id, room_id)
+        if room is None:
+            property_doc = await reader.properties.find_one(
+                {"id": property_id, "rooms_split": {"$ne": True}}, {"_id": 0, "rooms": {"$elemMatch": {"id": room_id}}}
+            )
+            room = (property_doc or {}).get("rooms", [None])[0]
+        if room is None:
+            raise HTTPException(status_code=404, detail="Oda bulunamadi")
+        body = dumps(trusted_dump(RoomData, room)) if FAST_JSON_ENABLED else RoomData(**room).model_dump_json().encode()
+        return body, [tag]
+    payload = await cached_public_payload(cache_key, build)
+    return precompressed_response(payload, request.headers.get("accept-encoding"), COMPRESSION_MIN_SIZE)
+
+@api_router.get("/properties/{property_id}/pois")
+async def get_property_pois(
+    property_id: str,
+    request: Request,
+    category: Optional[str] = Query(None, max_length=50),
+    limit: int = Query(10, ge=1, le=50)
+):
+    tag = f"property:{property_id}"
+    cache_key = f"{tag}:pois:{category or '*'}:{limit}"
+    async def build():
+        reader = public_reader(tag)
+        property_doc = await reader.properties.find_one({"id": property_id}, {"_id": 0, "location": 1, "user_id": 1})
+        if not property_doc:
+            raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+        pois = []
+        if property_doc.get("location"):
+            pois = await nearest_pois(reader, property_doc["location"], property_doc["user_id"], category, limit)
+        if not pois:
+            pois = await property_pois(reader, property_id, category, limit)
+        for poi in pois:
+            location = poi.pop("location", None)
+            if location:
+                poi["coordinates"] = {"latitude": location["coordinates"][1], "longitude": location["coordinates"][0]}
+            if poi.get("distance_m") is not None:
+                poi["distance_m"] = round(poi["distance_m"])
+        return dumps({"property_id": property_id, "pois": pois}), [tag]
+    payload = await cached_public_payload(cache_key, build)
+    return precompressed_response(payload, request.headers.get("accept-encoding"), COMPRESSION_MIN_SIZE)
+
+# one manifest build per listing at a time; a change that lands mid-build queues one more pass
+manifest_builds: Dict[str, asyncio.Task] = {}
+manifest_stale: set = set()
+
+async def _build_tour_manifest(property_id: str) -> Optional[dict]:
+    try:
+        property_doc = await db.properties.find_one({"id": property_id}, {"_id": 0, "id": 1, "entry_room_id": 1, "updated_at": 1, "rooms": 1, "rooms_split": 1})
+        if not property_doc:
+            return None
+        await attach_rooms(db, [property_doc])
+        manifest = await refresh_manifest(db, property_doc, property_doc.get("rooms", []), BUNNY_CDN_HOSTNAME)
+        await invalidate_cache(f"property:{property_id}")
+        return manifest
+    except Exception as e:
+        logging.error(f"Tour manifest build failed for {property_id}: {e}")
+        return None
+
+async def _run_manifest_builds(property_id: str) -> Optional[dict]:
+    try:
+        while True:
+            manifest_stale.discard(property_id)
+            manifest = await _build_tour_manifest(property_id)
+            if property_id not in manifest_stale:
+                return manifest
+    finally:
+        manifest_builds.pop(property_id, None)
+
+def schedule_manifest_rebuild(property_id: str) -> asyncio.Task:
+    task = manifest_builds.get(property_id)
+    if task is not None:
+        manifest_stale.add(property_id)
+        return task
+    task = asyncio.create_task(_run_manifest_builds(property_id))
+    manifest_builds[property_id] = task
+    return task
+
+async def rebuild_tour_manifest(property_id: str) -> Optional[dict]:
+    """Joins the running build for the listing, or starts one."""
+    task = manifest_builds.get(property_id) or schedule_manifest_rebuild(property_id)
+    return await asyncio.shield(task)
+
+@api_router.get("/properties/{property_id}/manifest")
+async def get_tour_manifest(property_id: str, request: Request):
+    tag = f"property:{property_id}"
+    cache_key = f"{tag}:manifest"
+    async def build():
+        manifest = await public_reader(tag)[MANIFESTS_COLLECTION].find_one({"_id": property_id}, {"assets": 0})
+        if manifest is None:
+            manifest = await rebuild_tour_manifest(property_id)
+        if manifest is None:
+            raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+        return dumps(public_manifest(manifest)), [tag]
+    payload = await cached_public_payload(cache_key, build)
+    return precompressed_response(payload, request.headers.get("accept-encoding"), COMPRESSION_MIN_SIZE)
 
 @api_router.put("/properties/{property_id}", response_model=PropertyResponse)
 async def update_property(property_id: str, property_data: PropertyUpdate, current_user: dict = Depends(get_current_user)):
@@ -927,29 +1502,31 @@ async def update_property(property_id: str, property_data: PropertyUpdate, curre
     if property_doc["user_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Bu gayrimenkulu duzenleme yetkiniz yok")
     update_data = {k: v for k, v in property_data.model_dump().items() if v is not None}
-    if BUNNY_ENABLED:
-        if update_data.get('rooms'):
-            update_data['rooms'] = await process_room_photos_for_bunny(
-                [dict(r) for r in update_data['rooms']],
-                property_id
-            )
-        if update_data.get('cover_image') and update_data['cover_image'].startswith('data:'):
-            cdn_url = await upload_base64_to_bunny(
-                update_data['cover_image'],
-                f"properties/{property_id}",
-                "cover.jpg"
-            )
-            if cdn_url:
-                update_data['cover_image'] = cdn_url
-    else:
-        if update_data.get('rooms'):
-            update_data['rooms'] = compress_room_photos([dict(r) for r in update_data['rooms']])
-        if update_data.get('cover_image'):
-            update_data['cover_image'] = compress_base64_image(update_data['cover_image'])
+    update_data = await process_property_media(property_id, update_data)
+    unset_data = {}
+    if 'rooms' in update_data:
+        if not await claim_unsplit_rooms(db, property_id):
+            raise HTTPException(status_code=409, detail="Odalar tasiniyor, lutfen tekrar deneyin")
+        update_data['rooms'] = await save_rooms(db, property_id, update_data['rooms'])
+        update_data['rooms_split'] = True
+        unset_data['rooms_split_claimed_at'] = ""
+    if 'coordinates' in update_data:
+        update_data['location'] = geo_point(update_data['coordinates'])
+    elif 'coordinates' in property_data.model_fields_set:
+        # an explicit null clears the pin; the None filter above would otherwise drop it
+        unset_data.update(coordinates="", location="")
+    if 'pois' in update_data:
+        await save_pois(db, property_id, property_doc["user_id"], update_data['pois'])
+        update_data['pois_indexed'] = True
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
-    await db.properties.update_one({"id": property_id}, {"$set": update_data})
-    updated = await db.properties.find_one({"id": property_id})
-    updated.pop('_id', None)
+    update = {"$set": update_data}
+    if unset_data:
+        update["$unset"] = unset_data
+    await db.properties.update_one({"id": property_id}, update)
+    await invalidate_cache(f"property:{property_id}")
+    updated = await db.properties.find_one({"id": property_id}, {"_id": 0})
+    await attach_rooms(db, [updated])
+    schedule_manifest_rebuild(property_id)
     return PropertyResponse(**updated)
 
 @api_router.delete("/properties/{property_id}")
@@ -959,80 +1536,159 @@ async def delete_property(property_id: str, current_user: dict = Depends(get_cur
         raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
     if property_doc["user_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Bu gayrimenkulu silme yetkiniz yok")
-    await db.properties.delete_one({"id": property_id})
-    await db.visitors.delete_many({"property_id": property_id})
-    await db.visits.delete_many({"property_id": property_id})
-    current_count = current_user.get("property_count", 0)
-    if current_count > 0:
-        await db.users.update_one({"id": current_user["id"]}, {"$set": {"property_count": current_count - 1}})
-    return {"message": "Gayrimenkul basariyla silindi"}
+    job = await deletions.tombstone_property(property_doc)
+    await invalidate_cache(f"property:{property_id}", f"user:{current_user['id']}")
+    spawn_background(deletions.process(job["_id"]))
+    return {"message": "Gayrimenkul basariyla silindi", "deletion_job_id": job["_id"]}
 
 @api_router.post("/visitors/register", response_model=VisitorResponse)
 async def register_visitor(visitor_data: VisitorCreate):
-    property_doc = await db.properties.find_one({"id": visitor_data.property_id})
+    property_doc = await db.properties.find_one({"id": visitor_data.property_id}, {"_id": 0, "user_id": 1})
     if not property_doc:
         raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
-    existing = await db.visitors.find_one({"property_id": visitor_data.property_id, "phone": visitor_data.phone})
-    if existing:
-        visit_count = existing.get("visit_count", 0)
-        await db.visitors.update_one(
-            {"id": existing["id"]},
-            {"$set": {"visit_count": visit_count + 1, "last_visit": datetime.now(timezone.utc).isoformat()}}
-        )
-        updated = await db.visitors.find_one({"id": existing["id"]})
-        updated.pop('_id', None)
-        return VisitorResponse(**updated)
-    visitor_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
-    visitor_doc = {
-        "id": visitor_id,
-        "property_id": visitor_data.property_id,
-        "user_id": property_doc["user_id"],
-        "first_name": visitor_data.first_name,
-        "last_name": visitor_data.last_name,
-        "phone": visitor_data.phone,
-        "visit_count": 1,
-        "total_duration": 0,
-        "rooms_visited": [],
-        "last_visit": now,
-        "created_at": now
+    phone_normalized = normalize_phone(visitor_data.phone)
+    query = {"property_id": visitor_data.property_id, "phone_normalized": phone_normalized}
+    update = {
+        "$inc": {"visit_count": 1},
+        "$set": {"last_visit": now},
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "user_id": property_doc["user_id"],
+            "first_name": visitor_data.first_name,
+            "last_name": visitor_data.last_name,
+            "phone": visitor_data.phone,
+            "total_duration": 0,
+            "rooms_visited": [],
+            "created_at": now
+        }
     }
-    await db.visitors.insert_one(visitor_doc)
-    visitor_doc.pop('_id', None)
-    return VisitorResponse(**visitor_doc)
+    try:
+        visitor = await db.visitors.find_one_and_update(
+            query, update, projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        update.pop("$setOnInsert")
+        visitor = await db.visitors.find_one_and_update(
+            query, update, projection={"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+    sketch_keys = unique_visitor_keys(visitor_data.property_id, property_doc["user_id"], day_key(now))
+    if visit_buffer is not None:
+        visit_buffer.add_unique_visitor(sketch_keys, phone_normalized)
+    else:
+        await add_unique_visitors(db, {key: {phone_normalized} for key in sketch_keys})
+    live_feed.publish(property_doc["user_id"], "visitor", visitor)
+    return VisitorResponse(**visitor)
 
 @api_router.post("/visits")
 async def record_visit(visit_data: VisitCreate):
-    property_doc = await db.properties.find_one({"id": visit_data.property_id})
-    if property_doc:
-        await db.properties.update_one(
-            {"id": visit_data.property_id},
-            {"$inc": {"view_count": 1, "total_view_duration": visit_data.duration}}
-        )
-    visitor = await db.visitors.find_one({"id": visit_data.visitor_id})
-    if visitor:
-        existing_rooms = visitor.get("rooms_visited", [])
-        new_rooms = list(set(existing_rooms + visit_data.rooms_visited))
-        await db.visitors.update_one(
-            {"id": visit_data.visitor_id},
-            {"$set": {
-                "total_duration": visitor.get("total_duration", 0) + visit_data.duration,
-                "rooms_visited": new_rooms,
-                "last_visit": datetime.now(timezone.utc).isoformat()
-            }}
-        )
-    visit_id = str(uuid.uuid4())
     visit_doc = {
-        "id": visit_id,
+        "id": str(uuid.uuid4()),
         "property_id": visit_data.property_id,
         "visitor_id": visit_data.visitor_id,
         "duration": visit_data.duration,
         "rooms_visited": visit_data.rooms_visited,
         "visited_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.visits.insert_one(visit_doc)
+    await store_visit(visit_doc)
     return {"message": "Ziyaret kaydedildi"}
 
+async def store_visit(visit_doc: dict):
+    if visit_buffer is not None:
+        await visit_buffer.submit(visit_doc)
+        return
+    property_doc = await db.properties.find_one_and_update(
+        {"id": visit_doc["property_id"]},
+        {"$inc": {"view_count": 1, "total_view_duration": visit_doc["duration"]}},
+        projection={"_id": 0, "user_id": 1}
+    )
+    visit_doc["user_id"] = property_doc["user_id"] if property_doc else None
+    await asyncio.gather(
+        db.visitors.update_one(
+            {"id": visit_doc["visitor_id"]},
+            {
+                "$inc": {"total_duration": visit_doc["duration"]},
+                "$addToSet": {"rooms_visited": {"$each": visit_doc["rooms_visited"]}},
+                "$max": {"last_visit": visit_doc["visited_at"]}
+            }
+        ),
+        db.visits.insert_one(visit_doc)
+    )
+    if property_doc:
+        await record_visit_rollup(
+            db, visit_doc["property_id"], property_doc["user_id"],
+            visit_doc["duration"], visit_doc["rooms_visited"], visit_doc["visited_at"]
+        )
+        live_feed.publish(property_doc["user_id"], "visit", visit_event(visit_doc))
+
+def visit_event(visit_doc: dict) -> dict:
+    return {k: visit_doc[k] for k in ("id", "property_id", "visitor_id", "duration", "rooms_visited", "visited_at")}
+
+def create_stream_ticket(user_id: str) -> str:
+    now = datetime.now(timezone.utc)
+    payload = {
+        "sub": user_id,
+        "aud": LIVE_TICKET_AUDIENCE,
+        "jti": str(uuid.uuid4()),
+        "exp": now + timedelta(seconds=LIVE_TICKET_SECONDS),
+        "iat": now
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+async def redeem_stream_ticket(ticket: str) -> dict:
+    try:
+        payload = jwt.decode(ticket, JWT_SECRET, algorithms=[JWT_ALGORITHM], audience=LIVE_TICKET_AUDIENCE)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Bilet suresi dolmus")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Gecersiz bilet")
+    if not payload.get("sub") or not payload.get("jti"):
+        raise HTTPException(status_code=401, detail="Gecersiz bilet")
+    if not await cache_backend.acquire_lock(f"live-ticket:{payload['jti']}", payload["sub"], LIVE_TICKET_SECONDS):
+        raise HTTPException(status_code=401, detail="Bilet zaten kullanildi")
+    user = await load_principal(payload["sub"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Kullanici bulunamadi")
+    return user
+
+@api_router.post("/live/ticket")
+async def create_live_feed_ticket(current_user: dict = Depends(get_current_user)):
+    """EventSource cannot send headers, so the feed URL carries this one-use ticket instead of the JWT."""
+    return {"ticket": create_stream_ticket(current_user["id"]), "expires_in": LIVE_TICKET_SECONDS}
+
+@api_router.get("/live/feed")
+async def live_visit_feed(request: Request, ticket: str = Query(...)):
+    current_user = await redeem_stream_ticket(ticket)
+    if not live_feed.has_capacity(current_user["id"]):
+        raise HTTPException(status_code=429, detail="Cok fazla canli baglanti")
+    return StreamingResponse(
+        sse_stream(live_feed, current_user["id"], request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/telemetry/batch", status_code=202)
+async def record_telemetry_batch(request: Request):
+    try:
+        property_id, visitor_id, events = parse_beacon(await request.body())
+    except BeaconError as e:
+        raise HTTPException(status_code=400, detail=f"Gecersiz telemetri: {e}")
+    property_doc = await public_reader(f"property:{property_id}").properties.find_one({"id": property_id}, {"_id": 0, "rooms.id": 1})
+    if not property_doc:
+        raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+    room_ids = {room["id"] for room in property_doc.get("rooms", [])}
+    docs, visits, rejected = build_telemetry(property_id, visitor_id, events, room_ids, datetime.now(timezone.utc))
+    if visits and not await db.visitors.find_one({"id": visitor_id, "property_id": property_id}, {"_id": 1}):
+        rejected_indexes = {r["index"] for r in rejected}
+        visit_index = next(i for i, e in enumerate(events) if i not in rejected_indexes and e[0] == "v")
+        rejected.append({"index": visit_index, "error": "unknown_visitor"})
+        visits = []
+    if docs:
+        await db.room_events.insert_many(docs, ordered=False)
+    for visit in visits:
+        await store_visit({"id": str(uuid.uuid4()), **visit})
+    return {"accepted": len(docs) + len(visits), "rejected": rejected}
+
 @api_router.get("/properties/{property_id}/visitors", response_model=List[VisitorResponse])
 async def get_property_visitors(property_id: str, current_user: dict = Depends(get_current_user)):
     property_doc = await db.properties.find_one({"id": property_id})
@@ -1064,51 +1720,290 @@ async def get_property_visits(property_id: str, current_user: dict = Depends(get
         })
     return result
 
+def export_response(cursor, fmt: str, fields: List[str], name: str, gzip: bool) -> StreamingResponse:
+    media_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"mekan360-{name}-{datetime.now(timezone.utc).strftime('%Y%m%d')}.{extension}"
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+    return StreamingResponse(
+        export_stream(cursor, fmt, fields, gzip=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def export_property_ids(current_user: dict, property_id: Optional[str]) -> List[str]:
+    if property_id:
+        property_doc = await db.properties.find_one({"id": property_id}, {"user_id": 1})
+        if not property_doc:
+            raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+        if property_doc["user_id"] != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Erisim yetkiniz yok")
+        return [property_id]
+    return await db.properties.distinct("id", {"user_id": current_user["id"]})
+
+def check_export_format(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Gecersiz format (csv veya ndjson)")
+
+@api_router.get("/exports/visitors")
+async def export_visitors(
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    property_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    check_export_format(fmt)
+    query = {"user_id": current_user["id"]}
+    if property_id:
+        await export_property_ids(current_user, property_id)
+        query["property_id"] = property_id
+    cursor = db.visitors.find(query, export_projection(VISITOR_EXPORT_FIELDS), batch_size=EXPORT_BATCH_SIZE).sort("last_visit", -1)
+    return export_response(cursor, fmt, VISITOR_EXPORT_FIELDS, "visitors", gzip)
+
+@api_router.get("/exports/visits")
+async def export_visits(
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    property_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    check_export_format(fmt)
+    query = {"user_id": current_user["id"]}
+    if property_id:
+        await export_property_ids(current_user, property_id)
+        query = {"property_id": property_id}
+    cursor = db.visits.find(
+        query,
+        export_projection(VISIT_EXPORT_FIELDS),
+        batch_size=EXPORT_BATCH_SIZE
+    ).sort("visited_at", -1)
+    return export_response(cursor, fmt, VISIT_EXPORT_FIELDS, "visits", gzip)
+
+@api_router.get("/exports/properties")
+async def export_properties(
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    check_export_format(fmt)
+    cursor = db.properties.find(
+        {"user_id": current_user["id"]},
+        export_projection(PROPERTY_EXPORT_FIELDS),
+        batch_size=EXPORT_BATCH_SIZE
+    ).sort("created_at", -1)
+    return export_response(cursor, fmt, PROPERTY_EXPORT_FIELDS, "properties", gzip)
+
+async def build_import_documents(user: dict, property_dict: Dict) -> tuple:
+    if property_dict.get("view_type") == "360" and not PACKAGES[user["package"]]["has_360"]:
+        raise ValueError("360 goruntuleme icin Premium veya Ultra pakete yukseltin")
+    return await build_property_documents(user, property_dict)
+
+def import_limit(user: dict) -> Optional[int]:
+    limit = PACKAGES[user["package"]]["property_limit"]
+    return None if limit == -1 else limit
+
+async def import_allowance(user: dict) -> Optional[int]:
+    """Early rejection only; the importer reserves the allowance atomically as it inserts."""
+    limit = import_limit(user)
+    if limit is None:
+        return None
+    actual = await db.properties.count_documents({"user_id": user["id"]})
+    return max(0, limit - actual)
+
+async def run_property_import(user: dict, path: str, filename: str, fmt: str, dry_run: bool = False,
+                              job_id: Optional[str] = None) -> dict:
+    importer = PropertyImporter(db, PropertyCreate, build_import_documents)
+    if job_id is None:
+        job_id = (await importer.create_job(user["id"], filename, fmt, dry_run))["_id"]
+    result = await importer.run(job_id, user, path, fmt, import_limit(user), dry_run)
+    if result["inserted"]:
+        admin_stats_snapshot.invalidate()
+        await invalidate_cache(f"user:{user['id']}")
+    return result
+
+async def run_uploaded_import(user: dict, path: str, filename: str, fmt: str, dry_run: bool, job_id: str):
+    try:
+        await run_property_import(user, path, filename, fmt, dry_run, job_id)
+    except Exception as e:
+        logging.error(f"Import {job_id} failed: {e}")
+    finally:
+        os.unlink(path)
+
+IMPORT_TOO_LARGE = f"Dosya cok buyuk (en fazla {IMPORT_MAX_BYTES // (1024 * 1024)} MB)"
+
+async def spool_upload(file: UploadFile) -> str:
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix="mekan360-import-", delete=False) as spool:
+        try:
+            while chunk := await file.read(IMPORT_UPLOAD_CHUNK):
+                size += len(chunk)
+                if size > IMPORT_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=IMPORT_TOO_LARGE)
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            os.unlink(spool.name)
+            raise
+    return spool.name
+
+@api_router.post("/imports", status_code=202)
+async def start_property_import(
+    file: UploadFile = File(...),
+    fmt: Optional[str] = Query(None, alias="format"),
+    dry_run: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        fmt = detect_format(file.filename, fmt)
+    except ImportRowError:
+        raise HTTPException(status_code=400, detail="Gecersiz format (ndjson, csv veya zip)")
+    if not dry_run and await import_allowance(current_user) == 0:
+        raise HTTPException(status_code=403, detail=f"Paket limitinize ulastiniz ({PACKAGES[current_user['package']]['property_limit']} gayrimenkul)")
+    path = await spool_upload(file)
+    job = await PropertyImporter(db, PropertyCreate, build_import_documents).create_job(
+        current_user["id"], file.filename, fmt, dry_run
+    )
+    spawn_background(run_uploaded_import(current_user, path, file.filename, fmt, dry_run, job["_id"]))
+    return {"job_id": job["_id"], "status": job["status"]}
+
+@api_router.get("/imports/{job_id}")
+async def get_property_import(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await get_import_job(db, job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Ice aktarma bulunamadi")
+    return job
+
 @api_router.get("/analytics")
 async def get_analytics(current_user: dict = Depends(get_current_user)):
-    cursor = db.properties.find({"user_id": current_user["id"]})
-    properties = await cursor.to_list(1000)
-    property_ids = [p["id"] for p in properties]
-    total_views = sum(p.get("view_count", 0) for p in properties)
-    total_duration = sum(p.get("total_view_duration", 0) for p in properties)
+    user_id = current_user["id"]
+    property_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$project": {
+            "_id": 0,
+            "id": 1,
+            "title": 1,
+            "view_count": {"$ifNull": ["$view_count", 0]},
+            "total_view_duration": {"$ifNull": ["$total_view_duration", 0]}
+        }},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "views": {"$sum": "$view_count"},
+                "duration": {"$sum": "$total_view_duration"}
+            }}],
+            "top": [{"$sort": {"view_count": -1}}, {"$limit": 5}]
+        }}
+    ]
+    property_stats, total_visitors, recent_visitors, daily_views, unique_30d = await asyncio.gather(
+        db.properties.aggregate(property_pipeline).to_list(1),
+        db.visitors.count_documents({"user_id": user_id}),
+        db.visitors.find({"user_id": user_id}, {"_id": 0}).sort("last_visit", -1).limit(10).to_list(10),
+        agent_daily_views(db, user_id),
+        unique_visitor_count(db, "user", [user_id], range_start(), day_key(datetime.now(timezone.utc)))
+    )
+    facets = property_stats[0] if property_stats else {"totals": [], "top": []}
+    totals = facets["totals"][0] if facets["totals"] else {"views": 0, "duration": 0}
+    total_views = totals["views"]
+    total_duration = totals["duration"]
     avg_duration = total_duration / total_views if total_views > 0 else 0
-    visitor_cursor = db.visitors.find({"property_id": {"$in": property_ids}}).sort("last_visit", -1).limit(100)
-    visitors = await visitor_cursor.to_list(100)
-    thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
-    visit_cursor = db.visits.find({"property_id": {"$in": property_ids}, "visited_at": {"$gte": thirty_days_ago}}).limit(1000)
-    visits = await visit_cursor.to_list(1000)
-    daily_views = {}
-    for visit in visits:
-        date = visit["visited_at"][:10]
-        daily_views[date] = daily_views.get(date, 0) + 1
-    daily_views_list = [{"date": k, "views": v} for k, v in sorted(daily_views.items())]
-    top_properties = sorted(properties, key=lambda x: x.get("view_count", 0), reverse=True)[:5]
     return {
         "total_views": total_views,
         "total_duration": total_duration,
         "avg_duration": avg_duration,
-        "total_visitors": len(visitors),
-        "daily_views": daily_views_list,
+        "total_visitors": total_visitors,
+        "unique_visitors_30d": unique_30d["unique_visitors"],
+        "daily_views": [{"date": d["day"], "views": d["views"]} for d in daily_views],
         "top_properties": [{
             "id": p["id"],
             "title": p["title"],
-            "views": p.get("view_count", 0),
-            "avg_duration": p.get("total_view_duration", 0) / max(p.get("view_count", 1), 1)
-        } for p in top_properties],
-        "recent_visitors": [{k: v for k, v in v.items() if k != '_id'} for v in visitors[:10]]
+            "views": p["view_count"],
+            "avg_duration": p["total_view_duration"] / max(p["view_count"], 1)
+        } for p in facets["top"]],
+        "recent_visitors": recent_visitors
     }
 
+@api_router.get("/analytics/unique-visitors")
+async def get_unique_visitors(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    property_id: Optional[str] = None,
+    group_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    end = end or day_key(datetime.now(timezone.utc))
+    start = start or range_start()
+    if property_id:
+        await find_owned_property(property_id, current_user)
+        scope, keys = "property", [property_id]
+    elif group_id:
+        group = await db.groups.find_one({"id": group_id, "user_id": current_user["id"]}, {"_id": 0, "property_ids": 1})
+        if not group:
+            raise HTTPException(status_code=404, detail="Grup bulunamadi")
+        # groups store whatever ids the agent sent; only count listings the agent owns
+        keys = await db.properties.distinct(
+            "id", {"id": {"$in": group.get("property_ids", [])}, "user_id": current_user["id"]}
+        )
+        scope = "property"
+    else:
+        scope, keys = "user", [current_user["id"]]
+    try:
+        result = await unique_visitor_count(db, scope, keys, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Gecersiz tarih araligi: {e}")
+    return {"scope": "group" if group_id and not property_id else scope, **result}
+
+@api_router.get("/properties/{property_id}/stats")
+async def get_property_stats(property_id: str, days: int = Query(30, ge=1, le=365), current_user: dict = Depends(get_current_user)):
+    await find_owned_property(property_id, current_user)
+    return {"property_id": property_id, "daily": await property_daily_stats(db, property_id, days)}
+
+@api_router.post("/room-events")
+async def record_room_events(batch: RoomEventBatch):
+    property_doc = await public_reader(f"property:{batch.property_id}").properties.find_one(
+        {"id": batch.property_id}, {"_id": 0, "rooms.id": 1}
+    )
+    if not property_doc:
+        raise HTTPException(status_code=404, detail="Gayrimenkul bulunamadi")
+    room_ids = {room["id"] for room in property_doc.get("rooms", [])}
+    now = datetime.now(timezone.utc)
+    docs, rejected = [], []
+    for index, event in enumerate(batch.events):
+        ts = as_utc(event.timestamp)
+        error = validate_room_event(room_ids, event.room_id, event.event, ts, now)
+        if error:
+            rejected.append({"index": index, "error": error})
+            continue
+        docs.append(build_room_event(batch.property_id, batch.visitor_id, event.room_id, ROOM_EVENT_KINDS[event.event], ts))
+    if docs:
+        await db.room_events.insert_many(docs, ordered=False)
+    return {"accepted": len(docs), "rejected": rejected}
+
+@api_router.get("/properties/{property_id}/room-heatmap")
+async def get_room_heatmap(property_id: str, days: int = Query(30, ge=1, le=365), current_user: dict = Depends(get_current_user)):
+    property_doc = await find_owned_property(property_id, current_user, {"_id": 0, "user_id": 1, "rooms.id": 1, "rooms.name": 1})
+    rows = await room_heatmap(db, property_id, days)
+    return {"property_id": property_id, "rooms": attach_room_names(rows, property_doc.get("rooms", []))}
+
+@api_router.get("/properties/{property_id}/room-paths")
+async def get_room_paths(property_id: str, days: int = Query(30, ge=1, le=365), current_user: dict = Depends(get_current_user)):
+    property_doc = await find_owned_property(property_id, current_user, {"_id": 0, "user_id": 1, "rooms.id": 1, "rooms.name": 1})
+    rows = await room_transitions(db, property_id, days)
+    return {"property_id": property_id, "rooms": attach_room_names(rows, property_doc.get("rooms", []))}
+
 @admin_router.post("/login")
-async def admin_login(data: AdminLogin):
+async def admin_login(data: AdminLogin, request: Request):
+    limit_key = f"admin:{login_key(request, data.email)}"
+    await enforce_login_limit(limit_key)
     if data.email != "yadigrb" or data.password != "Yadigar34":
-        raise HTTPException(status_code=401, detail="Gecersiz kimlik bilgileri")
+        await login_failed(limit_key, "Gecersiz kimlik bilgileri")
     admin_id = "admin-mekan360"
     token = create_token(admin_id, is_admin=True)
     return {"access_token": token, "token_type": "bearer"}
 
 @admin_router.get("/users")
 async def admin_get_users(admin: dict = Depends(get_admin_user)):
-    cursor = db.users.find().sort("created_at", -1).limit(500)
+    cursor = db.users.find({}, {"_id": 0, "password": 0}).sort("created_at", -1).limit(500)
     users = await cursor.to_list(500)
     enriched_users = []
     for user in users:
@@ -1118,9 +2013,9 @@ async def admin_get_users(admin: dict = Depends(get_admin_user)):
         user["has_360"] = package_info["has_360"]
         user["property_count"] = user.get("property_count", 0)
         user["auto_payment"] = user.get("auto_payment", False)
-        user.pop('password', None)
-        user.pop('_id', None)
         enriched_users.append(user)
+    if FAST_JSON_ENABLED:
+        return FastJSONResponse(enriched_users)
     return enriched_users
 
 @admin_router.get("/users/{user_id}")
@@ -1147,7 +2042,7 @@ async def admin_update_user(user_id: str, data: AdminUserUpdate, admin: dict = D
         raise HTTPException(status_code=404, detail="Kullanici bulunamadi")
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     if update_data.get("password"):
-        update_data["password"] = hash_password(update_data["password"])
+        update_data["password"] = await asyncio.to_thread(hash_password, update_data["password"])
     if update_data.get("subscription_days"):
         days = update_data.pop("subscription_days")
         now = datetime.now(timezone.utc)
@@ -1179,6 +2074,7 @@ async def admin_update_user(user_id: str, data: AdminUserUpdate, admin: dict = D
             update_data["subscription_end"] = new_expiry.isoformat()
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.users.update_one({"id": user_id}, {"$set": update_data})
+    await invalidate_cache(f"user:{user_id}")
     updated = await db.users.find_one({"id": user_id})
     updated.pop('password', None)
     updated.pop('_id', None)
@@ -1190,31 +2086,77 @@ async def admin_get_payments(admin: dict = Depends(get_admin_user)):
     payments = await cursor.to_list(500)
     return [{k: v for k, v in p.items() if k != '_id'} for p in payments]
 
-@admin_router.get("/stats")
-async def admin_get_stats(admin: dict = Depends(get_admin_user)):
-    total_users = await db.users.count_documents({})
-    active_users = await db.users.count_documents({"subscription_status": "active"})
-    total_properties = await db.properties.count_documents({})
-    total_payments = await db.payments.count_documents({})
-    cursor = db.payments.find({"status": "completed"}).limit(1000)
-    payments = await cursor.to_list(1000)
-    total_revenue = sum(p.get("amount", 0) for p in payments)
-    starter_count = await db.users.count_documents({"package": "starter"})
-    premium_count = await db.users.count_documents({"package": "premium"})
-    ultra_count = await db.users.count_documents({"package": "ultra"})
+@admin_router.get("/ingestion")
+async def admin_get_ingestion(admin: dict = Depends(get_admin_user)):
     return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "total_properties": total_properties,
-        "total_payments": total_payments,
-        "total_revenue": total_revenue,
-        "package_distribution": {
-            "starter": starter_count,
-            "premium": premium_count,
-            "ultra": ultra_count
-        }
+        "visit_buffer": visit_buffer.metrics() if visit_buffer is not None else None,
+        "live_feed": live_feed.metrics(),
+        "public_cache": public_cache.stats(),
+        "shared_cache": {**cache_backend.metrics(), **shared_public_cache.metrics()},
+        "rate_limits": {"login": login_limiter.metrics(), "password_reset": password_reset_limiter.metrics()},
+        "cache_bus": cache_bus.metrics() if cache_bus is not None else None
+    }
+
+@admin_router.get("/indexes/check")
+async def admin_check_indexes(admin: dict = Depends(get_admin_user)):
+    return await check_query_plans(db)
+
+@admin_router.get("/jobs")
+async def admin_get_jobs(job: Optional[str] = None, limit: int = Query(50, ge=1, le=500), admin: dict = Depends(get_admin_user)):
+    return {
+        "enabled": SCHEDULER_ENABLED,
+        **scheduler.metrics(),
+        "runs": await scheduler.history(job, limit)
+    }
+
+@admin_router.post("/jobs/{job_name}/run")
+async def admin_run_job(job_name: str, admin: dict = Depends(get_admin_user)):
+    if job_name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Gorev bulunamadi")
+    result = await scheduler.run(job_name, force=True)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Gorev baska bir sunucuda calisiyor")
+    return {"job": job_name, "result": result}
+
+@admin_router.get("/deletions")
+async def admin_get_deletions(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500), admin: dict = Depends(get_admin_user)):
+    return await list_deletions(db, status, limit)
+
+@admin_router.get("/deletions/{job_id}")
+async def admin_get_deletion(job_id: str, admin: dict = Depends(get_admin_user)):
+    job = await get_deletion(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Silme islemi bulunamadi")
+    return job
+
+@admin_router.post("/deletions/{job_id}/retry")
+async def admin_retry_deletion(job_id: str, admin: dict = Depends(get_admin_user)):
+    job = await deletions.retry(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Basarisiz silme islemi bulunamadi")
+    spawn_background(deletions.process(job_id))
+    return {"deletion_job_id": job_id, "status": job["status"]}
+
+@admin_router.get("/event-loop")
+async def admin_get_event_loop(admin: dict = Depends(get_admin_user)):
+    return {"enabled": LOOP_MONITOR_ENABLED, **loop_monitor.metrics()}
+
+@admin_router.get("/database")
+async def admin_get_database(admin: dict = Depends(get_admin_user)):
+    return {
+        "options": MONGO_CLIENT_OPTIONS,
+        "public_read_preference": public_db.read_preference.document,
+        "primary_after_write_seconds": recent_writes.window_seconds,
+        "primary_reads_after_write": recent_writes.primary_reads,
+        "pools": mongo_pool_metrics.snapshot()
     }
 
+@admin_router.get("/stats")
+async def admin_get_stats(refresh: bool = False, admin: dict = Depends(get_admin_user)):
+    if refresh:
+        return await admin_stats_snapshot.refresh(db)
+    return await admin_stats_snapshot.get(db)
+
 @admin_router.post("/users")
 async def admin_create_user(data: AdminUserCreate, admin: dict = Depends(get_admin_user)):
     existing = await db.users.find_one({"email": data.email})
@@ -1228,7 +2170,7 @@ async def admin_create_user(data: AdminUserCreate, admin: dict = Depends(get_adm
     user_doc = {
         "id": user_id,
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await asyncio.to_thread(hash_password, data.password),
         "first_name": data.first_name,
         "last_name": data.last_name,
         "company_name": data.company_name,
@@ -1255,6 +2197,7 @@ async def admin_create_user(data: AdminUserCreate, admin: dict = Depends(get_adm
             "note": "Manuel ekleme (Admin)"
         }
         await db.payments.insert_one(payment_doc)
+    admin_stats_snapshot.invalidate()
     return {"message": "Kullanici basariyla eklendi", "user_id": user_id}
 
 @admin_router.delete("/users/{user_id}")
@@ -1262,12 +2205,11 @@ async def admin_delete_user(user_id: str, admin: dict = Depends(get_admin_user))
     user = await db.users.find_one({"id": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="Kullanici bulunamadi")
-    await db.properties.delete_many({"user_id": user_id})
-    await db.groups.delete_many({"user_id": user_id})
-    await db.visitors.delete_many({"user_id": user_id})
-    await db.payments.delete_many({"user_id": user_id})
-    await db.users.delete_one({"id": user_id})
-    return {"message": "Kullanici ve tum verileri silindi"}
+    job = await deletions.tombstone_user(user_id)
+    await invalidate_cache(f"user:{user_id}", *(f"property:{pid}" for pid in job["property_ids"]))
+    admin_stats_snapshot.invalidate()
+    spawn_background(deletions.process(job["_id"]))
+    return {"message": "Kullanici ve tum verileri silindi", "deletion_job_id": job["_id"]}
 
 @api_router.post("/groups", response_model=GroupResponse)
 async def create_group(group_data: GroupCreate, current_user: dict = Depends(get_current_user)):
@@ -1310,6 +2252,7 @@ async def update_group(group_id: str, group_data: GroupUpdate, current_user: dic
     update_data = {k: v for k, v in group_data.model_dump().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.groups.update_one({"id": group_id}, {"$set": update_data})
+    await invalidate_cache(f"group:{group_id}")
     updated = await db.groups.find_one({"id": group_id})
     updated.pop('_id', None)
     return GroupResponse(**updated)
@@ -1320,6 +2263,7 @@ async def delete_group(group_id: str, current_user: dict = Depends(get_current_u
     if not group:
         raise HTTPException(status_code=404, detail="Grup bulunamadi")
     await db.groups.delete_one({"id": group_id})
+    await invalidate_cache(f"group:{group_id}")
     return {"message": "Grup basariyla silindi"}
 
 @api_router.post("/groups/{group_id}/properties/{property_id}")
@@ -1337,6 +2281,7 @@ async def add_property_to_group(group_id: str, property_id: str, current_user: d
             {"id": group_id},
             {"$set": {"property_ids": property_ids, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
+        await invalidate_cache(f"group:{group_id}")
     return {"message": "Gayrimenkul gruba eklendi"}
 
 @api_router.delete("/groups/{group_id}/properties/{property_id}")
@@ -1351,21 +2296,34 @@ async def remove_property_from_group(group_id: str, property_id: str, current_us
             {"id": group_id},
             {"$set": {"property_ids": property_ids, "updated_at": datetime.now(timezone.utc).isoformat()}}
         )
+        await invalidate_cache(f"group:{group_id}")
     return {"message": "Gayrimenkul gruptan cikarildi"}
 
 @api_router.get("/public/groups/{group_id}")
-async def get_public_group(group_id: str):
-    group = await db.groups.find_one({"id": group_id})
-    if not group:
-        raise HTTPException(status_code=404, detail="Grup bulunamadi")
-    group.pop('_id', None)
-    property_ids = group.get("property_ids", [])
-    cursor = db.properties.find({"id": {"$in": property_ids}})
-    properties = await cursor.to_list(100)
-    return {
-        "group": GroupResponse(**group),
-        "properties": [PropertyResponse(**{k: v for k, v in p.items() if k != '_id'}) for p in properties]
-    }
+async def get_public_group(group_id: str, request: Request):
+    cache_key = f"group:{group_id}"
+    async def build():
+        group = await public_reader(cache_key).groups.find_one({"id": group_id}, {"_id": 0})
+        if not group:
+            raise HTTPException(status_code=404, detail="Grup bulunamadi")
+        property_ids = group.get("property_ids", [])
+        reader = public_reader(cache_key, f"user:{group['user_id']}", *(f"property:{pid}" for pid in property_ids))
+        cursor = reader.properties.find({"id": {"$in": property_ids}}, {"_id": 0})
+        properties = await attach_rooms(reader, await cursor.to_list(100))
+        if FAST_JSON_ENABLED:
+            body = dumps({
+                "group": trusted_dump(GroupResponse, group),
+                "properties": [trusted_dump(PropertyResponse, p) for p in properties]
+            })
+        else:
+            body = dumps({
+                "group": GroupResponse(**group).model_dump(),
+                "properties": [PropertyResponse(**p).model_dump() for p in properties]
+            })
+        tags = [cache_key, f"user:{group['user_id']}"] + [f"property:{pid}" for pid in property_ids]
+        return body, tags
+    payload = await cached_public_payload(cache_key, build)
+    return precompressed_response(payload, request.headers.get("accept-encoding"), COMPRESSION_MIN_SIZE)
 
 @api_router.get("/")
 async def root():
@@ -1375,9 +2333,33 @@ async def root():
 async def health():
     return {"status": "healthy", "database": "MongoDB"}
 
+LOCAL_CLIENTS = ("127.0.0.1", "::1")
+
+async def authorize_metrics(request: Request):
+    """With METRICS_TOKEN set the scraper must send it; without one only local scrapes and admins get in."""
+    scheme, _, credentials = (request.headers.get("authorization") or "").partition(" ")
+    if METRICS_TOKEN:
+        if scheme.lower() != "bearer" or not secrets.compare_digest(credentials.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Gecersiz token")
+        return
+    if request.client and request.client.host in LOCAL_CLIENTS:
+        return
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=401, detail="Metrik erisimi icin yetki gerekli")
+    await get_admin_user(HTTPAuthorizationCredentials(scheme=scheme, credentials=credentials))
+
+@api_router.get("/metrics")
+async def prometheus_metrics(request: Request):
+    await authorize_metrics(request)
+    return Response(METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 app.include_router(api_router)
 app.include_router(admin_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+app.add_middleware(UploadLimitMiddleware, path="/api/imports", max_bytes=IMPORT_MAX_BYTES, detail=IMPORT_TOO_LARGE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1386,6 +2368,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(LoopBlockingMiddleware, monitor=loop_monitor)
+app.add_middleware(PrometheusMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
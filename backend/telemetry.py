@@ -0,0 +1,96 @@
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from room_events import (
+    HEARTBEAT, HOTSPOT_CLICK, ROOM_ENTER, ROOM_LEAVE, build_room_event, timestamp_in_range, validate_room_event
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_BEACON_BYTES = 256 * 1024
+MAX_BEACON_EVENTS = 1000
+ROOM_EVENT_CODES = {"e": ROOM_ENTER, "l": ROOM_LEAVE, "c": HOTSPOT_CLICK}
+
+class BeaconError(ValueError):
+    pass
+
+def parse_beacon(body: bytes) -> Tuple[str, str, list]:
+    if len(body) > MAX_BEACON_BYTES:
+        raise BeaconError("payload_too_large")
+    try:
+        payload = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:
+        raise BeaconError("invalid_json")
+    if not isinstance(payload, dict):
+        raise BeaconError("invalid_payload")
+    property_id, visitor_id, events = payload.get("p"), payload.get("v"), payload.get("e")
+    if not isinstance(property_id, str) or not isinstance(visitor_id, str) or not isinstance(events, list):
+        raise BeaconError("invalid_payload")
+    if len(events) > MAX_BEACON_EVENTS:
+        raise BeaconError("too_many_events")
+    return property_id, visitor_id, events
+
+def _timestamp(value) -> Optional[datetime]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    try:
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+def _non_negative_int(value) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        return None
+    return int(value)
+
+def build_telemetry(property_id: str, visitor_id: str, events: list, room_ids: set, now: datetime) -> Tuple[List[dict], List[dict], List[dict]]:
+    docs, visits, rejected = [], [], []
+    for index, event in enumerate(events):
+        if not isinstance(event, list) or len(event) < 2 or not isinstance(event[0], str):
+            rejected.append({"index": index, "error": "invalid_event"})
+            continue
+        code, ts = event[0], _timestamp(event[1])
+        if ts is None:
+            rejected.append({"index": index, "error": "invalid_timestamp"})
+            continue
+        args = event[2:]
+        if code in ROOM_EVENT_CODES:
+            room_id = args[0] if args else None
+            error = validate_room_event(room_ids, room_id, "enter", ts, now)
+            if not error and code == "c" and (len(args) < 2 or not isinstance(args[1], str) or args[1] not in room_ids):
+                error = "unknown_room"
+            if error:
+                rejected.append({"index": index, "error": error})
+                continue
+            extra = {"t": args[1]} if code == "c" else {}
+            docs.append(build_room_event(property_id, visitor_id, room_id, ROOM_EVENT_CODES[code], ts, **extra))
+        elif code in ("h", "v"):
+            duration = _non_negative_int(args[0]) if args else None
+            if duration is None:
+                rejected.append({"index": index, "error": "invalid_duration"})
+                continue
+            if not timestamp_in_range(ts, now):
+                rejected.append({"index": index, "error": "timestamp_out_of_range"})
+                continue
+            if code == "h":
+                docs.append(build_room_event(property_id, visitor_id, None, HEARTBEAT, ts, d=duration))
+                continue
+            if visits:
+                # each visit adds to the listing's view counters, so a beacon may close only one
+                rejected.append({"index": index, "error": "duplicate_visit"})
+                continue
+            rooms = args[1] if len(args) > 1 and isinstance(args[1], list) else []
+            visits.append({
+                "property_id": property_id,
+                "visitor_id": visitor_id,
+                "duration": duration,
+                "rooms_visited": [r for r in rooms if isinstance(r, str) and r in room_ids],
+                "visited_at": ts.isoformat()
+            })
+        else:
+            rejected.append({"index": index, "error": "unknown_event"})
+    return docs, visits, rejected
@@ -0,0 +1,190 @@
+import asyncio
+import base64
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import httpx
+from pymongo.errors import DuplicateKeyError
+
+MANIFESTS_COLLECTION = "tour_manifests"
+PLACEHOLDER_SIZE = (32, 16)
+PLACEHOLDER_QUALITY = 40
+ASSET_FETCH_CONCURRENCY = 4
+ASSET_FETCH_TIMEOUT = 15.0
+# panoramas are fetched whole for their placeholder; anything larger is skipped rather than held in memory
+ASSET_MAX_BYTES = 40 * 1024 * 1024
+
+def data_uri_size(uri: str) -> int:
+    data = uri.split(',', 1)[1] if ',' in uri else uri
+    return len(data) * 3 // 4 - data[-2:].count('=')
+
+def _data_uri_bytes(uri: str) -> bytes:
+    return base64.b64decode(uri.split(',', 1)[1] if ',' in uri else uri)
+
+def build_adjacency(rooms: List[Dict]) -> Dict[str, List[str]]:
+    room_ids = {room["id"] for room in rooms}
+    adjacency = {}
+    for room in rooms:
+        targets = list(room.get("connections") or [])
+        targets += [h.get("target_room_id") for h in room.get("hotspots") or []]
+        neighbours = []
+        for target in targets:
+            if target in room_ids and target != room["id"] and target not in neighbours:
+                neighbours.append(target)
+        adjacency[room["id"]] = neighbours
+    return adjacency
+
+def prefetch_order(adjacency: Dict[str, List[str]], entry_room_id: Optional[str]) -> List[Dict]:
+    order = []
+    distances = {}
+    if entry_room_id in adjacency:
+        distances[entry_room_id] = 0
+        queue = deque([entry_room_id])
+        while queue:
+            room_id = queue.popleft()
+            order.append({"room_id": room_id, "distance": distances[room_id]})
+            for neighbour in adjacency[room_id]:
+                if neighbour not in distances:
+                    distances[neighbour] = distances[room_id] + 1
+                    queue.append(neighbour)
+    order += [{"room_id": room_id, "distance": None} for room_id in adjacency if room_id not in distances]
+    return order
+
+def make_placeholder(image_bytes: bytes) -> Dict[str, Optional[str]]:
+    try:
+        from PIL import Image
+    except ImportError:
+        logging.warning("PIL not available for tour placeholders")
+        return {"placeholder": None, "color": None}
+    img = Image.open(BytesIO(image_bytes))
+    img.draft('RGB', (PLACEHOLDER_SIZE[0] * 8, PLACEHOLDER_SIZE[1] * 8))
+    img = img.convert('RGB')
+    r, g, b = img.resize((1, 1), Image.BOX).getpixel((0, 0))
+    output = BytesIO()
+    img.resize(PLACEHOLDER_SIZE, Image.BILINEAR).save(output, format='JPEG', quality=PLACEHOLDER_QUALITY)
+    return {
+        "placeholder": f"data:image/jpeg;base64,{base64.b64encode(output.getvalue()).decode()}",
+        "color": f"#{r:02x}{g:02x}{b:02x}"
+    }
+
+class AssetTooLarge(Exception):
+    pass
+
+class AssetResolver:
+    """Sizes and placeholders per media URL, reusing what the previous manifest already knew.
+
+    Only URLs on our own CDN host are fetched; anything else stays unresolved.
+    """
+
+    def __init__(self, known: Optional[Dict[str, Dict]] = None, asset_host: str = ""):
+        self.known = dict(known or {})
+        self.prefix = f"https://{asset_host}/" if asset_host else None
+        self._semaphore = asyncio.Semaphore(ASSET_FETCH_CONCURRENCY)
+
+    def fetchable(self, url: str) -> bool:
+        return self.prefix is not None and url.startswith(self.prefix)
+
+    async def _download(self, client: httpx.AsyncClient, url: str) -> bytes:
+        async with client.stream("GET", url, timeout=ASSET_FETCH_TIMEOUT) as response:
+            response.raise_for_status()
+            if int(response.headers.get("content-length") or 0) > ASSET_MAX_BYTES:
+                raise AssetTooLarge(f"larger than {ASSET_MAX_BYTES} bytes")
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > ASSET_MAX_BYTES:
+                    raise AssetTooLarge(f"larger than {ASSET_MAX_BYTES} bytes")
+            return bytes(body)
+
+    async def resolve(self, client: httpx.AsyncClient, url: str, placeholder: bool) -> Dict:
+        cached = self.known.get(url)
+        if cached is not None and (not placeholder or "placeholder" in cached):
+            return cached
+        info: Dict = {"bytes": None}
+        if not url.startswith("data:") and not self.fetchable(url):
+            return info
+        try:
+            if url.startswith("data:"):
+                info["bytes"] = data_uri_size(url)
+                if placeholder:
+                    info.update(await asyncio.to_thread(make_placeholder, _data_uri_bytes(url)))
+            else:
+                async with self._semaphore:
+                    if placeholder:
+                        content = await self._download(client, url)
+                        info["bytes"] = len(content)
+                        info.update(await asyncio.to_thread(make_placeholder, content))
+                    else:
+                        response = await client.head(url, timeout=ASSET_FETCH_TIMEOUT)
+                        if response.headers.get("content-length"):
+                            info["bytes"] = int(response.headers["content-length"])
+        except Exception as e:
+            logging.warning(f"Tour asset not resolved {url[:80]}: {e}")
+            return info
+        self.known[url] = info
+        return info
+
+def _stored_url(url: str) -> Optional[str]:
+    return None if url.startswith("data:") else url
+
+async def build_manifest(property_doc: Dict, rooms: List[Dict], previous: Optional[Dict] = None,
+                         asset_host: str = "") -> Dict:
+    resolver = AssetResolver((previous or {}).get("assets"), asset_host)
+    adjacency = build_adjacency(rooms)
+    entry_room_id = property_doc.get("entry_room_id")
+    if entry_room_id not in adjacency:
+        entry_room_id = rooms[0]["id"] if rooms else None
+    async with httpx.AsyncClient(follow_redirects=False) as client:
+        async def describe(room: Dict) -> Dict:
+            panorama = room.get("panorama_photo")
+            photos = [p for p in room.get("photos") or [] if p]
+            panorama_info = await resolver.resolve(client, panorama, placeholder=True) if panorama else {}
+            photo_infos = await asyncio.gather(*(resolver.resolve(client, p, placeholder=False) for p in photos))
+            photo_bytes = [info.get("bytes") for info in photo_infos]
+            return {
+                "name": room.get("name"),
+                "floor": room.get("floor", 0),
+                "panorama_url": _stored_url(panorama) if panorama else None,
+                "panorama_bytes": panorama_info.get("bytes"),
+                "photo_urls": [_stored_url(p) for p in photos],
+                "photo_bytes": photo_bytes,
+                "placeholder": panorama_info.get("placeholder"),
+                "color": panorama_info.get("color")
+            }
+        described = await asyncio.gather(*(describe(room) for room in rooms))
+    room_entries = {room["id"]: entry for room, entry in zip(rooms, described)}
+    total_bytes = sum(
+        (entry["panorama_bytes"] or 0) + sum(b or 0 for b in entry["photo_bytes"])
+        for entry in room_entries.values()
+    )
+    return {
+        "_id": property_doc["id"],
+        "property_id": property_doc["id"],
+        "version": property_doc.get("updated_at"),
+        "entry_room_id": entry_room_id,
+        "rooms": room_entries,
+        "adjacency": adjacency,
+        "prefetch": prefetch_order(adjacency, entry_room_id),
+        "total_bytes": total_bytes,
+        "assets": {url: info for url, info in resolver.known.items() if not url.startswith("data:")},
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+def public_manifest(manifest: Dict) -> Dict:
+    return {k: v for k, v in manifest.items() if k not in ("_id", "assets")}
+
+async def refresh_manifest(db, property_doc: Dict, rooms: List[Dict], asset_host: str = "") -> Dict:
+    previous = await db[MANIFESTS_COLLECTION].find_one({"_id": property_doc["id"]}, {"assets": 1})
+    manifest = await build_manifest(property_doc, rooms, previous, asset_host)
+    try:
+        # a slower build from an older listing version must not replace a newer manifest
+        await db[MANIFESTS_COLLECTION].replace_one(
+            {"_id": manifest["_id"], "version": {"$not": {"$gt": manifest["version"]}}}, manifest, upsert=True
+        )
+    except DuplicateKeyError:
+        newer = await db[MANIFESTS_COLLECTION].find_one({"_id": manifest["_id"]})
+        return newer or manifest
+    return manifest
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from rollups import agent_stats_op, day_key, property_stats_op
+from visitor_sketches import add_unique_visitors
+
+class VisitBuffer:
+    def __init__(self, db, max_events: int = 500, flush_interval_ms: int = 1000, max_pending: int = 50000,
+                 publisher: Optional[Callable[[str, str, dict], None]] = None):
+        self.db = db
+        self.publisher = publisher
+        self.max_events = max_events
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._inflight: Set[asyncio.Task] = set()
+        # bulk ops that failed, by collection; retried on the next flush
+        self._retry: List[Tuple[str, list]] = []
+        self._reset()
+        self.accepted = 0
+        self.flushed = 0
+        self.lost = 0
+        self.retried = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.backpressure_waits = 0
+        self.db_operations = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_ms = 0.0
+
+    def _reset(self):
+        self._visits: List[dict] = []
+        self._property_deltas: Dict[str, List[int]] = {}
+        self._visitor_deltas: Dict[str, dict] = {}
+        self._rollup_deltas: Dict[Tuple[str, str], dict] = {}
+        self._sketch_values: Dict[Tuple[str, str, str], set] = {}
+        self._oldest: Optional[float] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._visits)
+
+    @property
+    def retry_pending(self) -> int:
+        return sum(len(ops) for _, ops in self._retry)
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Lets the flush loop finish its current batch, then writes whatever is left."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self.pending or self._retry:
+            self.lost += self.pending + sum(len(ops) for name, ops in self._retry if name == "visits")
+            logging.error(f"Visit buffer stopped with {self.pending} events and {self.retry_pending} retries unwritten")
+
+    async def submit(self, visit_doc: dict):
+        if self.pending >= self.max_pending:
+            self.backpressure_waits += 1
+            await self.flush()
+        self.add(visit_doc)
+
+    def add(self, visit_doc: dict, requeued: bool = False):
+        property_id = visit_doc["property_id"]
+        visitor_id = visit_doc["visitor_id"]
+        duration = visit_doc.get("duration", 0)
+        rooms = visit_doc.get("rooms_visited", [])
+        self._visits.append(visit_doc)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        delta = self._property_deltas.setdefault(property_id, [0, 0])
+        delta[0] += 1
+        delta[1] += duration
+        visitor = self._visitor_deltas.setdefault(visitor_id, {"duration": 0, "rooms": set(), "last_visit": ""})
+        visitor["duration"] += duration
+        visitor["rooms"].update(rooms)
+        visitor["last_visit"] = max(visitor["last_visit"], visit_doc["visited_at"])
+        rollup = self._rollup_deltas.setdefault(
+            (property_id, day_key(visit_doc["visited_at"])),
+            {"views": 0, "duration": 0, "rooms": Counter()}
+        )
+        rollup["views"] += 1
+        rollup["duration"] += duration
+        rollup["rooms"].update(set(rooms))
+        if not requeued:
+            self.accepted += 1
+        if self.pending >= self.max_events:
+            self._wakeup.set()
+
+    def add_unique_visitor(self, sketch_keys: List[Tuple[str, str, str]], visitor_key: str):
+        for sketch_key in sketch_keys:
+            self._sketch_values.setdefault(sketch_key, set()).add(visitor_key)
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._visits and not self._sketch_values and not self._retry:
+                return
+            batch = (self._visits, self._property_deltas, self._visitor_deltas, self._rollup_deltas, self._sketch_values)
+            retry, self._retry = self._retry, []
+            self._reset()
+            # a cancelled caller must not abandon a batch that has already left the buffer
+            task = asyncio.ensure_future(self._flush_batch(batch, retry))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            await asyncio.shield(task)
+
+    async def _flush_batch(self, batch, retry: List[Tuple[str, list]]):
+        visits, property_deltas, visitor_deltas, rollup_deltas, sketch_values = batch
+        started = time.perf_counter()
+        writes = [self._write_sketches(sketch_values)]
+        writes.extend(self._execute(name, ops) for name, ops in retry)
+        if visits:
+            writes.append(self._write(visits, property_deltas, visitor_deltas, rollup_deltas))
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        self.retried += sum(len(ops) for _, ops in retry)
+        self.flushes += 1
+        self.last_flush_at = time.time()
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        if errors:
+            self.failed_flushes += 1
+            logging.error(f"Visit buffer flush failed, {self.retry_pending} operations queued for retry: {errors[0]}")
+
+    async def _write_sketches(self, sketch_values: Dict[Tuple[str, str, str], set]):
+        if not sketch_values:
+            return
+        try:
+            await add_unique_visitors(self.db, sketch_values)
+        except Exception:
+            # sketch updates are idempotent, so the values simply go back into the buffer
+            for sketch_key, values in sketch_values.items():
+                self._sketch_values.setdefault(sketch_key, set()).update(values)
+            raise
+
+    def _requeue(self, visits: List[dict]):
+        room = max(0, self.max_pending - self.pending)
+        for visit in visits[:room]:
+            self.add(visit, requeued=True)
+        if len(visits) > room:
+            self.lost += len(visits) - room
+            logging.error(f"Visit buffer full, {len(visits) - room} events lost")
+
+    def _queue_retry(self, name: str, ops: list):
+        self._retry.append((name, ops))
+        while self.retry_pending > self.max_pending and len(self._retry) > 1:
+            dropped_name, dropped = self._retry.pop(0)
+            if dropped_name == "visits":
+                self.lost += len(dropped)
+            logging.error(f"Visit buffer retry queue full, {len(dropped)} {dropped_name} operations dropped")
+
+    async def _execute(self, name: str, ops: list):
+        """Runs one unordered bulk write and queues whatever did not apply for the next flush.
+
+        Visit inserts keep the _id assigned on the first attempt, so a retried insert
+        that had landed fails as a duplicate and is skipped. A counter update whose
+        outcome is unknown (connection lost mid-write) is retried, which may count it twice.
+        """
+        self.db_operations += 1
+        try:
+            await self.db[name].bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            failed = [ops[error["index"]] for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if failed:
+                self._queue_retry(name, failed)
+                raise
+        except Exception:
+            self._queue_retry(name, ops)
+            raise
+
+    async def _write(self, visits, property_deltas, visitor_deltas, rollup_deltas):
+        owners = {}
+        try:
+            cursor = self.db.properties.find({"id": {"$in": list(property_deltas)}}, {"_id": 0, "id": 1, "user_id": 1})
+            async for doc in cursor:
+                owners[doc["id"]] = doc["user_id"]
+        except Exception:
+            # nothing was written yet, so the events can go back into the buffer as they were
+            self._requeue(visits)
+            raise
+        self.db_operations += 1
+        property_ops = [
+            UpdateOne({"id": pid}, {"$inc": {"view_count": views, "total_view_duration": duration}})
+            for pid, (views, duration) in property_deltas.items() if pid in owners
+        ]
+        visitor_ops = [
+            UpdateOne({"id": vid}, {
+                "$inc": {"total_duration": delta["duration"]},
+                "$addToSet": {"rooms_visited": {"$each": sorted(delta["rooms"])}},
+                "$max": {"last_visit": delta["last_visit"]}
+            })
+            for vid, delta in visitor_deltas.items()
+        ]
+        stats_ops = []
+        agent_deltas: Dict[Tuple[str, str], List[int]] = {}
+        for (pid, day), delta in rollup_deltas.items():
+            user_id = owners.get(pid)
+            if not user_id:
+                continue
+            stats_ops.append(property_stats_op(pid, user_id, day, delta["views"], delta["duration"], delta["rooms"]))
+            agent = agent_deltas.setdefault((user_id, day), [0, 0])
+            agent[0] += delta["views"]
+            agent[1] += delta["duration"]
+        agent_ops = [agent_stats_op(uid, day, views, duration) for (uid, day), (views, duration) in agent_deltas.items()]
+        for visit in visits:
+            visit["user_id"] = owners.get(visit["property_id"])
+        visit_ops = [InsertOne(v) for v in visits]
+        writes = [self._execute("visits", visit_ops)]
+        for name, ops in (
+            ("properties", property_ops),
+            ("visitors", visitor_ops),
+            ("property_daily_stats", stats_ops),
+            ("agent_daily_stats", agent_ops),
+        ):
+            if ops:
+                writes.append(self._execute(name, ops))
+        results = await asyncio.gather(*writes, return_exceptions=True)
+        if not isinstance(results[0], BaseException):
+            self.flushed += len(visits)
+            if self.publisher is not None:
+                for visit in visits:
+                    user_id = owners.get(visit["property_id"])
+                    if user_id:
+                        self.publisher(user_id, "visit", {k: v for k, v in visit.items() if k != "_id"})
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def metrics(self) -> dict:
+        return {
+            "pending": self.pending,
+            "pending_sketches": len(self._sketch_values),
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "flushed": self.flushed,
+            "lost": self.lost,
+            "retry_pending": self.retry_pending,
+            "retried": self.retried,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "backpressure_waits": self.backpressure_waits,
+            "db_operations": self.db_operations,
+            "oldest_pending_age_ms": (time.monotonic() - self._oldest) * 1000 if self._oldest else 0.0,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_ms": self.last_flush_ms
+        }
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson.binary import Binary
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from hll import HyperLogLog
+
+SKETCH_COLLECTION = "visitor_sketches"
+SKETCH_MAX_DAYS = 366
+# keys x sketch documents a single count may merge, after whole months collapse into one document
+SKETCH_MAX_DOCS = 2000
+SKETCH_MAX_ATTEMPTS = 5
+
+def sketch_id(scope: str, key: str, period: str) -> str:
+    return f"{scope}:{key}:{period}"
+
+def month_key(day: str) -> str:
+    return day[:7]
+
+def day_range(start: str, end: str) -> List[str]:
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    if last < first:
+        raise ValueError("end must not be before start")
+    days = (last - first).days + 1
+    if days > SKETCH_MAX_DAYS:
+        raise ValueError(f"range cannot exceed {SKETCH_MAX_DAYS} days")
+    return [(first + timedelta(days=i)).isoformat() for i in range(days)]
+
+def sketch_periods(days: List[str]) -> List[str]:
+    """Covers the days with monthly sketches where a whole month is included, daily ones elsewhere."""
+    by_month: Dict[str, List[str]] = {}
+    for day in days:
+        by_month.setdefault(month_key(day), []).append(day)
+    periods = []
+    for month, month_days in by_month.items():
+        first = date.fromisoformat(month_days[0])
+        next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if len(month_days) == (next_month - first.replace(day=1)).days:
+            periods.append(month)
+        else:
+            periods.extend(month_days)
+    return periods
+
+def pending_sketches(pending: Dict[Tuple[str, str, str], set]) -> Dict[str, Tuple[str, str, str, HyperLogLog]]:
+    """Folds the buffered values into one sketch per daily and monthly document."""
+    sketches: Dict[str, Tuple[str, str, str, HyperLogLog]] = {}
+    for (scope, key, day), values in pending.items():
+        for period in (day, month_key(day)):
+            _id = sketch_id(scope, key, period)
+            if _id not in sketches:
+                sketches[_id] = (scope, key, period, HyperLogLog())
+            sketches[_id][3].update(values)
+    return sketches
+
+def _sketch_write(_id: str, scope: str, key: str, period: str, sketch: HyperLogLog, doc: Optional[dict]) -> Optional[UpdateOne]:
+    """Compare-and-swap of the merged registers, or None if the stored sketch already covers them."""
+    if doc is None:
+        return UpdateOne(
+            {"_id": _id, "version": {"$exists": False}},
+            {
+                "$set": {"registers": Binary(sketch.to_bytes()), "version": 1},
+                "$setOnInsert": {"scope": scope, "key": key, "day": period}
+            },
+            upsert=True
+        )
+    merged = HyperLogLog.from_bytes(doc["registers"])
+    before = merged.to_bytes()
+    if merged.merge(sketch).to_bytes() == before:
+        return None
+    return UpdateOne(
+        {"_id": _id, "version": doc["version"]},
+        {"$set": {"registers": Binary(merged.to_bytes()), "version": doc["version"] + 1}}
+    )
+
+async def add_unique_visitors(db, pending: Dict[Tuple[str, str, str], set]):
+    """Merges buffered values into the stored sketches with one read and one bulk write per round.
+
+    A sketch another writer changed since the read fails its version check and is
+    merged again in the next round.
+    """
+    sketches = pending_sketches(pending)
+    collection = db[SKETCH_COLLECTION]
+    for _ in range(SKETCH_MAX_ATTEMPTS):
+        docs = await collection.find({"_id": {"$in": list(sketches)}}, {"registers": 1, "version": 1}).to_list(None)
+        stored = {doc["_id"]: doc for doc in docs}
+        ops = {}
+        for _id, (scope, key, period, sketch) in sketches.items():
+            op = _sketch_write(_id, scope, key, period, sketch, stored.get(_id))
+            if op is not None:
+                ops[_id] = op
+        if not ops:
+            return
+        try:
+            result = await collection.bulk_write(list(ops.values()), ordered=False)
+            written = result.matched_count + result.upserted_count
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            # a concurrent first write of the same sketch; the next round merges into it
+            written = e.details.get("nMatched", 0) + e.details.get("nUpserted", 0)
+        if written == len(ops):
+            return
+        sketches = {_id: sketches[_id] for _id in ops}
+    raise RuntimeError(f"visitor sketches still contended after {SKETCH_MAX_ATTEMPTS} attempts")
+
+def unique_visitor_keys(property_id: str, user_id: str, day: str) -> List[Tuple[str, str, str]]:
+    return [("property", property_id, day), ("user", user_id, day)]
+
+def _merge_docs(docs: List[dict]) -> HyperLogLog:
+    merged = HyperLogLog()
+    for doc in docs:
+        merged.merge(HyperLogLog.from_bytes(doc["registers"]))
+    return merged
+
+async def merged_sketch(db, scope: str, keys: List[str], days: List[str]) -> HyperLogLog:
+    periods = sketch_periods(days)
+    if len(keys) * len(periods) > SKETCH_MAX_DOCS:
+        raise ValueError(f"too many listings for this range ({len(keys)} x {len(periods)} sketches)")
+    ids = [sketch_id(scope, key, period) for key in keys for period in periods]
+    docs = await db[SKETCH_COLLECTION].find({"_id": {"$in": ids}}, {"registers": 1}).to_list(None)
+    return await asyncio.to_thread(_merge_docs, docs)
+
+async def daily_unique_counts(db, scope: str, key: str, days: Iterable[str]) -> Dict[str, int]:
+    docs = await db[SKETCH_COLLECTION].find(
+        {"_id": {"$in": [sketch_id(scope, key, day) for day in days]}},
+        {"day": 1, "registers": 1}
+    ).to_list(None)
+    return await asyncio.to_thread(lambda: {doc["day"]: _merge_docs([doc]).count() for doc in docs})
+
+async def unique_visitor_count(db, scope: str, keys: List[str], start: str, end: str) -> dict:
+    days = day_range(start, end)
+    sketch = await merged_sketch(db, scope, keys, days)
+    return {
+        "unique_visitors": sketch.count(),
+        "relative_error": round(sketch.relative_error, 4),
+        "start": start,
+        "end": end,
+        "days": len(days)
+    }
@@ -429,6 +429,26 @@ class HomeViewProAPITester:
         # Restore original token
         self.token = original_token
 
+    def test_index_query_plans(self):
+        """Test that no route query falls back to a collection scan"""
+        print("\n🔍 Testing Index Query Plans...")
+        
+        if not hasattr(self, 'admin_token'):
+            self.log_result("Index query plans", False, "No admin token available")
+            return
+            
+        original_token = self.token
+        self.token = self.admin_token
+        
+        success, data, _ = self.make_request('GET', 'admin/indexes/check', expected_status=200)
+        
+        if success and data.get('checked') and not data.get('violations'):
+            self.log_result("Index query plans", True)
+        else:
+            self.log_result("Index query plans", False, str(data.get('violations', data)))
+            
+        self.token = original_token
+
     def test_packages_endpoint(self):
         """Test packages endpoint"""
         print("\n🔍 Testing Packages Endpoint...")
@@ -649,6 +669,7 @@ class HomeViewProAPITester:
         self.test_admin_setup()
         self.test_admin_login()
         self.test_admin_stats()
+        self.test_index_query_plans()
         
         # User registration and authentication
         self.test_user_registration()
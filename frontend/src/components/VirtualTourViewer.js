@@ -86,6 +86,7 @@ export default function VirtualTourViewer({
   property, 
   currentRoomIndex, 
   onRoomChange,
+  onHotspotClick,
   onClose 
 }) {
   const [sunTime, setSunTime] = useState([12]);
@@ -127,6 +128,7 @@ export default function VirtualTourViewer({
             cssClass: 'custom-hotspot',
             clickHandlerFunc: () => {
               const roomIndex = property.rooms.findIndex(r => r.id === hotspot.target_room_id);
+              onHotspotClick?.(currentRoom.id, hotspot.target_room_id);
               if (roomIndex >= 0) {
                 onRoomChange(roomIndex);
               }
@@ -152,6 +154,7 @@ export default function VirtualTourViewer({
             cssClass: 'custom-hotspot',
             clickHandlerFunc: () => {
               const roomIndex = property.rooms.findIndex(r => r.id === connectedRoomId);
+              onHotspotClick?.(currentRoom.id, connectedRoomId);
               if (roomIndex >= 0) {
                 onRoomChange(roomIndex);
               }
@@ -127,6 +127,8 @@ export default function PropertyFormPage() {
     rooms: [],
     entry_room_id: null,
     pois: [],
+    latitude: '',
+    longitude: '',
     cover_image: null
   });
 
@@ -167,6 +169,8 @@ export default function PropertyFormPage() {
         total_floors: property.total_floors.toString(),
         building_age: property.building_age.toString(),
         price: property.price.toString(),
+        latitude: property.coordinates?.latitude?.toString() || '',
+        longitude: property.coordinates?.longitude?.toString() || '',
       });
       setStep(2); // Skip to info step if editing
     } catch (error) {
@@ -377,6 +381,9 @@ export default function PropertyFormPage() {
         total_floors: parseInt(formData.total_floors) || 0,
         building_age: parseInt(formData.building_age) || 0,
         price: parseFloat(formData.price) || 0,
+        coordinates: formData.latitude && formData.longitude
+          ? { latitude: parseFloat(formData.latitude), longitude: parseFloat(formData.longitude) }
+          : null,
       };
 
       if (isEditing) {
@@ -710,6 +717,34 @@ export default function PropertyFormPage() {
                     />
                   </div>
                 </div>
+                <div className="grid grid-cols-2 gap-4">
+                  <div className="space-y-2">
+                    <Label htmlFor="latitude">Enlem</Label>
+                    <Input
+                      id="latitude"
+                      name="latitude"
+                      type="number"
+                      step="any"
+                      placeholder="40.9909"
+                      value={formData.latitude}
+                      onChange={handleChange}
+                      data-testid="latitude-input"
+                    />
+                  </div>
+                  <div className="space-y-2">
+                    <Label htmlFor="longitude">Boylam</Label>
+                    <Input
+                      id="longitude"
+                      name="longitude"
+                      type="number"
+                      step="any"
+                      placeholder="29.0297"
+                      value={formData.longitude}
+                      onChange={handleChange}
+                      data-testid="longitude-input"
+                    />
+                  </div>
+                </div>
               </CardContent>
             </Card>
 
@@ -33,6 +33,7 @@ import { toast } from 'sonner';
 import VirtualTourViewer from '../components/VirtualTourViewer';
 
 const API_URL = `${process.env.REACT_APP_BACKEND_URL}/api`;
+const TELEMETRY_HEARTBEAT_MS = 30000;
 
 const ROOM_NAMES = {
   living_room: 'Salon',
@@ -72,6 +73,11 @@ const DIRECTION_DEGREES = {
   'Kuzeybatı': 315
 };
 
+// Skeleton rooms carry no photos until loaded, so the server sends a cover_fallback instead
+const heroImage = (property) => (
+  property.cover_image || property.cover_fallback || property.rooms?.find((room) => room.photos?.length)?.photos[0]
+);
+
 // Get sun azimuth angle based on time (simplified model for Turkey latitude ~40°)
 // At sunrise (6:00) sun is at East (90°), at noon at South (180°), at sunset (18:00) at West (270°)
 const getSunAzimuth = (hour) => {
@@ -104,6 +110,7 @@ const calculateSunIntensity = (sunAzimuth, facingDirection) => {
 export default function PropertyViewPage() {
   const { id } = useParams();
   const [property, setProperty] = useState(null);
+  const [manifest, setManifest] = useState(null);
   const [loading, setLoading] = useState(true);
   const [showVisitorForm, setShowVisitorForm] = useState(true);
   const [visitor, setVisitor] = useState(null);
@@ -122,6 +129,10 @@ export default function PropertyViewPage() {
   
   const viewStartTime = useRef(null);
   const visitedRooms = useRef([]);
+  const telemetryEvents = useRef([]);
+  const visitTracked = useRef(false);
+  const loadedRooms = useRef({});
+  const warmedPanoramas = useRef({});
 
   useEffect(() => {
     fetchProperty();
@@ -132,8 +143,23 @@ export default function PropertyViewPage() {
   useEffect(() => {
     if (visitor && !viewStartTime.current) {
       viewStartTime.current = Date.now();
+      const room = property?.rooms?.[currentRoomIndex];
+      if (room) {
+        telemetryEvents.current.push(['e', viewStartTime.current, room.id]);
+      }
     }
+    const handlePageHide = () => trackVisit();
+    window.addEventListener('pagehide', handlePageHide);
+    // Heartbeats record dwell time even when pagehide never fires (crashed tab, killed app)
+    let lastHeartbeat = Date.now();
+    const heartbeat = visitor ? setInterval(() => {
+      const now = Date.now();
+      sendTelemetry([['h', now, Math.round((now - lastHeartbeat) / 1000)]]);
+      lastHeartbeat = now;
+    }, TELEMETRY_HEARTBEAT_MS) : null;
     return () => {
+      window.removeEventListener('pagehide', handlePageHide);
+      if (heartbeat) clearInterval(heartbeat);
       if (visitor && viewStartTime.current) {
         trackVisit();
       }
@@ -147,12 +173,51 @@ export default function PropertyViewPage() {
         setCurrentRoomIndex(entryIndex);
       }
     }
-  }, [property]);
+  }, [property?.id]);
+
+  // Rooms arrive as a skeleton; photos and panoramas load per room, neighbours first
+  useEffect(() => {
+    const room = property?.rooms?.[currentRoomIndex];
+    if (!room) return;
+    loadRoom(room.id);
+    const neighbours = manifest?.adjacency?.[room.id]
+      || [...(room.connections || []), ...(room.hotspots || []).map(h => h.target_room_id)];
+    neighbours.forEach((roomId) => {
+      loadRoom(roomId);
+      warmPanorama(roomId);
+    });
+  }, [property?.id, currentRoomIndex, manifest]);
+
+  const warmPanorama = (roomId) => {
+    const url = manifest?.rooms?.[roomId]?.panorama_url;
+    if (!url || warmedPanoramas.current[url]) return;
+    warmedPanoramas.current[url] = true;
+    const img = new Image();
+    img.src = url;
+  };
+
+  const loadRoom = async (roomId) => {
+    if (!roomId || loadedRooms.current[roomId]) return;
+    loadedRooms.current[roomId] = true;
+    try {
+      const response = await axios.get(`${API_URL}/properties/${id}/rooms/${roomId}`);
+      setProperty(prev => prev && {
+        ...prev,
+        rooms: prev.rooms.map(r => (r.id === roomId ? { ...r, ...response.data } : r))
+      });
+    } catch (error) {
+      loadedRooms.current[roomId] = false;
+    }
+  };
 
   const fetchProperty = async () => {
     try {
-      const response = await axios.get(`${API_URL}/properties/${id}`);
+      loadedRooms.current = {};
+      const response = await axios.get(`${API_URL}/properties/${id}`, { params: { rooms: 'skeleton' } });
       setProperty(response.data);
+      axios.get(`${API_URL}/properties/${id}/manifest`)
+        .then(res => setManifest(res.data))
+        .catch(() => setManifest(null));
     } catch (error) {
       toast.error('Gayrimenkul bulunamadı');
     } finally {
@@ -183,9 +248,29 @@ export default function PropertyViewPage() {
     }
   };
 
+  // One sendBeacon carries the pending room events plus the given ones, and survives tab close
+  const sendTelemetry = (events) => {
+    if (!visitor || !navigator.sendBeacon) return false;
+    const payload = JSON.stringify({ p: id, v: visitor.id, e: [...telemetryEvents.current, ...events] });
+    if (!navigator.sendBeacon(`${API_URL}/telemetry/batch`, payload)) return false;
+    telemetryEvents.current = [];
+    return true;
+  };
+
+  const handleHotspotClick = (fromRoomId, targetRoomId) => {
+    if (visitor && fromRoomId && targetRoomId) {
+      telemetryEvents.current.push(['c', Date.now(), fromRoomId, targetRoomId]);
+    }
+  };
+
   const trackVisit = async () => {
-    if (!visitor || !viewStartTime.current) return;
+    if (!visitor || !viewStartTime.current || visitTracked.current) return;
+    visitTracked.current = true;
     const duration = Math.round((Date.now() - viewStartTime.current) / 1000);
+    if (sendTelemetry([['v', Date.now(), duration, visitedRooms.current]])) {
+      return;
+    }
+    telemetryEvents.current = [];
     try {
       await axios.post(`${API_URL}/visits`, {
         property_id: id,
@@ -291,9 +376,17 @@ export default function PropertyViewPage() {
   const handleRoomChange = (index) => {
     setIsTransitioning(true);
     setTimeout(() => {
+      const previousRoom = property.rooms[currentRoomIndex];
       setCurrentRoomIndex(index);
       setCurrentPhotoIndex(0);
       const room = property.rooms[index];
+      if (visitor && room && previousRoom?.id !== room.id) {
+        const now = Date.now();
+        if (previousRoom) {
+          telemetryEvents.current.push(['l', now, previousRoom.id]);
+        }
+        telemetryEvents.current.push(['e', now, room.id]);
+      }
       if (room && !visitedRooms.current.includes(room.id)) {
         visitedRooms.current.push(room.id);
       }
@@ -483,9 +576,9 @@ export default function PropertyViewPage() {
       <div className="min-h-screen bg-gradient-to-br from-emerald-950 to-emerald-900 flex items-center justify-center p-4">
         <div className="w-full max-w-lg">
           <Card className="bg-white/10 backdrop-blur border-white/20 overflow-hidden mb-6">
-            {(property.cover_image || property.rooms?.[0]?.photos?.[0]) && (
+            {heroImage(property) && (
               <img 
-                src={property.cover_image || property.rooms[0].photos[0]} 
+                src={heroImage(property)} 
                 alt={property.title} 
                 className="w-full h-48 object-cover"
               />
@@ -726,6 +819,7 @@ export default function PropertyViewPage() {
                 property={property}
                 currentRoomIndex={currentRoomIndex}
                 onRoomChange={handleRoomChange}
+                onHotspotClick={handleHotspotClick}
               />
             ) : hasPhotos ? (
               <div className="relative w-full h-full overflow-hidden bg-black">
@@ -841,7 +935,7 @@ export default function PropertyViewPage() {
                           {roomSunlight.isLit && (
                             <Sun className="w-3 h-3 text-yellow-300" />
                           )}
-                          {room.panorama_photo && <span className="text-blue-300 text-xs">360°</span>}
+                          {(room.panorama_photo || room.has_panorama) && <span className="text-blue-300 text-xs">360°</span>}
                         </button>
                       );
                     })}
@@ -935,9 +1029,9 @@ export default function PropertyViewPage() {
       {viewMode === 'info' && (
         <div className="p-4 pb-24 overflow-auto" style={{ maxHeight: 'calc(100vh - 56px)' }}>
           <div className="relative h-48 rounded-xl overflow-hidden mb-6">
-            {(property.cover_image || property.rooms?.[0]?.photos?.[0]) ? (
+            {heroImage(property) ? (
               <img 
-                src={property.cover_image || property.rooms[0].photos[0]} 
+                src={heroImage(property)} 
                 alt={property.title}
                 className="w-full h-full object-cover"
               />
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+JSON serileştirme mikro-benchmark - mekan360
+
+Pydantic doğrulaması + varsayılan JSON encoder ile güvenilir (DB kaynaklı)
+doküman serileştirmesini (trusted_dump + orjson) 20 odalı mülkler üzerinde karşılaştırır.
+"""
+import os
+import sys
+import json
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from fastapi.encoders import jsonable_encoder
+from server import PropertyResponse
+from serialization import dumps, trusted_dump, orjson
+
+PROPERTY_COUNT = 50
+ROOM_COUNT = 20
+REPEAT = 5
+
+def make_room(index, room_ids):
+    room_id = room_ids[index]
+    return {
+        "id": room_id,
+        "name": f"Oda {index + 1}",
+        "room_type": "bedroom" if index % 3 else "living_room",
+        "position_x": (index % 5) * 120,
+        "position_y": (index // 5) * 90,
+        "floor": index // 10,
+        "square_meters": 12.5 + index,
+        "facing_direction": "Güney",
+        "photos": [f"https://cdn.mekan360.com.tr/properties/x/rooms/{room_id}/photo_{i}.jpg" for i in range(4)],
+        "panorama_photo": f"https://cdn.mekan360.com.tr/properties/x/rooms/{room_id}/panorama.jpg",
+        "connections": [room_ids[(index + 1) % ROOM_COUNT], room_ids[(index - 1) % ROOM_COUNT]],
+        "hotspots": [
+            {"target_room_id": room_ids[(index + k) % ROOM_COUNT], "yaw": 45.0 * k, "pitch": -10, "label": f"Gecis {k}"}
+            for k in range(1, 4)
+        ]
+    }
+
+def make_property():
+    property_id = str(uuid.uuid4())
+    room_ids = [str(uuid.uuid4()) for _ in range(ROOM_COUNT)]
+    return {
+        "id": property_id,
+        "user_id": str(uuid.uuid4()),
+        "company_name": "Test Emlak Ltd.",
+        "title": "Deniz manzarali villa",
+        "description": "Genis bahceli, havuzlu mustakil villa. " * 10,
+        "address": "Bagdat Caddesi No: 1",
+        "city": "Istanbul",
+        "district": "Kadikoy",
+        "square_meters": 420.0,
+        "room_count": "6+2",
+        "property_type": "villa",
+        "floor": 0,
+        "total_floors": 3,
+        "building_age": 4,
+        "heating_type": "Yerden isitma",
+        "facing_direction": "Guney",
+        "price": 42500000.0,
+        "currency": "TRY",
+        "view_type": "360",
+        "rooms": [make_room(i, room_ids) for i in range(ROOM_COUNT)],
+        "entry_room_id": room_ids[0],
+        "pois": [{"type": "school", "name": "Okul", "distance": "500m"}],
+        "cover_image": f"https://cdn.mekan360.com.tr/properties/{property_id}/cover.jpg",
+        "view_count": 1234,
+        "total_view_duration": 98765,
+        "created_at": "2026-01-01T10:00:00+00:00",
+        "updated_at": "2026-01-02T10:00:00+00:00",
+        "share_link": f"/view/{property_id}"
+    }
+
+def validated_path(docs):
+    models = [PropertyResponse(**d) for d in docs]
+    return json.dumps(jsonable_encoder(models), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def trusted_path(docs):
+    return dumps([trusted_dump(PropertyResponse, d) for d in docs])
+
+def main():
+    docs = [make_property() for _ in range(PROPERTY_COUNT)]
+    assert json.loads(validated_path(docs)) == json.loads(trusted_path(docs))
+    print(f"{PROPERTY_COUNT} mulk x {ROOM_COUNT} oda, orjson: {'var' if orjson else 'yok'}")
+    results = {}
+    for name, fn in (("pydantic + json", validated_path), ("trusted + orjson", trusted_path)):
+        best = min(timeit.repeat(lambda: fn(docs), number=1, repeat=REPEAT))
+        results[name] = best
+        print(f"{name:>18}: {best * 1000:8.2f} ms")
+    print(f"{'hizlanma':>18}: {results['pydantic + json'] / results['trusted + orjson']:8.2f}x")
+
+if __name__ == "__main__":
+    main()
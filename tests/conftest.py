@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# backend modules import each other as top-level modules, the way uvicorn runs them
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,103 @@
+import asyncio
+
+import admin_stats
+from admin_stats import AdminStatsSnapshot
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    async def to_list(self, length):
+        self.db.calls += 1
+        count = self.db.user_count
+        if self.db.gate is not None:
+            await self.db.gate.wait()
+        return [{"users": [{"total": count, "active": count}], "packages": [], "signups": [],
+                 "payments": [], "revenue": []}]
+
+class FakeCollection:
+    def __init__(self, db):
+        self.db = db
+
+    def aggregate(self, pipeline):
+        return FakeCursor(self.db)
+
+    async def estimated_document_count(self):
+        return 0
+
+class FakeDB:
+    def __init__(self, user_count=1):
+        self.user_count = user_count
+        self.calls = 0
+        self.gate = None
+        self.users = FakeCollection(self)
+        self.properties = FakeCollection(self)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_get_caches_until_ttl():
+    db = FakeDB()
+    snapshot = AdminStatsSnapshot(["free"], ttl_seconds=300)
+
+    async def scenario():
+        first = await snapshot.get(db)
+        second = await snapshot.get(db)
+        return first, second
+
+    first, second = run(scenario())
+    assert first is second
+    assert db.calls == 1
+    assert first["package_distribution"] == {"free": 0}
+
+def test_invalidate_forces_recompute():
+    db = FakeDB(user_count=1)
+    snapshot = AdminStatsSnapshot(["free"], ttl_seconds=300)
+
+    async def scenario():
+        await snapshot.get(db)
+        db.user_count = 2
+        snapshot.invalidate()
+        return await snapshot.get(db)
+
+    assert run(scenario())["total_users"] == 2
+    assert db.calls == 2
+
+def test_refresh_in_flight_during_invalidate_is_not_published():
+    db = FakeDB(user_count=1)
+    snapshot = AdminStatsSnapshot(["free"], ttl_seconds=300)
+
+    async def scenario():
+        db.gate = asyncio.Event()
+        in_flight = asyncio.create_task(snapshot.refresh(db))
+        while db.calls == 0:
+            await asyncio.sleep(0)
+        snapshot.invalidate()
+        db.user_count = 2
+        db.gate.set()
+        stale = await in_flight
+        fresh = await snapshot.get(db)
+        return stale, fresh
+
+    stale, fresh = run(scenario())
+    assert stale["total_users"] == 1
+    assert fresh["total_users"] == 2
+    assert db.calls == 2
+
+def test_refresh_ignores_ttl():
+    db = FakeDB()
+    snapshot = AdminStatsSnapshot(["free"], ttl_seconds=300)
+
+    async def scenario():
+        await snapshot.get(db)
+        await snapshot.refresh(db)
+
+    run(scenario())
+    assert db.calls == 2
+
+def test_counts_map_onto_package_names():
+    db = FakeDB(user_count=3)
+    stats = run(admin_stats.compute_admin_stats(db, ["free", "pro"]))
+    assert stats["total_users"] == 3
+    assert stats["active_users"] == 3
+    assert stats["package_distribution"] == {"free": 0, "pro": 0}
@@ -0,0 +1,266 @@
+import asyncio
+import fnmatch
+import time
+
+from cache_backend import (
+    RELEASE_LOCK_SCRIPT, MemoryBackend, RateLimiter, RedisBackend, RedisError, SharedCache, _encode_command,
+    _read_reply
+)
+
+class FakeRedis:
+    """Just enough of a RESP2 server for the commands RedisBackend sends."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/0"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _alive(self, key):
+        if key in self.expires and self.expires[key] < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                command = await _read_reply(reader)
+                writer.write(self._reply(self._execute(command[0].decode().upper(), command[1:])))
+                await writer.drain()
+        except Exception:
+            writer.close()
+
+    def _execute(self, name, args):
+        if name == "GET":
+            return self.data[args[0]] if self._alive(args[0]) else None
+        if name == "SET":
+            key, value, options = args[0], args[1], [a.decode().upper() for a in args[2:]]
+            if "NX" in options and self._alive(key):
+                return None
+            self.data[key] = value
+            self.expires.pop(key, None)
+            if "PX" in options:
+                self.expires[key] = time.monotonic() + int(args[2 + options.index("PX") + 1]) / 1000
+            return "OK"
+        if name == "INCR":
+            value = int(self.data[args[0]]) + 1 if self._alive(args[0]) else 1
+            self.data[args[0]] = str(value).encode()
+            return value
+        if name == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if name == "SADD":
+            self.data.setdefault(args[0], set()).update(args[1:])
+            return len(args) - 1
+        if name == "SMEMBERS":
+            return sorted(self.data.get(args[0], set()))
+        if name == "EXPIRE":
+            return 1
+        if name == "SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            return [b"0", sorted(key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key.decode(), pattern))]
+        if name == "EVAL" and args[0].decode() == RELEASE_LOCK_SCRIPT:
+            key, token = args[2], args[3]
+            if self._alive(key) and self.data[key] == token:
+                del self.data[key]
+                return 1
+            return 0
+        return RedisError(f"ERR unknown command '{name}'")
+
+    def _reply(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, RedisError):
+            return b"-%s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._reply(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def with_redis(test):
+    fake = FakeRedis()
+    backend = RedisBackend(await fake.start(), prefix="t:")
+    try:
+        return await test(backend, fake)
+    finally:
+        await backend.close()
+        await fake.stop()
+
+def parse(data: bytes):
+    async def go():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await _read_reply(reader)
+    return run(go())
+
+def test_encode_command():
+    assert _encode_command(("SET", "k", b"v\r\n", 1500)) == b"*4\r\n$3\r\nSET\r\n$1\r\nk\r\n$3\r\nv\r\n\r\n$4\r\n1500\r\n"
+
+def test_read_reply_types():
+    assert parse(b"+OK\r\n") == "OK"
+    assert parse(b":42\r\n") == 42
+    assert parse(b"$5\r\nhe\r\nl\r\n") == b"he\r\nl"
+    assert parse(b"$-1\r\n") is None
+    assert parse(b"*2\r\n$1\r\na\r\n:1\r\n") == [b"a", 1]
+    assert parse(b"*-1\r\n") is None
+    error = parse(b"-ERR boom\r\n")
+    assert isinstance(error, RedisError) and str(error) == "ERR boom"
+
+def test_redis_get_set_and_tags():
+    async def test(backend, fake):
+        await backend.set("a", b"1", 60, tags=["property:x"])
+        await backend.set("b", b"2", 60, tags=["property:x"])
+        assert await backend.get("a") == b"1"
+        assert await backend.invalidate_tags("property:x") == 2
+        assert await backend.get("b") is None
+        assert backend.metrics()["hits"] == 1
+    run(with_redis(test))
+
+def test_redis_locks_are_compare_and_delete():
+    async def test(backend, fake):
+        assert await backend.acquire_lock("l", "one", 10)
+        assert not await backend.acquire_lock("l", "two", 10)
+        assert not await backend.release_lock("l", "two")
+        assert await backend.release_lock("l", "one")
+        assert await backend.acquire_lock("l", "two", 10)
+    run(with_redis(test))
+
+def test_redis_errors_degrade_to_defaults():
+    async def test():
+        backend = RedisBackend("redis://127.0.0.1:1/0", timeout=0.5)
+        assert await backend.get("a") is None
+        assert await backend.acquire_lock("l", "t", 1)
+        assert backend.errors == 2
+    run(test())
+
+def test_rate_limiter_allow():
+    async def test(backend, fake):
+        limiter = RateLimiter(backend, "login", 2, 60)
+        assert [await limiter.allow("k") for _ in range(3)] == [True, True, False]
+        assert limiter.rejected == 1
+    run(with_redis(test))
+
+def test_rate_limiter_counts_only_failures():
+    async def test():
+        limiter = RateLimiter(MemoryBackend(), "login", 2, 60)
+        for _ in range(5):
+            assert not await limiter.blocked("1.2.3.4:a@b.c")
+        await limiter.record_failure("1.2.3.4:a@b.c")
+        await limiter.record_failure("1.2.3.4:a@b.c")
+        assert await limiter.blocked("1.2.3.4:a@b.c")
+        assert not await limiter.blocked("5.6.7.8:a@b.c")
+    run(test())
+
+def test_shared_cache_single_flight_over_redis():
+    async def test(backend, fake):
+        cache = SharedCache(backend, "public", 60)
+        gate = asyncio.Event()
+        async def build():
+            await gate.wait()
+            return b"body", ["property:x"]
+        callers = [asyncio.create_task(cache.get_or_build("k", build)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        gate.set()
+        results = await asyncio.gather(*callers)
+        assert results == [(b"body", ["property:x"])] * 5
+        assert cache.builds == 1
+        assert cache.coalesced == 4
+    run(with_redis(test))
+
+def test_shared_cache_with_memory_backend_keeps_no_copy():
+    async def test():
+        backend = MemoryBackend()
+        cache = SharedCache(backend, "public", 60)
+        gate = asyncio.Event()
+        async def build():
+            await gate.wait()
+            return b"body", []
+        callers = [asyncio.create_task(cache.get_or_build("k", build)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(*callers) == [(b"body", [])] * 3
+        assert cache.builds == 1
+        assert backend.metrics()["entries"] == 0
+    run(test())
+
+def test_memory_backend_prunes_tags_on_eviction_and_expiry():
+    async def test():
+        backend = MemoryBackend(max_entries=2)
+        await backend.set("a", b"1", 60, tags=["t1"])
+        await backend.set("b", b"2", 60, tags=["t1", "t2"])
+        await backend.set("c", b"3", 60, tags=["t3"])
+        assert backend._tags == {"t1": {"b"}, "t2": {"b"}, "t3": {"c"}}
+        assert await backend.invalidate_tags("t1") == 1
+        assert backend._tags == {"t3": {"c"}}
+        await backend.set("d", b"4", -1, tags=["t4"])
+        assert await backend.get("d") is None
+        assert "t4" not in backend._tags
+        await backend.delete("c")
+        assert backend._tags == {} and backend._key_tags == {}
+    run(test())
+
+def test_memory_backend_incr_window():
+    async def test():
+        backend = MemoryBackend()
+        assert [await backend.incr("n", 60) for _ in range(3)] == [1, 2, 3]
+        assert await backend.counter("n") == 3
+        assert await backend.counter("missing") == 0
+    run(test())
+
+def test_local_flights_do_not_cross_generations():
+    async def test():
+        cache = SharedCache(MemoryBackend(), "public", 60)
+        gate = asyncio.Event()
+        bodies = iter([b"old", b"new"])
+        async def build():
+            body = next(bodies)
+            await gate.wait()
+            return body, []
+        first = asyncio.create_task(cache.get_or_build("k", build, generation=1))
+        second = asyncio.create_task(cache.get_or_build("k", build, generation=2))
+        await asyncio.sleep(0)
+        gate.set()
+        assert await asyncio.gather(first, second) == [(b"old", []), (b"new", [])]
+        assert cache.builds == 2
+    run(test())
+
+def test_redis_clear_keeps_counters_and_locks():
+    async def test(backend, fake):
+        await backend.set("public:a", b"1", 60, tags=["property:x"])
+        await backend.set("principal:u1", b"2", 60)
+        await backend.incr("login:k", 60)
+        assert await backend.acquire_lock("l", "one", 10)
+        await backend.clear()
+        assert await backend.get("public:a") is None
+        assert await backend.get("principal:u1") is None
+        assert sorted(fake.data) == [b"t:l", b"t:login:k"]
+        assert await backend.counter("login:k") == 1
+        assert await backend.release_lock("l", "one")
+    run(with_redis(test))
+
+def test_memory_clear_keeps_counters_and_locks():
+    async def test():
+        backend = MemoryBackend()
+        await backend.set("a", b"1", 60, tags=["t"])
+        await backend.incr("n", 60)
+        assert await backend.acquire_lock("l", "one", 10)
+        await backend.clear()
+        assert await backend.get("a") is None and backend._tags == {}
+        assert await backend.counter("n") == 1
+        assert await backend.release_lock("l", "one")
+    run(test())
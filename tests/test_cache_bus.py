@@ -0,0 +1,21 @@
+from cache_bus import INVALIDATIONS_COLLECTION, change_pipeline, change_tags
+
+def event(collection, operation="update", after=None, before=None, key="k"):
+    return {"ns": {"coll": collection}, "operationType": operation, "documentKey": {"_id": key},
+            "fullDocument": after, "fullDocumentBeforeChange": before}
+
+def test_listing_and_owner_tags():
+    assert change_tags(event("properties", after={"id": "p1", "user_id": "u1"})) == ["property:p1", "user:u1"]
+    assert change_tags(event("tour_manifests", key="p1")) == ["property:p1"]
+    assert change_tags(event("properties", "delete")) is None
+
+def test_rooms_and_pois_tag_their_listing():
+    assert change_tags(event("rooms", "insert", after={"id": "r1", "property_id": "p1"})) == ["property:p1"]
+    assert change_tags(event("pois", "delete", before={"property_id": "p2"})) == ["property:p2"]
+    assert change_tags(event("pois", "delete")) == []
+
+def test_published_invalidations_are_followed():
+    assert change_tags(event(INVALIDATIONS_COLLECTION, "insert", after={"tags": ["user:u1"]})) == ["user:u1"]
+    assert change_tags(event(INVALIDATIONS_COLLECTION, "insert", after={"tags": None})) is None
+    watched = change_pipeline()[0]["$match"]["ns.coll"]["$in"]
+    assert {"rooms", "pois", INVALIDATIONS_COLLECTION} <= set(watched)
@@ -0,0 +1,34 @@
+import gzip
+
+import compression
+from compression import choose_encoding, compress_bytes, is_compressible, parse_accept_encoding
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding(None) == {}
+    assert parse_accept_encoding("gzip, br;q=0.5, *;q=0, ,x;q=bad") == {"gzip": 1.0, "br": 0.5, "*": 0.0, "x": 0.0}
+    assert parse_accept_encoding("GZIP ; q=0.8") == {"gzip": 0.8}
+
+def test_choose_encoding_prefers_highest_q(monkeypatch):
+    monkeypatch.setattr(compression, "supported_encodings", lambda: ("br", "gzip"))
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("gzip, br;q=0.5") == "gzip"
+    assert choose_encoding("*") == "br"
+    assert choose_encoding("*;q=0, gzip") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding(None) is None
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "supported_encodings", lambda: ("gzip",))
+    assert choose_encoding("br") is None
+    assert choose_encoding("br, gzip;q=0.1") == "gzip"
+
+def test_is_compressible():
+    assert is_compressible("application/json; charset=utf-8")
+    assert is_compressible("text/html")
+    assert not is_compressible("text/event-stream")
+    assert not is_compressible("image/jpeg")
+    assert not is_compressible(None)
+
+def test_compress_bytes_gzip_round_trip():
+    body = b'{"a": 1}' * 200
+    assert gzip.decompress(compress_bytes(body, "gzip")) == body
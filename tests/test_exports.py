@@ -0,0 +1,13 @@
+from exports import _csv_value
+
+def test_csv_value_guards_formulas():
+    for value in ("=1+1", "+90 555", "-2", "@SUM(A1)", "\tx", "\rx"):
+        assert _csv_value(value) == "'" + value
+    assert _csv_value(["=cmd", "b"]) == "'=cmd;b"
+    assert _csv_value("Ayse") == "Ayse"
+    assert _csv_value(-2) == -2
+
+def test_csv_value_flattens_empty_and_nested():
+    assert _csv_value(None) == ""
+    assert _csv_value(["a", 1]) == "a;1"
+    assert _csv_value({"a": 1}) == '{"a":1}'
@@ -0,0 +1,17 @@
+from geo import geo_point, parse_distance_m
+
+def test_parse_distance_m_units():
+    assert parse_distance_m("2,5 km") == 2500
+    assert parse_distance_m("1.2km") == 1200
+    assert parse_distance_m("500 metre yürüme") == 500
+    assert parse_distance_m("750 mt") == 750
+    assert parse_distance_m(" 300 ") == 300
+    assert parse_distance_m(450) == 450.0
+
+def test_parse_distance_m_rejects_non_distances():
+    for text in ("5 dk", "3 mins", "yakın", "", None, "km 5"):
+        assert parse_distance_m(text) is None
+
+def test_geo_point_is_longitude_first():
+    assert geo_point({"latitude": 41.0, "longitude": 29.0}) == {"type": "Point", "coordinates": [29.0, 41.0]}
+    assert geo_point(None) is None
@@ -0,0 +1,106 @@
+import asyncio
+
+from pymongo.results import BulkWriteResult
+
+from hll import HyperLogLog
+from visitor_sketches import SKETCH_COLLECTION, add_unique_visitors, sketch_periods, unique_visitor_count
+
+def test_estimate_within_error():
+    for n in (10, 1000, 50000):
+        sketch = HyperLogLog()
+        sketch.update(f"visitor-{i}" for i in range(n))
+        assert abs(sketch.count() - n) <= max(2, 3 * sketch.relative_error * n)
+
+def test_merge_is_union():
+    a, b = HyperLogLog(), HyperLogLog()
+    a.update(f"v{i}" for i in range(0, 3000))
+    b.update(f"v{i}" for i in range(2000, 5000))
+    union = HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+    both = HyperLogLog()
+    both.update(f"v{i}" for i in range(5000))
+    assert union.registers == both.registers
+    assert not both.add("v1")
+
+def test_sketch_periods_use_whole_months():
+    days = [f"2024-02-{d:02d}" for d in range(1, 30)] + ["2024-03-01"]
+    assert sketch_periods(days) == ["2024-02", "2024-03-01"]
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+class FakeSketches:
+    """Applies the version-guarded updates add_unique_visitors sends."""
+
+    def __init__(self):
+        self.docs = {}
+        self.rounds = 0
+        self.interfere = None
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(self.docs[_id]) for _id in query["_id"]["$in"] if _id in self.docs])
+
+    async def bulk_write(self, ops, ordered=True):
+        self.rounds += 1
+        if self.interfere is not None:
+            self.interfere(self.docs)
+            self.interfere = None
+        matched, upserted = 0, {}
+        for index, op in enumerate(ops):
+            query, update = op._filter, op._doc
+            doc = self.docs.get(query["_id"])
+            version = query["version"]
+            if doc is None:
+                if op._upsert:
+                    self.docs[query["_id"]] = {"_id": query["_id"], **update["$setOnInsert"], **update["$set"]}
+                    upserted[index] = query["_id"]
+                continue
+            if version == {"$exists": False} and "version" not in doc or doc.get("version") == version:
+                doc.update(update["$set"])
+                matched += 1
+        return BulkWriteResult({"nMatched": matched, "nUpserted": len(upserted), "upserted": [
+            {"index": i, "_id": _id} for i, _id in upserted.items()
+        ]}, True)
+
+class FakeDB:
+    def __init__(self):
+        self.sketches = FakeSketches()
+
+    def __getitem__(self, name):
+        assert name == SKETCH_COLLECTION
+        return self.sketches
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_add_unique_visitors_merges_daily_and_monthly():
+    async def test():
+        db = FakeDB()
+        await add_unique_visitors(db, {("property", "p1", "2024-05-01"): {"a", "b"}})
+        await add_unique_visitors(db, {("property", "p1", "2024-05-02"): {"b", "c"}})
+        assert set(db.sketches.docs) == {"property:p1:2024-05-01", "property:p1:2024-05-02", "property:p1:2024-05"}
+        assert db.sketches.docs["property:p1:2024-05"]["version"] == 2
+        result = await unique_visitor_count(db, "property", ["p1"], "2024-05-01", "2024-05-31")
+        assert result["unique_visitors"] == 3
+        rounds = db.sketches.rounds
+        await add_unique_visitors(db, {("property", "p1", "2024-05-01"): {"a"}})
+        assert db.sketches.rounds == rounds
+    run(test())
+
+def test_add_unique_visitors_retries_lost_compare_and_swap():
+    async def test():
+        db = FakeDB()
+        await add_unique_visitors(db, {("property", "p1", "2024-05-01"): {"a"}})
+        def concurrent(docs):
+            other = HyperLogLog.from_bytes(docs["property:p1:2024-05"]["registers"])
+            other.add("z")
+            docs["property:p1:2024-05"].update(registers=other.to_bytes(), version=2)
+        db.sketches.interfere = concurrent
+        await add_unique_visitors(db, {("property", "p1", "2024-05-01"): {"b"}})
+        assert db.sketches.rounds == 3
+        month = HyperLogLog.from_bytes(db.sketches.docs["property:p1:2024-05"]["registers"])
+        assert month.count() == 3
+    run(test())
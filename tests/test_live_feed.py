@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from cache_backend import MemoryBackend
+
+@pytest.fixture
+def principals(monkeypatch):
+    async def load_principal(user_id):
+        return {"id": user_id}
+    monkeypatch.setattr(server, "load_principal", load_principal)
+    monkeypatch.setattr(server, "cache_backend", MemoryBackend())
+
+def run(coro):
+    return asyncio.run(coro)
+
+def rejected(coro) -> str:
+    with pytest.raises(HTTPException) as e:
+        run(coro)
+    assert e.value.status_code == 401
+    return e.value.detail
+
+def test_ticket_is_redeemed_once(principals):
+    ticket = server.create_stream_ticket("u1")
+    assert run(server.redeem_stream_ticket(ticket)) == {"id": "u1"}
+    assert rejected(server.redeem_stream_ticket(ticket)) == "Bilet zaten kullanildi"
+
+def test_session_token_is_not_a_ticket(principals):
+    assert rejected(server.redeem_stream_ticket(server.create_token("u1"))) == "Gecersiz bilet"
+
+def test_ticket_is_not_a_session_token(principals):
+    rejected(server.resolve_user(server.create_stream_ticket("u1")))
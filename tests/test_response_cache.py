@@ -0,0 +1,23 @@
+from response_cache import ResponseCache
+
+def test_set_refuses_body_built_across_invalidation():
+    cache = ResponseCache()
+    generation = cache.generation
+    cache.invalidate_tags("property:a")
+    payload = cache.set("k", b"old", tags=["property:a"], generation=generation)
+    assert payload.body == b"old"
+    assert cache.get("k") is None
+    assert cache.stats()["stale_builds"] == 1
+    cache.set("other", b"fresh", tags=["property:b"], generation=generation)
+    assert cache.get("other").body == b"fresh"
+
+def test_clear_and_evicted_marks_fail_closed():
+    cache = ResponseCache(max_entries=1)
+    generation = cache.generation
+    for tag in ("t1", "t2", "t3", "t4", "t5"):
+        cache.invalidate_tags(tag)
+    assert cache.is_stale(["t1"], generation)
+    generation = cache.generation
+    cache.clear()
+    assert cache.is_stale([], generation)
+    assert not cache.is_stale([], cache.generation)
@@ -0,0 +1,55 @@
+import pytest
+
+from search import SearchError, decode_cursor, encode_cursor, keyset_filter
+
+def test_cursor_round_trip():
+    for value in ("2024-05-01T10:00:00+00:00", 1500000, 85.5, None):
+        assert decode_cursor(encode_cursor(value, "p1")) == (value, "p1")
+
+def test_decode_cursor_rejects_garbage():
+    for cursor in ("!!!", encode_cursor("x", "p1")[:-3], "WzEsIDJd"):
+        with pytest.raises(SearchError):
+            decode_cursor(cursor)
+
+def test_keyset_filter_shapes():
+    assert keyset_filter("price", 1, None) is None
+    assert keyset_filter("price", 1, encode_cursor(100, "p1")) == {
+        "$or": [{"price": {"$gt": 100}}, {"price": 100, "id": {"$gt": "p1"}}]
+    }
+    assert keyset_filter("price", 1, encode_cursor(None, "p1")) == {
+        "$or": [{"price": {"$ne": None}}, {"price": None, "id": {"$gt": "p1"}}]
+    }
+
+def matches(doc, query):
+    """The subset of MongoDB matching keyset_filter produces; null and missing compare equal."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == "$ne" and value == operand:
+                return False
+            if op in ("$gt", "$lt") and (value is None or (value > operand if op == "$gt" else value < operand) is False):
+                return False
+    return True
+
+@pytest.mark.parametrize("direction", [1, -1])
+def test_pages_cover_listings_without_a_price(direction):
+    docs = [{"id": f"p{i}", "price": price} for i, price in enumerate([300, None, 100, None, 200, 100])]
+    docs.append({"id": "p9"})
+    ordered = sorted(docs, key=lambda d: (d.get("price") is not None, d.get("price") or 0, d["id"]), reverse=direction == -1)
+    seen, cursor = [], None
+    while True:
+        keyset = keyset_filter("price", direction, cursor)
+        page = [d for d in ordered if keyset is None or matches(d, keyset)][:2]
+        seen += page
+        if len(page) < 2:
+            break
+        cursor = encode_cursor(page[-1].get("price"), page[-1]["id"])
+    assert seen == ordered
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from room_events import HEARTBEAT, HOTSPOT_CLICK, ROOM_ENTER
+from telemetry import MAX_BEACON_BYTES, MAX_BEACON_EVENTS, BeaconError, build_telemetry, parse_beacon
+
+NOW = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+def ms(moment: datetime) -> int:
+    return int(moment.timestamp() * 1000)
+
+def beacon_error(body: bytes) -> str:
+    with pytest.raises(BeaconError) as e:
+        parse_beacon(body)
+    return str(e.value)
+
+def test_parse_beacon():
+    assert parse_beacon(b'{"p": "p1", "v": "v1", "e": [["e", 1, "r1"]]}') == ("p1", "v1", [["e", 1, "r1"]])
+    assert beacon_error(b"{") == "invalid_json"
+    assert beacon_error(b"[]") == "invalid_payload"
+    assert beacon_error(b'{"p": "p1", "v": 2, "e": []}') == "invalid_payload"
+    assert beacon_error(b" " * (MAX_BEACON_BYTES + 1)) == "payload_too_large"
+    events = ",".join(["[]"] * (MAX_BEACON_EVENTS + 1))
+    assert beacon_error(b'{"p": "p1", "v": "v1", "e": [%s]}' % events.encode()) == "too_many_events"
+
+def test_build_telemetry_accepts_room_events_and_one_visit():
+    now = ms(NOW)
+    events = [
+        ["e", now, "r1"],
+        ["c", now, "r1", "r2"],
+        ["h", now, 15000],
+        ["v", now, 42, ["r1", "x", 3]],
+        ["v", now, 10],
+    ]
+    docs, visits, rejected = build_telemetry("p1", "v1", events, {"r1", "r2"}, NOW)
+    assert [doc["k"] for doc in docs] == [ROOM_ENTER, HOTSPOT_CLICK, HEARTBEAT]
+    assert docs[1]["t"] == "r2" and docs[2]["d"] == 15000
+    assert visits == [{"property_id": "p1", "visitor_id": "v1", "duration": 42, "rooms_visited": ["r1"],
+                       "visited_at": NOW.isoformat()}]
+    assert rejected == [{"index": 4, "error": "duplicate_visit"}]
+
+def test_build_telemetry_rejects_per_event():
+    now = ms(NOW)
+    events = [
+        "e",
+        ["e", "yesterday", "r1"],
+        ["e", now, "nope"],
+        ["c", now, "r1", "nope"],
+        ["h", now, -1],
+        ["v", ms(NOW - timedelta(days=3)), 5],
+        ["z", now],
+        ["v", True, 5],
+    ]
+    docs, visits, rejected = build_telemetry("p1", "v1", events, {"r1"}, NOW)
+    assert docs == [] and visits == []
+    assert [r["error"] for r in rejected] == [
+        "invalid_event", "invalid_timestamp", "unknown_room", "unknown_room", "invalid_duration",
+        "timestamp_out_of_range", "unknown_event", "invalid_timestamp"
+    ]
@@ -0,0 +1,31 @@
+from tour_manifest import build_adjacency, prefetch_order
+
+ROOMS = [
+    {"id": "salon", "connections": ["mutfak", "salon", "yok"], "hotspots": [{"target_room_id": "balkon"}]},
+    {"id": "mutfak", "hotspots": [{"target_room_id": "salon"}, {"target_room_id": "kiler"}, {}]},
+    {"id": "balkon", "connections": None},
+    {"id": "kiler", "connections": ["mutfak", "mutfak"]},
+    {"id": "depo"},
+]
+
+def test_build_adjacency_dedupes_and_drops_unknown_targets():
+    assert build_adjacency(ROOMS) == {
+        "salon": ["mutfak", "balkon"],
+        "mutfak": ["salon", "kiler"],
+        "balkon": [],
+        "kiler": ["mutfak"],
+        "depo": [],
+    }
+
+def test_prefetch_order_is_breadth_first_from_entry():
+    assert prefetch_order(build_adjacency(ROOMS), "salon") == [
+        {"room_id": "salon", "distance": 0},
+        {"room_id": "mutfak", "distance": 1},
+        {"room_id": "balkon", "distance": 1},
+        {"room_id": "kiler", "distance": 2},
+        {"room_id": "depo", "distance": None},
+    ]
+
+def test_prefetch_order_without_entry_keeps_room_order():
+    assert [r["distance"] for r in prefetch_order(build_adjacency(ROOMS), "missing")] == [None] * 5
+    assert prefetch_order({}, None) == []
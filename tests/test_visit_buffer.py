@@ -0,0 +1,91 @@
+import asyncio
+
+from visit_buffer import VisitBuffer
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def find(self, query, projection=None):
+        return FakeCursor([{"id": pid, "user_id": "u1"} for pid in query["id"]["$in"]])
+
+    async def bulk_write(self, ops, ordered=True):
+        if self.name in self.db.failing:
+            self.db.failing.discard(self.name)
+            raise ConnectionError("baglanti koptu")
+        self.db.writes.setdefault(self.name, []).append(ops)
+
+class FakeDB:
+    def __init__(self):
+        self.writes = {}
+        self.failing = set()
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+    def __getattr__(self, name):
+        return FakeCollection(self, name)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def visit(visit_id, property_id="p1", visitor_id="v1", duration=10):
+    return {"id": visit_id, "property_id": property_id, "visitor_id": visitor_id, "duration": duration,
+            "rooms_visited": ["r1"], "visited_at": "2024-05-01T10:00:00+00:00"}
+
+def test_flush_coalesces_counters():
+    async def test():
+        db = FakeDB()
+        buffer = VisitBuffer(db)
+        for i in range(3):
+            buffer.add(visit(f"x{i}"))
+        buffer.add(visit("y", property_id="p2", visitor_id="v2", duration=5))
+        await buffer.flush()
+        assert len(db.writes["visits"][0]) == 4
+        properties = db.writes["properties"][0]
+        assert len(properties) == 2
+        assert properties[0]._doc == {"$inc": {"view_count": 3, "total_view_duration": 30}}
+        assert len(db.writes["visitors"][0]) == 2
+        assert len(db.writes["property_daily_stats"][0]) == 2
+        assert len(db.writes["agent_daily_stats"][0]) == 1
+        assert buffer.flushed == 4 and buffer.pending == 0
+    run(test())
+
+def test_failed_bulk_write_is_retried_on_next_flush():
+    async def test():
+        db = FakeDB()
+        db.failing.add("properties")
+        buffer = VisitBuffer(db)
+        buffer.add(visit("x"))
+        await buffer.flush()
+        assert buffer.failed_flushes == 1
+        assert buffer.retry_pending == 1
+        assert "properties" not in db.writes
+        await buffer.flush()
+        assert len(db.writes["properties"]) == 1
+        assert len(db.writes["visits"]) == 1
+        assert buffer.retried == 1 and buffer.retry_pending == 0 and buffer.lost == 0
+    run(test())
+
+def test_stop_writes_what_is_left():
+    async def test():
+        db = FakeDB()
+        buffer = VisitBuffer(db, flush_interval_ms=60000)
+        buffer.start()
+        await buffer.submit(visit("x"))
+        await buffer.stop()
+        assert len(db.writes["visits"][0]) == 1
+        assert buffer.lost == 0
+    run(test())